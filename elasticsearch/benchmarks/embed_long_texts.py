@@ -0,0 +1,115 @@
+"""
+This script benchmarks the embedding of long texts.
+
+It compares len_safe_get_embedding, which makes one embeddings request per chunk of each
+text, with len_safe_get_embeddings, which sends the chunks of all the texts in as few
+requests as the API limits allow and averages them with NumPy. By default the requests
+go to a simulated client with a fixed latency per request, so that the benchmark runs
+offline; pass --openai to call the API.
+
+Usage, from the `elasticsearch` directory:
+    python -m benchmarks.embed_long_texts --texts 200 --latency 0.3
+    python -m benchmarks.embed_long_texts --grants data/grants.xml --texts 100 --max-tokens 512
+    python -m benchmarks.embed_long_texts --grants data/grants.xml --texts 20 --openai
+"""
+
+import argparse
+import os
+import time
+import types
+import numpy as np
+from dotenv import load_dotenv
+from utils import data_utils, embed_utils
+
+# Load environment variables from the .env file
+load_dotenv()
+
+OPENAI_KEY = os.getenv('OPENAI_KEY')
+
+
+class SimulatedClient:
+    """Stands in for the OpenAI client: deterministic random embeddings, a fixed latency per request"""
+
+    def __init__(self, latency, dims=256):
+        self.latency = latency
+        self.dims = dims
+        self.requests = 0
+        self.embeddings = self
+
+    def _embed(self, tokens):
+        return np.random.default_rng(sum(tokens)).normal(size=self.dims).tolist()
+
+    def create(self, input, model):
+        self.requests += 1
+        time.sleep(self.latency)
+        inputs = input if input and isinstance(input[0], list) else [input]
+        return types.SimpleNamespace(data=[types.SimpleNamespace(index=i, embedding=self._embed(tokens))
+                                           for i, tokens in enumerate(inputs)])
+
+
+class CountingClient:
+    """Wraps the OpenAI client to count embeddings requests"""
+
+    def __init__(self, client):
+        self.client = client
+        self.requests = 0
+        self.embeddings = self
+
+    def create(self, **kwargs):
+        self.requests += 1
+        return self.client.embeddings.create(**kwargs)
+
+
+def load_texts(path, count, words):
+    """Grant descriptions from a grants XML extract, or synthetic texts of the given length in words"""
+    if path:
+        texts = []
+        for grant in data_utils.iter_grants(path):
+            texts.append(' '.join(str(grant.get(field) or '') for field in ['title', 'description', 'eligibility', 'submission_info']))
+            if len(texts) >= count:
+                break
+        return texts
+    vocabulary = ['research', 'funding', 'opportunity', 'applicants', 'eligible', 'program', 'health',
+                  'science', 'education', 'community', 'development', 'award', 'innovation', 'data']
+    return [f'Grant {i}: ' + ' '.join(vocabulary[(i * 7 + j) % len(vocabulary)] for j in range(words)) for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark per-chunk and batched embedding of long texts.')
+    parser.add_argument('--grants', default='', help='grants XML extract to take texts from (default: synthetic texts)')
+    parser.add_argument('--texts', type=int, default=200, help='number of texts (default: 200)')
+    parser.add_argument('--words', type=int, default=3000, help='length of synthetic texts in words (default: 3000)')
+    parser.add_argument('--max-tokens', type=int, default=embed_utils.EMBEDDING_CTX_LENGTH,
+                        help=f'chunk length in tokens (default: {embed_utils.EMBEDDING_CTX_LENGTH})')
+    parser.add_argument('--latency', type=float, default=0.3, help='seconds per request of the simulated client (default: 0.3)')
+    parser.add_argument('--openai', action='store_true', help='call the OpenAI API instead of the simulated client')
+    parser.add_argument('--model', default=embed_utils.EMBEDDING_MODEL, help=f'embedding model (default: {embed_utils.EMBEDDING_MODEL})')
+    args = parser.parse_args()
+
+    def make_client():
+        if args.openai:
+            from openai import OpenAI
+            return CountingClient(OpenAI(api_key=OPENAI_KEY))
+        return SimulatedClient(args.latency)
+
+    texts = load_texts(args.grants, args.texts, args.words)
+    embed_utils.get_encoding(embed_utils.EMBEDDING_ENCODING)
+    print(f"{len(texts)} texts, chunks of {args.max_tokens} tokens, {'OpenAI' if args.openai else f'simulated client, {args.latency}s per request'}")
+
+    client = make_client()
+    start = time.perf_counter()
+    before = [embed_utils.len_safe_get_embedding(text, client, model=args.model, max_tokens=args.max_tokens) for text in texts]
+    elapsed = time.perf_counter() - start
+    print(f"{'per chunk':<10} {elapsed:8.2f} s   {len(texts) / elapsed:8.2f} texts/s   {client.requests} requests")
+
+    client = make_client()
+    start = time.perf_counter()
+    after = embed_utils.len_safe_get_embeddings(texts, client, model=args.model, max_tokens=args.max_tokens)
+    elapsed = time.perf_counter() - start
+    print(f"{'batched':<10} {elapsed:8.2f} s   {len(texts) / elapsed:8.2f} texts/s   {client.requests} requests")
+
+    print(f"max difference between the embeddings = {np.abs(np.array(before) - after).max():.2e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+This script compares the recall and latency of kNN search on float and quantized vectors.
+
+Copies of a float index are built with each quantized index type (int8_hnsw, int4_hnsw,
+bbq_hnsw) by reindexing, so the grants are not embedded again. The queries of
+data/queries.txt are embedded once, and their exact top k (a brute-force script_score
+over the float vectors) is the ground truth. Each index is then searched with kNN,
+oversampling the candidates and rescoring them with the float vectors, and the recall@k
+and latency are reported along with the memory of each vector in the HNSW graph.
+
+Usage, from the `elasticsearch` directory:
+    python -m benchmarks.quantized_knn --index semantic_index --mappings semantic
+    python -m benchmarks.quantized_knn --index distill_index --mappings distill --types int8_hnsw,bbq_hnsw --oversample 1,2,4
+    python -m benchmarks.quantized_knn --index semantic_index --rescore native --embedding-store data/embedding_store
+"""
+
+import argparse
+import importlib
+import math
+import os
+import statistics
+import time
+from dotenv import load_dotenv
+from elasticsearch import Elasticsearch
+from utils import embed_utils, index_utils
+from utils.embedding_store import EmbeddingStore
+
+# Load environment variables from the .env file
+load_dotenv()
+
+ELASTICSEARCH_URL = os.getenv('ELASTICSEARCH_URL')
+ELASTIC_USERNAME = os.getenv('ELASTIC_USERNAME')
+ELASTIC_PASSWORD = os.getenv('ELASTIC_PASSWORD')
+OPENAI_KEY = os.getenv('OPENAI_KEY')
+
+# bytes per vector held in memory for the HNSW search, as documented for dense_vector
+VECTOR_BYTES = {
+    'hnsw': lambda dims: 4 * dims,
+    'int8_hnsw': lambda dims: dims + 4,
+    'int4_hnsw': lambda dims: dims // 2 + 4,
+    'bbq_hnsw': lambda dims: dims // 8 + 14,
+}
+
+
+def load_queries(path):
+    with open(path) as f:
+        return [line.strip().strip('"') for line in f if line.strip()]
+
+
+def exact_top_k(client, index_name, field, query_vector, k):
+    """Ids of the k nearest documents by brute force"""
+    query = {"script_score": {"query": {"match_all": {}},
+                              "script": {"source": f"cosineSimilarity(params.query_vector, '{field}') + 1.0",
+                                         "params": {"query_vector": query_vector}}}}
+    res = client.search(index=index_name, query=query, size=k, source=False)
+    return [hit['_id'] for hit in res['hits']['hits']]
+
+
+def knn_search_args(field, query_vector, k, num_candidates, oversample, rescore):
+    """kNN search of the top k, oversampling the candidates and rescoring them with the float vectors"""
+    window = math.ceil(k * oversample)
+    knn = {"field": field, "query_vector": query_vector, "num_candidates": max(num_candidates, window)}
+    args = {"query": {"knn": knn}, "size": k, "source": False}
+    if oversample > 1 and rescore == 'native':
+        knn["rescore_vector"] = {"oversample": oversample}
+    elif oversample > 1 and rescore == 'script':
+        args["rescore"] = {"window_size": window,
+                           "query": {"rescore_query": {"script_score": {
+                                         "query": {"match_all": {}},
+                                         "script": {"source": f"(cosineSimilarity(params.query_vector, '{field}') + 1.0) / 2.0",
+                                                    "params": {"query_vector": query_vector}}}},
+                                     "query_weight": 0.0, "rescore_query_weight": 1.0}}
+    return args
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare kNN recall and latency on float and quantized vectors.')
+    parser.add_argument('--index', default='semantic_index', help='index with float vectors (default: semantic_index)')
+    parser.add_argument('--mappings', default='semantic', choices=['semantic', 'distill'], help='mappings of the index (default: semantic)')
+    parser.add_argument('--field', default='embeddings', help='dense_vector field (default: embeddings)')
+    parser.add_argument('--types', default='int8_hnsw,int4_hnsw,bbq_hnsw', help='quantized index types to compare (default: int8_hnsw,int4_hnsw,bbq_hnsw)')
+    parser.add_argument('--rebuild', action='store_true', help='rebuild the quantized copies even if they exist')
+    parser.add_argument('--queries', default='data/queries.txt', help='one query per line (default: data/queries.txt)')
+    parser.add_argument('--k', type=int, default=10, help='hits per query (default: 10)')
+    parser.add_argument('--num-candidates', type=int, default=50, help='kNN candidates per shard (default: 50)')
+    parser.add_argument('--oversample', default='1,2,3', help='oversampling factors to compare (default: 1,2,3)')
+    parser.add_argument('--rescore', choices=['script', 'native'], default='script',
+                        help="rescoring of oversampled candidates: 'script' or 'native' (Elasticsearch 8.18+) (default: script)")
+    parser.add_argument('--embedding-model', default='text-embedding-3-large', help='model the index was embedded with (default: text-embedding-3-large)')
+    parser.add_argument('--embedding-store', default='', help='embedding store, so the queries are embedded only once across runs')
+    args = parser.parse_args()
+
+    from openai import OpenAI
+    ESclient = Elasticsearch(ELASTICSEARCH_URL, basic_auth=(ELASTIC_USERNAME, ELASTIC_PASSWORD), request_timeout=600)
+    mappings = importlib.import_module(f'{args.mappings}.mappings').mappings
+    dims = mappings['properties'][args.field]['dims']
+
+    queries = load_queries(args.queries)
+    store = EmbeddingStore(args.embedding_store) if args.embedding_store else None
+    vectors = embed_utils.embed_texts(queries, OpenAI(api_key=OPENAI_KEY), model=args.embedding_model, store=store).tolist()
+    truth = [exact_top_k(ESclient, args.index, args.field, vector, args.k) for vector in vectors]
+
+    indices = {'hnsw': args.index}
+    for index_type in args.types.split(','):
+        name = f"{args.index}_{index_type}"
+        if args.rebuild and ESclient.indices.exists(index=name):
+            index_utils.delete_index(ESclient, name)
+        if not ESclient.indices.exists(index=name):
+            index_utils.copy_index(ESclient, args.index, name, mappings, vector_index_type=index_type)
+            # one segment per index, so the graphs searched are comparable
+            ESclient.indices.forcemerge(index=name, max_num_segments=1, request_timeout=3600)
+        indices[index_type] = name
+
+    print(f"{len(queries)} queries, k = {args.k}, num_candidates = {args.num_candidates}, {args.rescore} rescoring")
+    print(f"{'index type':<10} {'bytes/vector':>12} {'oversample':>10} {'recall':>7} {'mean ms':>8} {'p50 ms':>7} {'p95 ms':>7} {'took ms':>8}")
+    for index_type, name in indices.items():
+        for oversample in [float(x) for x in args.oversample.split(',')]:
+            if index_type == 'hnsw' and oversample > 1:
+                continue
+            recalls, latencies, took = [], [], []
+            for vector, expected in zip(vectors, truth):
+                search_args = knn_search_args(args.field, vector, args.k, args.num_candidates, oversample, args.rescore)
+                start = time.perf_counter()
+                res = ESclient.search(index=name, **search_args)
+                latencies.append(1000 * (time.perf_counter() - start))
+                took.append(res['took'])
+                ids = {hit['_id'] for hit in res['hits']['hits']}
+                recalls.append(len(ids & set(expected)) / max(1, len(expected)))
+            print(f"{index_type:<10} {VECTOR_BYTES[index_type](dims):>12} {oversample:>10g} {statistics.mean(recalls):>7.3f} "
+                  f"{statistics.mean(latencies):>8.1f} {percentile(latencies, 0.5):>7.1f} {percentile(latencies, 0.95):>7.1f} {statistics.mean(took):>8.1f}")
+
+    if store is not None:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -91,5 +91,17 @@ mappings = {"properties":
         # field to store normalized summaries of grant data
         "normalized_info":
             {"type": "text"},
-        }   
+
+        # field to store the query-independent grant summary shown in snippets, see summarize.py
+        "grant_summary":
+            {"type": "text", "index": False},
+
+        # hash of the normalized_info the grant summary was generated from, see summarize.py
+        "grant_summary_hash":
+            {"type": "keyword"},
+
+        # hash of the grant content, used by sync.py to find changed grants
+        "content_hash":
+            {"type": "keyword"},
+        }
 }
@@ -0,0 +1,141 @@
+"""
+Batch stage that generates the normalized grant summaries (`normalized_info`) and writes them to the index.
+
+This is the scripted version of normalize.ipynb. Summaries are generated with a bounded
+number of concurrent LLM calls under a requests-per-minute limit, and each one is
+recorded in a local checkpoint as soon as it is ready. Completed summaries are written
+back with bulk partial updates. An interrupted run resumes from the checkpoint, and
+grants whose content hash has not changed since their summary was generated are skipped,
+so rerunning on a new extract only summarizes new and modified grants. Grants whose indexed
+document lost its `normalized_info`, e.g. because sync.py indexed it again, get their
+checkpointed summary written back without a new LLM call.
+
+Run from the `elasticsearch` directory once the grants are indexed:
+    python -m distill.normalize --grants data/grants.xml --index distill_index
+    python -m distill.normalize --grants data/grants.xml --concurrency 16 --rpm 2000
+"""
+
+import argparse
+import os
+import re
+from typing import Dict, List, Set
+from dotenv import load_dotenv
+from elasticsearch import Elasticsearch, helpers
+from openai import OpenAI
+from tenacity import retry, stop_after_attempt, wait_random_exponential
+from utils import data_utils
+from utils.checkpoint_utils import Checkpoint, content_hash
+from utils.llm_utils import run_concurrent
+
+# Load environment variables from the .env file
+load_dotenv()
+
+ELASTICSEARCH_URL = os.getenv('ELASTICSEARCH_URL')
+ELASTIC_USERNAME = os.getenv('ELASTIC_USERNAME')
+ELASTIC_PASSWORD = os.getenv('ELASTIC_PASSWORD')
+OPENAI_KEY = os.getenv('OPENAI_KEY')
+
+
+def get_prompt(grant: Dict) -> List[Dict[str, str]]:
+    """Build the prompt for the structured summary of a grant"""
+    return [
+        {
+            "role": "system",
+            "content": "You are a highly skilled summarizer specialized in grants. You are provided with detailed information about a grant and your task is to create a structured summary according to a specified format. The summary must be accurate and informative, following the given structure precisely."
+        },
+        {
+            "role": "user",
+            "content": f"Based on the provided grant information, generate a structured summary with the following fields:\n\n1. Title: [The name or title of the grant.](Limit: 10 words)\n2. Amount: [The funding details, including the minimum and maximum amounts, if specified.](Limit: 40 words)\n3. Deadline: [The submission deadline(s) for the grant application.](Limit: 15 words)\n4. Description: [A very detailed overview of the grant's purpose and objectives. This should be comprehensive and informative.](Limit: 200 words)\n5. Eligibility: [The detailed criteria for applicants to be eligible for the grant, including any specific requirements.](Limit: 50 words)\n6. Sponsor: [The organization or entity sponsoring the grant.](Limit: 20 words)\n7. Categories: [The areas or fields the grant supports.](Limit: 20 words)\n7. Activity: [The EXACT activity/activities the grant funds. This should be comprehensive and accurate](Limit: 70 words)\n\nEnsure that the description and eligibility sections are detailed and comprehensive. Reply in JSON format while following word limits.\nHere is the information for the grant:\n[{grant}]"
+        }
+    ]
+
+
+@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6))
+def generate_normalized_info(client: OpenAI, grant: Dict, model: str) -> str:
+    """Generate the structured summary of a grant, keeping only the JSON object of the reply"""
+    completion = client.chat.completions.create(
+        model=model,
+        messages=get_prompt(grant),
+        temperature=0.5)
+    resp = completion.choices[0].message.content
+    match = re.search(r'\{.*\}', resp, re.DOTALL)
+    if match is None:
+        raise ValueError("Reply does not contain a JSON summary")
+    return match.group(0)
+
+
+def get_ids_without_normalized_info(client: Elasticsearch, index_name: str) -> Set[str]:
+    """Get the ids of the indexed grants that have no normalized_info"""
+    query = {"query": {"bool": {"must_not": {"exists": {"field": "normalized_info"}}}}, "_source": False}
+    return {doc['_id'] for doc in helpers.scan(client, index=index_name, query=query, size=1000)}
+
+
+def write_summaries(client: Elasticsearch, checkpoint: Checkpoint, ids: List[str], index_name: str) -> int:
+    """Write the checkpointed summaries of the given grants with bulk partial updates, returning the number written"""
+    actions = [{"_op_type": "update", "_index": index_name, "_id": id,
+                "doc": {"normalized_info": checkpoint.get(id)['summary']}} for id in ids]
+    success, errors = helpers.bulk(client, actions, raise_on_error=False)
+    failed = set()
+    for error in errors:
+        print(f"Failed to update document {error}")
+        failed.add(error['update']['_id'])
+    for id in ids:
+        if id not in failed:
+            checkpoint.update(id, written=checkpoint.get(id)['hash'])
+    return success
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate normalized grant summaries and write them to the index.')
+    parser.add_argument('--grants', default='data/grants.xml', help='grants XML extract (default: data/grants.xml)')
+    parser.add_argument('--index', default='distill_index', help='index to update (default: distill_index)')
+    parser.add_argument('--model', default='gpt-4o', help='OpenAI model (default: gpt-4o)')
+    parser.add_argument('--concurrency', type=int, default=8, help='LLM calls in flight (default: 8)')
+    parser.add_argument('--rpm', type=float, default=500, help='maximum LLM requests per minute, 0 for no limit (default: 500)')
+    parser.add_argument('--batch-size', type=int, default=100, help='summaries written per bulk request (default: 100)')
+    parser.add_argument('--checkpoint', default='distill/normalize_checkpoint.jsonl', help='progress file (default: distill/normalize_checkpoint.jsonl)')
+    args = parser.parse_args()
+
+    ESclient = Elasticsearch(ELASTICSEARCH_URL, basic_auth=(ELASTIC_USERNAME, ELASTIC_PASSWORD), request_timeout=60)
+    OAIclient = OpenAI(api_key=OPENAI_KEY)
+    checkpoint = Checkpoint(args.checkpoint)
+
+    # grants summarized by an earlier run but not written to the index, or whose summary was since removed from it
+    unwritten = []
+    without_summary = get_ids_without_normalized_info(ESclient, args.index)
+
+    def to_summarize():
+        # streams the extract, so that only the grants being summarized are held in memory
+        for grant in data_utils.iter_grants(args.grants):
+            h = content_hash(grant)
+            record = checkpoint.get(grant['@id'])
+            if record is None or record.get('hash') != h or 'summary' not in record:
+                yield grant, h
+            elif record.get('written') != h or str(grant['@id']) in without_summary:
+                unwritten.append(grant['@id'])
+
+    done, failed, written, ready = 0, 0, 0, []
+    results = run_concurrent(lambda item: generate_normalized_info(OAIclient, item[0], args.model), to_summarize(),
+                             max_workers=args.concurrency, requests_per_minute=args.rpm)
+    for (grant, h), summary, error in results:
+        if error is not None:
+            print(f"Failed to summarize grant {grant['@id']}: {error}")
+            failed += 1
+            continue
+        checkpoint.update(grant['@id'], hash=h, summary=summary)
+        ready.append(grant['@id'])
+        done += 1
+        if len(ready) >= args.batch_size:
+            written += write_summaries(ESclient, checkpoint, ready, args.index)
+            ready = []
+            print(f"Summarized {done} grants, {failed} failed, {written} written")
+
+    ready += unwritten
+    for n in range(0, len(ready), args.batch_size):
+        written += write_summaries(ESclient, checkpoint, ready[n:n + args.batch_size], args.index)
+    checkpoint.close()
+    print(f"Summarized {done} grants, {failed} failed, {written} written")
+
+
+if __name__ == '__main__':
+    main()
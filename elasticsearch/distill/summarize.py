@@ -0,0 +1,119 @@
+"""
+Offline stage that stores a query-independent summary of each grant in the index.
+
+The "Grant Summary" half of a search snippet does not depend on the query, so it is
+generated once per grant here, from the normalized grant information, and written
+to the `grant_summary` field together with the hash of the `normalized_info` it was
+generated from. A grant is summarized again only when that hash no longer matches, for
+instance after normalize.py rewrote its information. The search app then only asks
+the LLM for the query match judgement and score of each result.
+
+Run from the `elasticsearch` directory after the index has `normalized_info`:
+    python -m distill.summarize --index distill_index
+    python -m distill.summarize --index distill_index --overwrite --model gpt-4o-mini
+"""
+
+import argparse
+import os
+from typing import Dict, Iterator, List
+from dotenv import load_dotenv
+from elasticsearch import Elasticsearch, helpers
+from openai import OpenAI
+from tenacity import retry, stop_after_attempt, wait_random_exponential
+from utils import embed_utils
+from utils.checkpoint_utils import content_hash
+from utils.llm_utils import run_concurrent
+
+# Load environment variables from the .env file
+load_dotenv()
+
+ELASTICSEARCH_URL = os.getenv('ELASTICSEARCH_URL')
+ELASTIC_USERNAME = os.getenv('ELASTIC_USERNAME')
+ELASTIC_PASSWORD = os.getenv('ELASTIC_PASSWORD')
+OPENAI_KEY = os.getenv('OPENAI_KEY')
+
+SUMMARY_FIELD = 'grant_summary'
+SUMMARY_HASH_FIELD = 'grant_summary_hash'
+
+
+def get_prompt(normalized_info: str) -> List[Dict[str, str]]:
+    """Build the prompt for the query-independent summary of a grant"""
+    return [
+        {
+            "role": "system",
+            "content": "You are a helpful snippet generator. You are given data that describes a grant, and you summarize it for users deciding if the grant is worth exploring. Your summaries are accurate, concise, informative and of expert quality."
+        },
+        {
+            "role": "user",
+            "content": f"Write a detailed summary of the specific area or activity the grant will fund, that is, the purpose of the grant.\n\
+            DO NOT start with any prelude or heading, just get straight to the point. The summary MUST BE 60 words or less and COMPLETE.\n\
+            Here is the information for the grant:\n[{normalized_info}]"
+        }
+    ]
+
+
+@retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(6))
+def generate_summary(client: OpenAI, normalized_info: str, model: str) -> str:
+    """Generate the summary of a grant"""
+    completion = client.chat.completions.create(
+        model=model,
+        messages=get_prompt(normalized_info),
+        temperature=0.5)
+    return completion.choices[0].message.content.strip()
+
+
+def scan_grants(client: Elasticsearch, index_name: str, overwrite: bool = False) -> Iterator[Dict]:
+    """Yield the grants with normalized information whose summary is missing or stale, or all of them if overwrite is set"""
+    query = {"bool": {"must": {"exists": {"field": "normalized_info"}}}}
+    for doc in helpers.scan(client, index=index_name, query={"query": query, "_source": ["normalized_info", SUMMARY_HASH_FIELD]},
+                            scroll='5m', size=500):
+        h = content_hash(doc['_source']['normalized_info'])
+        if overwrite or doc['_source'].get(SUMMARY_HASH_FIELD) != h:
+            doc['hash'] = h
+            yield doc
+
+
+def construct_summary_actions(summaries: Dict[str, Dict[str, str]], index_name: str) -> List[Dict]:
+    """Build bulk partial-update actions writing the summaries and the hashes they were generated from"""
+    return [{"_op_type": "update", "_index": index_name, "_id": id, "doc": fields}
+            for id, fields in summaries.items()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate and store query-independent grant summaries.')
+    parser.add_argument('--index', default='distill_index', help='index to update (default: distill_index)')
+    parser.add_argument('--model', default='gpt-4o', help='OpenAI model (default: gpt-4o)')
+    parser.add_argument('--concurrency', type=int, default=8, help='LLM calls in flight (default: 8)')
+    parser.add_argument('--rpm', type=float, default=500, help='maximum LLM requests per minute, 0 for no limit (default: 500)')
+    parser.add_argument('--batch-size', type=int, default=100, help='summaries written per bulk request (default: 100)')
+    parser.add_argument('--overwrite', action='store_true', help='regenerate summaries that are up to date')
+    args = parser.parse_args()
+
+    ESclient = Elasticsearch(ELASTICSEARCH_URL, basic_auth=(ELASTIC_USERNAME, ELASTIC_PASSWORD), request_timeout=60)
+    OAIclient = OpenAI(api_key=OPENAI_KEY)
+
+    # collect the ids first, since updating documents while scrolling would page past some of them
+    grants = list(scan_grants(ESclient, args.index, args.overwrite))
+    print(f"Grants to summarize = {len(grants)}")
+
+    done, failed = 0, 0
+    for batch in embed_utils.batched(grants, args.batch_size):
+        summaries = {}
+        results = run_concurrent(lambda doc: generate_summary(OAIclient, doc['_source']['normalized_info'], args.model), batch,
+                                 max_workers=args.concurrency, requests_per_minute=args.rpm)
+        for doc, summary, error in results:
+            if error is not None:
+                print(f"Failed to summarize grant {doc['_id']}: {error}")
+                failed += 1
+                continue
+            summaries[doc['_id']] = {SUMMARY_FIELD: summary, SUMMARY_HASH_FIELD: doc['hash']}
+        success, errors = helpers.bulk(ESclient, construct_summary_actions(summaries, args.index), raise_on_error=False)
+        for error in errors:
+            print(f"Failed to update document {error}")
+        done += success
+        failed += len(errors)
+        print(f"Summarized {done} grants, {failed} failed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Export an index to a snapshot served by the in-process search backend of the app.
+
+The snapshot is a directory holding the document ids (`ids.json`), their sources without
+the vector fields (`documents.jsonl`), the unit-normalized float32 vectors of each
+dense_vector field (`<field>.npy`) and `meta.json`, all in the same row order. Documents
+missing a vector field get a zero vector. Set `SEARCH_BACKEND = 'local'` in
+grantquest/config.py and point `LOCAL_SEARCH_PATH` to the parent directory to use it.
+
+Usage, from the `elasticsearch` directory:
+    python export_snapshot.py --index distill_index --output ../grantquest/instance/snapshots
+"""
+
+import argparse
+import json
+import os
+from datetime import datetime, timezone
+import numpy as np
+from dotenv import load_dotenv
+from elasticsearch import Elasticsearch, helpers
+
+# Load environment variables from the .env file
+load_dotenv()
+
+ELASTICSEARCH_URL = os.getenv('ELASTICSEARCH_URL')
+ELASTIC_USERNAME = os.getenv('ELASTIC_USERNAME')
+ELASTIC_PASSWORD = os.getenv('ELASTIC_PASSWORD')
+
+
+def get_vector_fields(client: Elasticsearch, index_name: str):
+    """Get the dimensions of the top-level dense_vector fields of an index"""
+    mappings = client.indices.get_mapping(index=index_name)
+    properties = next(iter(mappings.values()))['mappings']['properties']
+    return {field: spec['dims'] for field, spec in properties.items() if spec.get('type') == 'dense_vector'}
+
+
+def export_snapshot(client: Elasticsearch, index_name: str, output_dir: str):
+    """Write the snapshot of an index to output_dir/index_name"""
+    path = os.path.join(output_dir, index_name)
+    os.makedirs(path, exist_ok=True)
+    fields = get_vector_fields(client, index_name)
+    # an upper bound on the documents scanned, the files are trimmed to the actual count
+    capacity = client.count(index=index_name)['count']
+    # vectors are written to memory-mapped files, so the index does not have to fit in memory
+    vectors = {field: np.lib.format.open_memmap(os.path.join(path, f'{field}.npy.tmp'), mode='w+', dtype=np.float32, shape=(capacity, dims))
+               for field, dims in fields.items()}
+
+    ids = []
+    with open(os.path.join(path, 'documents.jsonl'), 'w') as f:
+        for doc in helpers.scan(client, index=index_name, query={"query": {"match_all": {}}}, size=500):
+            if len(ids) == capacity:
+                print(f"Index '{index_name}' grew during the export, stopping at {capacity} documents")
+                break
+            source = doc['_source']
+            for field in fields:
+                vector = source.pop(field, None)
+                if vector:
+                    vector = np.asarray(vector, dtype=np.float32)
+                    vectors[field][len(ids)] = vector / (np.linalg.norm(vector) or 1.0)
+            f.write(json.dumps(source) + '\n')
+            ids.append(doc['_id'])
+            if len(ids) % 10000 == 0:
+                print(f"Exported {len(ids)} documents")
+
+    for field, matrix in vectors.items():
+        matrix.flush()
+        tmp_path, npy_path = os.path.join(path, f'{field}.npy.tmp'), os.path.join(path, f'{field}.npy')
+        if len(ids) < capacity:
+            np.save(npy_path, matrix[:len(ids)])
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, npy_path)
+    with open(os.path.join(path, 'ids.json'), 'w') as f:
+        json.dump(ids, f)
+    # IVF partitionings cached by the app are for the previous vectors
+    for name in os.listdir(path):
+        if '.ivf' in name:
+            os.remove(os.path.join(path, name))
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump({"index": index_name, "count": len(ids), "fields": fields,
+                   "exported_at": datetime.now(timezone.utc).isoformat()}, f)
+    print(f"Exported {len(ids)} documents of '{index_name}' with vector fields {list(fields)} to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export an index to a snapshot for the in-process search backend.')
+    parser.add_argument('--index', required=True, help='index to export')
+    parser.add_argument('--output', default='../grantquest/instance/snapshots',
+                        help='directory of the snapshots (default: ../grantquest/instance/snapshots)')
+    args = parser.parse_args()
+
+    ESclient = Elasticsearch(ELASTICSEARCH_URL, basic_auth=(ELASTIC_USERNAME, ELASTIC_PASSWORD), request_timeout=60)
+    export_snapshot(ESclient, args.index, args.output)
+
+
+if __name__ == '__main__':
+    main()
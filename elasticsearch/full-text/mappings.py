@@ -69,6 +69,9 @@ mappings={"properties":
             {"properties": 
                 {"id": {"type": "text"},
                 "name": {"type": "text"}
-            }}
+            }},
+        # hash of the grant content, used by sync.py to find changed grants
+        "content_hash":
+            {"type": "keyword"}
         }
     }
\ No newline at end of file
@@ -87,5 +87,9 @@ mappings = {"properties":
             {"type": "short"},
         "eligibility_truncate_length":
             {"type": "short"}, 
+
+        # hash of the grant content, used by sync.py to find changed grants
+        "content_hash":
+            {"type": "keyword"},
         }   
 }
@@ -0,0 +1,107 @@
+"""
+Incrementally update an index from a new grants extract.
+
+Grants are compared to the index by id and content hash: only new and changed grants
+are indexed (and so embedded by the ingest pipeline), unchanged grants are left alone,
+and grants no longer in the extract are marked closed or deleted. Each run records a
+watermark (time, extract, counts and latest `modified_date`) in the `{index}_sync` index.
+
+For the distill index, run distill/normalize.py and distill/summarize.py afterwards.
+Indexing a new or changed grant replaces its whole document, including the fields they
+write: normalize.py summarizes the grants whose content changed and writes its
+checkpointed summary back to the other grants missing `normalized_info`, then
+summarize.py regenerates the summaries whose `normalized_info` changed.
+
+Usage, from the `elasticsearch` directory:
+    python sync.py --grants data/grants.xml --index full_text_index
+    python sync.py --grants data/grants.xml --schema data/grants-20230530.xsd --index distill_index \
+        --pipeline embedding_pipeline --truncate --missing delete
+    python sync.py --grants data/grants.xml --index semantic_index --embed --embedding-model text-embedding-3-large
+    python sync.py --grants data/grants.xml --index semantic_index --embed --embedding-store data/embedding_store
+    python sync.py --grants data/grants.xml --index semantic_index --embed --dimensions 256 --two-stage
+"""
+
+import argparse
+import os
+from dotenv import load_dotenv
+from elasticsearch import Elasticsearch
+from utils import data_utils, embed_utils, index_utils, sync_utils
+from utils.embedding_store import EmbeddingStore
+
+# Load environment variables from the .env file
+load_dotenv()
+
+ELASTICSEARCH_URL = os.getenv('ELASTICSEARCH_URL')
+ELASTIC_USERNAME = os.getenv('ELASTIC_USERNAME')
+ELASTIC_PASSWORD = os.getenv('ELASTIC_PASSWORD')
+OPENAI_KEY = os.getenv('OPENAI_KEY')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Index the grants of a new extract that are new or changed.')
+    parser.add_argument('--grants', default='data/grants.xml', help='grants XML extract (default: data/grants.xml)')
+    parser.add_argument('--schema', default='', help='XSD schema to validate the extract against')
+    parser.add_argument('--index', required=True, help='index to update')
+    parser.add_argument('--pipeline', default=None, help='ingest pipeline of the index, if any')
+    parser.add_argument('--truncate', action='store_true', help='compute the *_truncate_length fields read by the embedding pipelines')
+    parser.add_argument('--embed', action='store_true',
+                        help='compute the embeddings here with batched requests, instead of in an ingest pipeline')
+    parser.add_argument('--embedding-model', default='text-embedding-3-large', help='embedding model for --embed (default: text-embedding-3-large)')
+    parser.add_argument('--dimensions', type=int, default=None,
+                        help='shorten the embeddings of --embed to this many dimensions, as in the index mappings (default: model default)')
+    parser.add_argument('--two-stage', action='store_true',
+                        help='with --dimensions, keep the full embeddings and store the shortened ones in the short field for two-stage kNN')
+    parser.add_argument('--embedding-store', default='', help='directory of the local embedding store used by --embed, so unchanged texts are not embedded again')
+    parser.add_argument('--store-dtype', choices=['float32', 'float16'], default='float32',
+                        help='precision of the vectors in a new embedding store (default: float32)')
+    parser.add_argument('--missing', choices=['close', 'delete'], default='close',
+                        help="what to do with indexed grants missing from the extract (default: close)")
+    parser.add_argument('--chunk-size', type=int, default=100, help='initial documents per bulk request, adapted as it runs (default: 100)')
+    parser.add_argument('--threads', type=int, default=4, help='bulk requests in flight (default: 4)')
+    args = parser.parse_args()
+    if args.embed and args.pipeline:
+        parser.error('--embed replaces the embedding pipeline, do not pass --pipeline')
+    if (args.embedding_store or args.dimensions) and not args.embed:
+        parser.error('--embedding-store and --dimensions require --embed')
+    if args.two_stage and not args.dimensions:
+        parser.error('--two-stage requires --dimensions')
+
+    store = EmbeddingStore(args.embedding_store, dtype=args.store_dtype) if args.embedding_store else None
+    # the vectors stored are the shortened ones, unless the full ones are kept for two-stage kNN
+    if store is not None and store.dims is not None and args.dimensions and not args.two_stage and store.dims != args.dimensions:
+        parser.error(f'--embedding-store holds {store.dims}-dimensional vectors, use another store for --dimensions {args.dimensions}')
+
+    ESclient = Elasticsearch(ELASTICSEARCH_URL, basic_auth=(ELASTIC_USERNAME, ELASTIC_PASSWORD), request_timeout=60)
+
+    last_sync = sync_utils.get_last_sync(ESclient, args.index)
+    if last_sync is not None:
+        print(f"Last sync at {last_sync['synced_at']} from {last_sync['extract']}")
+
+    prepare = None
+    if args.truncate:
+        from tiktoken import get_encoding
+        tokenizer = get_encoding(embed_utils.EMBEDDING_ENCODING)
+        prepare = lambda data: embed_utils.add_truncate_lengths(data, tokenizer)
+
+    indexed = sync_utils.get_indexed_grants(ESclient, args.index)
+    print(f"Indexed grants = {len(indexed)}")
+
+    stats = {}
+    grants = data_utils.iter_grants(args.grants, args.schema or None)
+    actions = sync_utils.construct_sync_actions(grants, indexed, args.index, pipeline_id=args.pipeline, prepare=prepare,
+                                                missing=args.missing, stats=stats)
+    if args.embed:
+        from openai import OpenAI
+        actions = embed_utils.embed_actions(actions, OpenAI(api_key=OPENAI_KEY), model=args.embedding_model, store=store,
+                                            dimensions=args.dimensions, two_stage=args.two_stage)
+    index_utils.parallel_bulk_index_documents(ESclient, actions, thread_count=args.threads, chunk_size=args.chunk_size)
+    if store is not None:
+        store.close()
+        print(', '.join(f"embedding store {key} = {value}" for key, value in store.stats().items()))
+
+    sync_utils.record_sync(ESclient, args.index, os.path.basename(args.grants), stats)
+    print(', '.join(f"{key} = {value}" for key, value in stats.items()))
+
+
+if __name__ == '__main__':
+    main()
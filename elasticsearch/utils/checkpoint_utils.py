@@ -0,0 +1,49 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+
+def content_hash(data: Any) -> str:
+    """Hash the content of a grant, independent of key order"""
+    raw = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class Checkpoint:
+    """
+    Progress of a batch stage, stored as JSON lines in a local file.
+
+    Every update appends a line holding the changed fields of one grant, so that a
+    stage interrupted at any point resumes from the last completed grant. On load,
+    later lines of a grant override the fields of earlier ones.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                for n, line in enumerate(f):
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # a line cut short by a crash
+                        print(f"Skipping unreadable checkpoint line {n + 1}")
+                        continue
+                    self.records.setdefault(record.pop('id'), {}).update(record)
+        self.file = open(path, 'a')
+
+    def get(self, id: str) -> Optional[Dict]:
+        return self.records.get(id)
+
+    def update(self, id: str, **fields):
+        with self.lock:
+            self.records.setdefault(id, {}).update(fields)
+            self.file.write(json.dumps({'id': id, **fields}) + '\n')
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
@@ -1,12 +1,21 @@
+from functools import lru_cache
 from itertools import islice
 import openai
 import tiktoken
 import numpy as np
 from tenacity import *
+from utils.embedding_store import EmbeddingStore, make_key
+from utils.index_utils import get_short_field
 
 EMBEDDING_MODEL = 'text-embedding-3-small'
 EMBEDDING_CTX_LENGTH = 8191
 EMBEDDING_ENCODING = 'cl100k_base'
+# limits of a single embeddings request
+EMBEDDING_MAX_INPUTS = 2048
+EMBEDDING_MAX_REQUEST_TOKENS = 300000
+
+# fields embedded and averaged into the `embeddings` field, as in the ingest pipelines
+EMBEDDING_FIELDS = ['description', 'submission_info', 'eligibility', 'all_titles', 'user_categories', 'all_applicant_types']
 
 
 def batched(iterable, n):
@@ -18,26 +27,200 @@ def batched(iterable, n):
     while (batch := tuple(islice(it, n))):
         yield batch
 
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name=EMBEDDING_ENCODING):
+    """Load a tiktoken encoding once per process"""
+    return tiktoken.get_encoding(encoding_name)
+
 def chunked_tokens(text, encoding_name, chunk_length):
-    encoding = tiktoken.get_encoding(encoding_name)
+    encoding = get_encoding(encoding_name)
     tokens = encoding.encode(text)
     chunks_iterator = batched(tokens, chunk_length)
     yield from chunks_iterator
 
 # make sure to retry on an invalid request
 @retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(6), retry=retry_if_exception_type(openai.BadRequestError))
-def get_embedding(text_or_tokens, client, model=EMBEDDING_MODEL):
-    return client.embeddings.create(input=text_or_tokens, model=model).data[0].embedding
+def get_embedding(text_or_tokens, client, model=EMBEDDING_MODEL, store: EmbeddingStore = None):
+    if store is not None:
+        key = make_key(model, text_or_tokens)
+        cached = store.get_many([key])[0]
+        if cached is not None:
+            return cached.tolist()
+    embedding = client.embeddings.create(input=text_or_tokens, model=model).data[0].embedding
+    if store is not None:
+        store.put_many([key], [embedding])
+    return embedding
 
-def len_safe_get_embedding(text, client, model=EMBEDDING_MODEL, max_tokens=EMBEDDING_CTX_LENGTH, encoding_name=EMBEDDING_ENCODING, average=True):
+def len_safe_get_embedding(text, client, model=EMBEDDING_MODEL, max_tokens=EMBEDDING_CTX_LENGTH, encoding_name=EMBEDDING_ENCODING, average=True,
+                           store: EmbeddingStore = None):
     chunk_embeddings = []
     chunk_lens = []
     for chunk in chunked_tokens(text, encoding_name=encoding_name, chunk_length=max_tokens):
-        chunk_embeddings.append(get_embedding(chunk, client, model=model))
+        chunk_embeddings.append(get_embedding(chunk, client, model=model, store=store))
         chunk_lens.append(len(chunk))
 
     if average:
         chunk_embeddings = np.average(chunk_embeddings, axis=0, weights=chunk_lens)
         chunk_embeddings = chunk_embeddings / np.linalg.norm(chunk_embeddings)  # normalizes length to 1
         chunk_embeddings = chunk_embeddings.tolist()
-    return chunk_embeddings
\ No newline at end of file
+    return chunk_embeddings
+
+def find_token_limit_index(tokenizer, text, max_tokens=EMBEDDING_CTX_LENGTH):
+    """Find the length in characters of the longest prefix of text that fits in max_tokens"""
+    tokens = tokenizer.encode(text)
+    # Return the full length of the text if it has fewer or equal tokens
+    if len(tokens) <= max_tokens:
+        return len(text)
+
+    truncated_tokens = tokens[:max_tokens]
+    truncated_text = tokenizer.decode(truncated_tokens)
+
+    # Find the last character index of the truncated text in the original text
+    index = text.find(truncated_text) + len(truncated_text)
+    return index
+
+
+def add_truncate_lengths(data, tokenizer, max_tokens=EMBEDDING_CTX_LENGTH):
+    """Store the lengths to which the embedded fields of a grant must be truncated, as read by the ingest pipelines"""
+    for field in ['description', 'submission_info', 'eligibility']:
+        data[f'{field}_truncate_length'] = find_token_limit_index(tokenizer, str(data.get(field)), max_tokens)
+    return data
+
+
+def format_field(value, max_len=0):
+    """Format a field for embedding like the formatField function of the ingest pipelines"""
+    if value is None:
+        return " "
+    if isinstance(value, list):
+        value = ",".join(str(v) for v in value)
+    value = str(value)
+    if max_len and max_len > 0:
+        value = value[:max_len]
+    return value
+
+
+def get_field_texts(data, fields=EMBEDDING_FIELDS):
+    """Get the texts of a grant to embed, truncated by its *_truncate_length fields if present"""
+    return [format_field(data.get(field), data.get(f'{field}_truncate_length', 0)) for field in fields]
+
+
+def pack_requests(inputs, max_inputs=EMBEDDING_MAX_INPUTS, max_request_tokens=EMBEDDING_MAX_REQUEST_TOKENS):
+    """Group token lists, in order, into as few embeddings requests as the input and token limits allow"""
+    request, request_tokens = [], 0
+    for tokens in inputs:
+        if request and (len(request) >= max_inputs or request_tokens + len(tokens) > max_request_tokens):
+            yield request
+            request, request_tokens = [], 0
+        request.append(tokens)
+        request_tokens += len(tokens)
+    if request:
+        yield request
+
+
+@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6),
+       retry=retry_if_exception_type((openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)))
+def get_embeddings(inputs, client, model=EMBEDDING_MODEL, dimensions=None):
+    """Embed a list of texts or token lists in a single request, shortened to the given dimensions if any"""
+    args = {'dimensions': dimensions} if dimensions else {}
+    data = client.embeddings.create(input=inputs, model=model, **args).data
+    return [item.embedding for item in sorted(data, key=lambda item: item.index)]
+
+
+def embed_inputs(inputs, client, model=EMBEDDING_MODEL, store: EmbeddingStore = None, dimensions=None):
+    """Embed many token lists with batched requests, only sending those missing from the store; returns an array of shape (len(inputs), dims)"""
+    if store is None:
+        vectors = [vector for request in pack_requests(inputs) for vector in get_embeddings(request, client, model=model, dimensions=dimensions)]
+        return np.array(vectors, dtype=np.float32)
+
+    keys = [make_key(f"{model}:{dimensions}" if dimensions else model, tokens) for tokens in inputs]
+    vectors = store.get_many(keys)
+    missing = {}
+    for i, vector in enumerate(vectors):
+        if vector is None:
+            missing.setdefault(keys[i], []).append(i)
+    missing_keys = list(missing)
+    for start in range(0, len(missing_keys), EMBEDDING_MAX_INPUTS):
+        request_keys = missing_keys[start:start + EMBEDDING_MAX_INPUTS]
+        computed = [vector for request in pack_requests([inputs[missing[key][0]] for key in request_keys])
+                    for vector in get_embeddings(request, client, model=model, dimensions=dimensions)]
+        store.put_many(request_keys, computed)
+        for key, vector in zip(request_keys, computed):
+            for i in missing[key]:
+                vectors[i] = np.asarray(vector, dtype=np.float32)
+    return np.array(vectors, dtype=np.float32)
+
+
+def embed_texts(texts, client, model=EMBEDDING_MODEL, max_tokens=EMBEDDING_CTX_LENGTH, encoding_name=EMBEDDING_ENCODING,
+                store: EmbeddingStore = None, dimensions=None):
+    """Embed many texts, each truncated to max_tokens, with batched requests; returns an array of shape (len(texts), dims)"""
+    encoding = get_encoding(encoding_name)
+    # the API rejects empty inputs
+    inputs = [tokens[:max_tokens] or encoding.encode(" ") for tokens in encoding.encode_batch(list(texts))]
+    return embed_inputs(inputs, client, model=model, store=store, dimensions=dimensions)
+
+
+def len_safe_get_embeddings(texts, client, model=EMBEDDING_MODEL, max_tokens=EMBEDDING_CTX_LENGTH, encoding_name=EMBEDDING_ENCODING, average=True,
+                            store: EmbeddingStore = None):
+    """
+    Batched len_safe_get_embedding: split every text into chunks of max_tokens and embed the chunks
+    of all the texts in as few requests as fit. Returns an array of the normalized, length-weighted
+    average of each text's chunks, or with average=False a list of the chunk embeddings of each text.
+    """
+    encoding = get_encoding(encoding_name)
+    chunks, counts = [], []
+    for tokens in encoding.encode_batch(list(texts)):
+        text_chunks = [list(chunk) for chunk in batched(tokens, max_tokens)] or [encoding.encode(" ")]
+        chunks.extend(text_chunks)
+        counts.append(len(text_chunks))
+    if not chunks:
+        return np.empty((0, 0), dtype=np.float32) if average else []
+
+    vectors = embed_inputs(chunks, client, model=model, store=store)
+    offsets = np.cumsum([0] + counts[:-1])
+    if not average:
+        return np.split(vectors, offsets[1:])
+    lengths = np.array([len(chunk) for chunk in chunks], dtype=np.float32)
+    sums = np.add.reduceat(vectors * lengths[:, None], offsets, axis=0)
+    norms = np.linalg.norm(sums, axis=1, keepdims=True)
+    return sums / np.where(norms == 0, 1, norms)
+
+
+def truncate_embeddings(vectors, dims):
+    """Shorten embeddings of shape (n, dims) the Matryoshka way: keep the first dims and renormalize"""
+    vectors = np.asarray(vectors, dtype=np.float32)[:, :dims]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def average_embeddings(vectors, weights=None):
+    """Average the vectors of each group, of shape (groups, vectors, dims), and normalize the averages to unit length"""
+    averages = np.average(vectors, axis=1, weights=weights)
+    norms = np.linalg.norm(averages, axis=1, keepdims=True)
+    return averages / np.where(norms == 0, 1, norms)
+
+
+def embed_grants(grants, client, model=EMBEDDING_MODEL, fields=EMBEDDING_FIELDS, weights=None, target_field='embeddings',
+                 store: EmbeddingStore = None, dimensions=None, two_stage=False):
+    """
+    Store in target_field of each grant the normalized (weighted) average embedding of its fields.
+    With dimensions, the embeddings are shortened to that many dimensions; with two_stage as well,
+    target_field keeps the full embedding and the shortened one is stored in its short field.
+    """
+    if not grants:
+        return grants
+    texts = [text for data in grants for text in get_field_texts(data, fields)]
+    vectors = embed_texts(texts, client, model=model, store=store, dimensions=None if two_stage else dimensions)
+    averages = average_embeddings(vectors.reshape(len(grants), len(fields), -1), weights)
+    for data, vector in zip(grants, averages):
+        data[target_field] = vector.tolist()
+    if dimensions and two_stage:
+        for data, vector in zip(grants, truncate_embeddings(averages, dimensions)):
+            data[get_short_field(target_field)] = vector.tolist()
+    return grants
+
+
+def embed_actions(actions, client, model=EMBEDDING_MODEL, batch_size=100, **kwargs):
+    """Add embeddings to a stream of indexing actions, batch_size grants at a time, in place of the embedding ingest pipeline"""
+    for batch in batched(actions, batch_size):
+        embed_grants([action['_source'] for action in batch if '_source' in action], client, model=model, **kwargs)
+        yield from batch
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Union
+
+
+def make_key(model: str, text: Union[str, Sequence[int]]) -> str:
+    """Content address of an embedding: sha256 of the model and the text (or its tokens)"""
+    if not isinstance(text, str):
+        text = json.dumps(list(text))
+    return hashlib.sha256(f"{model}\x1f{text}".encode('utf-8')).hexdigest()
+
+
+class EmbeddingStore:
+    """
+    Local content-addressed store of embeddings, so that unchanged text is never embedded twice.
+
+    Vectors are rows of a memory-mapped float32 or float16 array (`vectors.bin`). The key
+    of each row is a line of `keys.txt`, loaded into a dict on open. A vector is written
+    before its key, so a store interrupted mid-write never maps a key to a missing vector.
+    Vectors are returned as float32. The number of dimensions is fixed by the first write,
+    so a store holds the vectors of a single model and `dimensions` setting.
+    """
+
+    def __init__(self, path: str, dtype: str = 'float32', initial_capacity: int = 1024):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            self.dims, self.dtype = meta['dims'], np.dtype(meta['dtype'])
+        else:
+            self.dims, self.dtype = None, np.dtype(dtype)
+
+        self.keys: Dict[str, int] = {}
+        keys_path = os.path.join(path, 'keys.txt')
+        complete = True
+        if os.path.exists(keys_path):
+            with open(keys_path) as f:
+                for line in f:
+                    complete = line.endswith('\n')
+                    # a line cut short by a crash is ignored
+                    if complete and len(line) == 65:
+                        self.keys[line[:64]] = len(self.keys)
+        self.keys_file = open(keys_path, 'a')
+        if not complete:
+            self.keys_file.write('\n')
+
+        self.vectors = None
+        self.initial_capacity = initial_capacity
+        if self.dims is not None:
+            self._map(max(self._file_rows(), initial_capacity))
+
+    def _file_rows(self) -> int:
+        vectors_path = os.path.join(self.path, 'vectors.bin')
+        if not os.path.exists(vectors_path):
+            return 0
+        return os.path.getsize(vectors_path) // (self.dims * self.dtype.itemsize)
+
+    def _map(self, rows: int):
+        """Map the vectors file, growing it to hold `rows` vectors"""
+        vectors_path = os.path.join(self.path, 'vectors.bin')
+        if self.vectors is not None:
+            self.vectors.flush()
+        with open(vectors_path, 'ab') as f:
+            f.truncate(max(os.path.getsize(vectors_path), rows * self.dims * self.dtype.itemsize))
+        self.vectors = np.memmap(vectors_path, dtype=self.dtype, mode='r+', shape=(rows, self.dims))
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.keys
+
+    def get_many(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        """Get the vectors of the given keys, None for keys not in the store"""
+        with self.lock:
+            rows = [self.keys.get(key) for key in keys]
+            vectors = [np.array(self.vectors[row], dtype=np.float32) if row is not None else None for row in rows]
+            found = sum(row is not None for row in rows)
+            self.hits += found
+            self.misses += len(rows) - found
+        return vectors
+
+    def put_many(self, keys: List[str], vectors: Union[np.ndarray, List[List[float]]]):
+        """Add vectors to the store, skipping keys already present; raises ValueError if their dimensions are not the store's"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self.lock:
+            if self.dims is None:
+                self.dims = int(vectors.shape[1])
+                with open(os.path.join(self.path, 'meta.json'), 'w') as f:
+                    json.dump({'dims': self.dims, 'dtype': self.dtype.name}, f)
+                self._map(self.initial_capacity)
+            elif len(vectors) and vectors.shape[1] != self.dims:
+                raise ValueError(f"Embedding store {self.path} holds {self.dims}-dimensional vectors, not {vectors.shape[1]}; "
+                                 f"use another store for this model or number of dimensions")
+            new = {}
+            for key, vector in zip(keys, vectors):
+                if key not in self.keys:
+                    new[key] = vector
+            if not new:
+                return
+            rows = len(self.keys) + len(new)
+            if rows > self.vectors.shape[0]:
+                self._map(max(rows, 2 * self.vectors.shape[0]))
+            start = len(self.keys)
+            for n, vector in enumerate(new.values()):
+                self.vectors[start + n] = vector
+            self.vectors.flush()
+            for n, key in enumerate(new):
+                self.keys[key] = start + n
+                self.keys_file.write(key + '\n')
+            self.keys_file.flush()
+
+    def stats(self) -> Dict[str, int]:
+        return {'size': len(self.keys), 'hits': self.hits, 'misses': self.misses}
+
+    def close(self):
+        with self.lock:
+            if self.vectors is not None:
+                self.vectors.flush()
+            self.keys_file.close()
@@ -1,8 +1,62 @@
 from elasticsearch import Elasticsearch, exceptions, NotFoundError, helpers
-from time import sleep
-from typing import Dict, LiteralString, List
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import count, islice
+from time import monotonic, sleep
+from typing import Dict, Iterable, Iterator, LiteralString, List, Optional, Tuple, Union
+import copy
+import heapq
+import threading
 
-def create_index(client: Elasticsearch, index_name: LiteralString, mappings: Dict):
+# bulk item statuses worth retrying: rejections, timeouts and server-side failures (such as inference calls in ingest pipelines)
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+# HNSW index types of dense_vector fields: float vectors, and vectors quantized to 8 bits, 4 bits and 1 bit (bbq, Elasticsearch 8.16+)
+VECTOR_INDEX_TYPES = ['hnsw', 'int8_hnsw', 'int4_hnsw', 'bbq_hnsw']
+
+def with_vector_index_options(mappings: Dict, index_type: str, **options) -> Dict:
+    """
+    Copy of mappings whose dense_vector fields use the given HNSW index type, with extra index_options
+    such as m, ef_construction or confidence_interval. The float vectors are kept in the index either way,
+    so quantized indices can rescore with them.
+    """
+    if index_type not in VECTOR_INDEX_TYPES:
+        raise ValueError(f"index_type must be one of {VECTOR_INDEX_TYPES}, not {index_type!r}")
+    mappings = copy.deepcopy(mappings)
+    for field in mappings['properties'].values():
+        if field.get('type') == 'dense_vector' and field.get('index', True):
+            field['index_options'] = {"type": index_type, **options}
+    return mappings
+
+
+def get_short_field(field: str) -> str:
+    """Name of the field holding the shortened vectors searched in the first stage of a two-stage kNN on field"""
+    return f"{field}_short"
+
+
+def with_embedding_dims(mappings: Dict, dims: int, two_stage: bool = False, field: str = 'embeddings') -> Dict:
+    """
+    Copy of mappings for embeddings shortened to dims dimensions. With two_stage, the full vectors are
+    kept for rescoring but not indexed, and the short vectors are indexed in the short field.
+    """
+    mappings = copy.deepcopy(mappings)
+    full = mappings['properties'][field]
+    if not two_stage:
+        full['dims'] = dims
+        return mappings
+    mappings['properties'][get_short_field(field)] = {**full, "dims": dims}
+    # only indexed vectors take a similarity and index_options; scripts can still read the full vectors
+    full['index'] = False
+    full.pop('similarity', None)
+    full.pop('index_options', None)
+    return mappings
+
+
+def create_index(client: Elasticsearch, index_name: LiteralString, mappings: Dict, vector_index_type: Optional[str] = None,
+                 embedding_dims: Optional[int] = None, two_stage: bool = False):
+    if embedding_dims is not None:
+        mappings = with_embedding_dims(mappings, embedding_dims, two_stage=two_stage)
+    if vector_index_type is not None:
+        mappings = with_vector_index_options(mappings, vector_index_type)
     if client.indices.exists(index=index_name):
             print(f"Index '{index_name}' already exists.")
     else:
@@ -21,6 +75,17 @@ def create_index(client: Elasticsearch, index_name: LiteralString, mappings: Dic
             print(f"Unexpected error: {e}")
 
 
+def copy_index(client: Elasticsearch, source_index: LiteralString, dest_index: LiteralString, mappings: Dict,
+               vector_index_type: Optional[str] = None):
+    """Create dest_index (with vectors quantized by vector_index_type, if given) and copy the documents of source_index into it, without re-embedding them"""
+    create_index(client, dest_index, mappings, vector_index_type=vector_index_type)
+    resp = client.reindex(source={"index": source_index}, dest={"index": dest_index}, refresh=True, wait_for_completion=True, request_timeout=3600)
+    print(f"Copied {resp['created'] + resp['updated']} documents from '{source_index}' to '{dest_index}'")
+    if resp['failures']:
+        print(f"Failed to copy documents: {resp['failures']}")
+    return resp
+
+
 def delete_index(client, index_name):
     try:
         resp = client.indices.delete(
@@ -31,57 +96,196 @@ def delete_index(client, index_name):
             print(f"Unexpected error: {e}")
 
 
-def construct_indexing_actions(grants_data: Dict, index_name: LiteralString, pipeline_id: LiteralString = None):
-    body = []
-    for item in grants_data['grants_data']['grant']:
-        action = {"_index": index_name, "_id": item['@id']}
-        if (pipeline_id):
-            action["pipeline"] = pipeline_id
-        data = item.copy()
-        del data['@id']
-        action['_source'] = data
-        body.append(action)
-    
-    return body
-
-def construct_actions_from_ids(grants_data: Dict, ids: List, index_name: LiteralString, pipeline_id: LiteralString = None):
-    body = []
-    for item in grants_data['grants_data']['grant']:
-        if item['@id'] in ids:
-            action = {"_index": index_name, "_id": item['@id'], "pipeline": pipeline_id}
-            data = item.copy()
-            del data['@id']
-            action['_source'] = data
-            body.append(action)
-
-    return body
-
-
-def bulk_index_documents(client: Elasticsearch, actions: List[Dict], chunk_size=1000, max_retries=3, retry_delay=5):
-    for attempt in range(max_retries):
-        try:
-            success, failed = helpers.bulk(client, actions, chunk_size=chunk_size, raise_on_error=False)
-            
-            # Check for failures
-            if failed:
-                for doc in failed:
-                    print(f"Failed to index document {doc}")
+def iter_grant_items(grants_data: Union[Dict, Iterable[Dict]]) -> Iterable[Dict]:
+    """Get the grants of parsed grants data, or pass through a stream of grants such as data_utils.iter_grants"""
+    if isinstance(grants_data, dict):
+        return grants_data['grants_data']['grant']
+    return grants_data
+
+
+def construct_indexing_action(item: Dict, index_name: LiteralString, pipeline_id: LiteralString = None,
+                              in_place: bool = False) -> Dict:
+    """
+    Get the indexing action of a grant.
+
+    With in_place, '@id' is popped from the grant, which becomes the source of the action
+    without being copied; use it when the grants are not needed afterwards, e.g. for a stream.
+    """
+    if in_place:
+        id = item.pop('@id')
+        data = item
+    else:
+        # copied by default, since parsed grants data is read again by construct_actions_from_ids to rebuild failed actions
+        id = item['@id']
+        data = {key: value for key, value in item.items() if key != '@id'}
+    action = {"_index": index_name, "_id": id, "_source": data}
+    if (pipeline_id):
+        action["pipeline"] = pipeline_id
+    return action
+
+
+def construct_indexing_actions(grants_data: Union[Dict, Iterable[Dict]], index_name: LiteralString,
+                               pipeline_id: LiteralString = None, in_place: bool = False) -> Iterator[Dict]:
+    """Yield the indexing action of each grant, so that a stream of grants is never held in memory"""
+    for item in iter_grant_items(grants_data):
+        yield construct_indexing_action(item, index_name, pipeline_id, in_place)
+
+
+def construct_actions_from_ids(grants_data: Union[Dict, Iterable[Dict]], ids: Iterable, index_name: LiteralString,
+                               pipeline_id: LiteralString = None, in_place: bool = False) -> Iterator[Dict]:
+    """Yield the indexing actions of the grants with the given ids, e.g. to index again the grants that failed"""
+    # ids are compared as strings, as returned by Elasticsearch
+    ids = {str(id) for id in ids}
+    for item in iter_grant_items(grants_data):
+        if str(item['@id']) in ids:
+            yield construct_indexing_action(item, index_name, pipeline_id, in_place)
+
+
+def bulk_index_documents(client: Elasticsearch, actions: Iterable[Dict], chunk_size=1000, max_retries=3, retry_delay=5):
+    """Index actions with helpers.bulk, one chunk of chunk_size at a time; after a timeout, the chunk in flight is sent again whole"""
+    actions = iter(actions)
+    success, failed = 0, []
+    # the chunk is buffered so that a timeout does not drop the actions already taken from a generator
+    while (chunk := list(islice(actions, chunk_size))):
+        for attempt in range(max_retries):
+            try:
+                chunk_success, chunk_failed = helpers.bulk(client, chunk, chunk_size=chunk_size, raise_on_error=False)
+                success += chunk_success
+                failed.extend(chunk_failed)
+                break  # Move on to the next chunk if successful
+
+            except exceptions.ConnectionTimeout as e:
+                print(f"Connection timed out, attempt {attempt + 1} of {max_retries}")
+                if attempt < max_retries - 1:
+                    sleep(retry_delay)
+                else:
+                    print("Max retries reached. Failed to index documents.")
+                    raise e
+            except Exception as e:
+                print(f"Error indexing documents: {e}")
+                raise e
+
+    # Check for failures
+    if failed:
+        for doc in failed:
+            print(f"Failed to index document {doc}")
+    else:
+        print(f"Successfully indexed {success} documents.")
+
+
+class AdaptiveChunkSize:
+    """
+    Bulk chunk size adapted to the cluster, by additive increase and multiplicative decrease.
+
+    The size grows by `step` after every chunk that completes within `target_latency`
+    seconds without rejections, and is halved after a slow chunk or a 429.
+    """
+
+    def __init__(self, initial: int = 100, minimum: int = 10, maximum: int = 1000, target_latency: float = 10.0):
+        self.size = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.step = max(1, initial // 10)
+        self.lock = threading.Lock()
+
+    def update(self, latency: float, rejected: bool):
+        with self.lock:
+            if rejected or latency > self.target_latency:
+                self.size = max(self.minimum, self.size // 2)
             else:
-                print(f"Successfully indexed {success} documents.")
-                
-            break  # Exit loop if successful
-            
-        except exceptions.ConnectionTimeout as e:
-            print(f"Connection timed out, attempt {attempt + 1} of {max_retries}")
-            if attempt < max_retries - 1:
-                sleep(retry_delay)
+                self.size = min(self.maximum, self.size + self.step)
+
+
+def _send_chunk(client: Elasticsearch, chunk: List[Dict]) -> Tuple[float, List[Tuple[bool, Dict]]]:
+    """Send one bulk request, returning its latency and the (ok, item) result of each action in order"""
+    start = monotonic()
+    try:
+        results = list(helpers.streaming_bulk(client, chunk, chunk_size=len(chunk), raise_on_error=False,
+                                              raise_on_exception=False, max_retries=0))
+    except Exception as e:
+        # the request failed as a whole, e.g. on a connection timeout
+        results = [(False, {"index": {"status": None, "error": str(e)}}) for _ in chunk]
+    return monotonic() - start, results
+
+
+def parallel_bulk_index_documents(client: Elasticsearch, actions: Iterable[Dict], thread_count: int = 4,
+                                  chunk_size: int = 100, min_chunk_size: int = 10, max_chunk_size: int = 1000,
+                                  target_latency: float = 10.0, max_retries: int = 3, retry_delay: float = 5,
+                                  report_every: float = 10.0) -> Tuple[int, List[Dict]]:
+    """
+    Index actions with `thread_count` bulk requests in flight, reporting docs/sec as it runs.
+
+    The chunk size adapts to the latency of the requests and to 429 rejections (see
+    AdaptiveChunkSize). Documents that fail with a retryable status are sent again on
+    their own, after an exponential backoff, up to `max_retries` times; the rest of
+    their chunk is not re-sent. Returns the number of documents indexed and the
+    failed items.
+    """
+    sizer = AdaptiveChunkSize(chunk_size, min_chunk_size, max_chunk_size, target_latency)
+    actions = iter(actions)
+    exhausted = False
+    # documents waiting to be retried: (time ready, sequence, attempt, action)
+    retries, sequence = [], count()
+    indexed, failed = 0, []
+    start = last_report = monotonic()
+
+    def next_chunk() -> List[Tuple[int, Dict]]:
+        nonlocal exhausted
+        chunk = []
+        while retries and retries[0][0] <= monotonic() and len(chunk) < sizer.size:
+            _, _, attempt, action = heapq.heappop(retries)
+            chunk.append((attempt, action))
+        while not exhausted and len(chunk) < sizer.size:
+            action = next(actions, None)
+            if action is None:
+                exhausted = True
             else:
-                print("Max retries reached. Failed to index documents.")
-                raise e
-        except Exception as e:
-            print(f"Error indexing documents: {e}")
-            raise e
-        
+                chunk.append((0, action))
+        return chunk
+
+    with ThreadPoolExecutor(max_workers=thread_count) as executor:
+        pending = {}
+        while True:
+            while len(pending) < thread_count:
+                chunk = next_chunk()
+                if not chunk:
+                    break
+                pending[executor.submit(_send_chunk, client, [action for _, action in chunk])] = chunk
+            if not pending:
+                if not retries:
+                    break
+                sleep(max(0.0, retries[0][0] - monotonic()))
+                continue
+
+            done, _ = wait(pending, timeout=1.0 if retries else None, return_when=FIRST_COMPLETED)
+            for future in done:
+                chunk = pending.pop(future)
+                latency, results = future.result()
+                rejected = False
+                for (attempt, action), (ok, item) in zip(chunk, results):
+                    if ok:
+                        indexed += 1
+                        continue
+                    info = next(iter(item.values()))
+                    status = info.get('status')
+                    rejected = rejected or status in (None, 429)
+                    if (status is None or status in RETRYABLE_STATUSES) and attempt < max_retries:
+                        heapq.heappush(retries, (monotonic() + retry_delay * 2 ** attempt, next(sequence), attempt + 1, action))
+                    else:
+                        print(f"Failed to index document {info.get('_id', action.get('_id'))}: {info.get('error')}")
+                        failed.append(item)
+                sizer.update(latency, rejected)
+
+            if monotonic() - last_report >= report_every:
+                last_report = monotonic()
+                print(f"Indexed {indexed} documents, {indexed / (last_report - start):.1f} docs/sec, "
+                      f"chunk size {sizer.size}, {len(retries)} waiting for retry, {len(failed)} failed")
+
+    elapsed = monotonic() - start
+    print(f"Indexed {indexed} documents in {elapsed:.1f} s ({indexed / elapsed if elapsed else 0:.1f} docs/sec), {len(failed)} failed")
+    return indexed, failed
+
 
 def document_exists(client: Elasticsearch, index_name: LiteralString, doc_id: int):
     try:
@@ -91,29 +295,66 @@ def document_exists(client: Elasticsearch, index_name: LiteralString, doc_id: in
         return False
 
 
-def get_missing_ids(client: Elasticsearch, index_name: LiteralString, ids: List[int]):
+def get_missing_ids(client: Elasticsearch, index_name: LiteralString, ids: Iterable[int], batch_size: int = 1000) -> List:
+    """Get the ids that are not in the index, in their original order, with one mget of `batch_size` ids per request"""
     missing_ids = []
-    for id in ids:
-        if not document_exists(client, index_name, id):
-            missing_ids.append(id)
+    ids = list(ids)
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        # the docs of an mget are in the order of the ids requested
+        res = client.mget(index=index_name, ids=[str(id) for id in batch], source=False)
+        missing_ids.extend(id for id, doc in zip(batch, res['docs']) if not doc.get('found'))
     return missing_ids
 
-def get_failed_embedding_ids(client: Elasticsearch, index_name: LiteralString):
+
+def get_indexed_ids(client: Elasticsearch, index_name: LiteralString, size: int = 5000) -> set:
+    """Get the ids of all documents of the index, scanning them without their source"""
+    return {doc['_id'] for doc in helpers.scan(client, index=index_name, query={"_source": False, "query": {"match_all": {}}}, size=size)}
+
+
+def get_failed_embedding_ids(client: Elasticsearch, index_name: LiteralString, field: str = 'embeddings', size: int = 5000) -> List[str]:
+    """Get the ids of the documents without embeddings"""
     search_query = {
-    "_source": ["error_message"],
-    "query": {
-        "bool": {
-            "must_not": {
-                "exists": {
-                    "field": "embeddings"
-                }}}}
+        "_source": False,
+        "query": {
+            "bool": {
+                "must_not": {
+                    "exists": {
+                        "field": field
+                    }}}}
     }
+    return [doc['_id'] for doc in helpers.scan(client, query=search_query, index=index_name, size=size)]
 
-    err = []
-    documents = helpers.scan(client, query=search_query, index=index_name)
-    for doc in documents:
-        # print(doc)
-        err.append(doc['_id'])
-        # print(doc['_id'])
-    
-    return err
+
+def reconcile_index(client: Elasticsearch, index_name: LiteralString, ids: Iterable[int], field: str = 'embeddings',
+                    size: int = 5000) -> Dict[str, List]:
+    """
+    Compare the index with the ids of the grants it should hold, in a single scan of the index.
+
+    Returns the ids missing from the index, in their original order, and the ids of the
+    documents without `field` (failed embeddings) and of the documents that are not in
+    `ids` (orphaned), as stored in the index.
+    """
+    # every document matches, and the named clause marks those without embeddings
+    search_query = {
+        "_source": False,
+        "query": {
+            "bool": {
+                "should": [
+                    {"match_all": {}},
+                    {"bool": {"must_not": {"exists": {"field": field}}, "_name": "failed_embedding"}}
+                ]}}
+    }
+    indexed, failed = set(), []
+    for doc in helpers.scan(client, query=search_query, index=index_name, size=size):
+        indexed.add(doc['_id'])
+        if 'failed_embedding' in doc.get('matched_queries', ()):
+            failed.append(doc['_id'])
+
+    ids = list(ids)
+    expected = {str(id) for id in ids}
+    return {
+        "missing": [id for id in ids if str(id) not in indexed],
+        "failed_embedding": failed,
+        "orphaned": [id for id in indexed if id not in expected],
+    }
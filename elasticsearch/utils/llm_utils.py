@@ -0,0 +1,56 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple
+
+# marks the end of the items in run_concurrent
+_END = object()
+
+
+class RateLimiter:
+    """Space out calls so that no more than `requests_per_minute` start per minute (0 disables the limit)"""
+
+    def __init__(self, requests_per_minute: float = 0):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self.next_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_time)
+            self.next_time = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def run_concurrent(func: Callable[[Any], Any], items: Iterable[Any], max_workers: int = 8,
+                   requests_per_minute: float = 0) -> Iterator[Tuple[Any, Any, Optional[Exception]]]:
+    """Call func on every item with bounded concurrency and rate limiting, yielding (item, result, error) as calls complete"""
+    limiter = RateLimiter(requests_per_minute)
+
+    def call(item):
+        limiter.wait()
+        return func(item)
+
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # keep a bounded number of calls queued, so that large inputs are not submitted at once
+        pending = {}
+        for item in items:
+            pending[executor.submit(call, item)] = item
+            if len(pending) >= 2 * max_workers:
+                break
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                try:
+                    yield item, future.result(), None
+                except Exception as e:
+                    yield item, None, e
+                next_item = next(items, _END)
+                if next_item is not _END:
+                    pending[executor.submit(call, next_item)] = next_item
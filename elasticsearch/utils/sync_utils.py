@@ -0,0 +1,95 @@
+from datetime import datetime, timezone
+from elasticsearch import Elasticsearch, NotFoundError, helpers
+from typing import Callable, Dict, Iterable, Iterator, LiteralString, Optional
+from utils.checkpoint_utils import content_hash
+
+# status given to indexed grants that are no longer in the extract
+CLOSED_STATUS = 'Closed'
+
+
+def get_indexed_grants(client: Elasticsearch, index_name: LiteralString) -> Dict[str, Dict]:
+    """Get the content hash, modified date and status of every indexed grant, keyed by id"""
+    query = {"query": {"match_all": {}}, "_source": ["content_hash", "modified_date", "status"]}
+    return {doc['_id']: doc['_source'] for doc in helpers.scan(client, index=index_name, query=query, size=1000)}
+
+
+def construct_sync_actions(grants: Iterable[Dict], indexed: Dict[str, Dict], index_name: LiteralString,
+                           pipeline_id: LiteralString = None, prepare: Optional[Callable[[Dict], Dict]] = None,
+                           missing: str = 'close', stats: Optional[Dict] = None) -> Iterator[Dict]:
+    """
+    Yield the actions bringing an index in line with a new extract.
+
+    New grants and grants whose content hash changed are indexed. Grants indexed before
+    content hashes were stored are compared on `modified_date`, and only get their hash
+    added if it has not changed. Indexed grants missing from the extract are marked closed,
+    or deleted if missing is 'delete'. A grant closed that way gets its status back when it
+    returns to the extract unchanged, with a partial update that keeps the fields written
+    by the distill stages. The counts of each case are added to stats.
+    """
+    stats = stats if stats is not None else {}
+    for key in ['new', 'changed', 'unchanged', 'backfilled', 'reopened', 'closed', 'deleted']:
+        stats.setdefault(key, 0)
+
+    seen = set()
+    for grant in grants:
+        id = grant['@id']
+        seen.add(id)
+        h = content_hash(grant)
+        if grant.get('modified_date') and grant['modified_date'] > stats.get('max_modified_date', ''):
+            stats['max_modified_date'] = grant['modified_date']
+
+        current = indexed.get(id)
+        backfill = current is not None and current.get('content_hash') is None and current.get('modified_date') == grant.get('modified_date')
+        if current is not None and (current.get('content_hash') == h or backfill):
+            doc = {"content_hash": h} if backfill else {}
+            if current.get('status') == CLOSED_STATUS and grant.get('status') != CLOSED_STATUS:
+                # closed by an earlier sync, so only the status is restored
+                doc['status'] = grant.get('status')
+                stats['reopened'] += 1
+            else:
+                stats['backfilled' if backfill else 'unchanged'] += 1
+            if doc:
+                yield {"_op_type": "update", "_index": index_name, "_id": id, "doc": doc}
+            continue
+
+        stats['changed' if current is not None else 'new'] += 1
+        data = grant.copy()
+        del data['@id']
+        data['content_hash'] = h
+        if prepare is not None:
+            data = prepare(data)
+        action = {"_index": index_name, "_id": id, "_source": data}
+        if (pipeline_id):
+            action["pipeline"] = pipeline_id
+        yield action
+
+    for id, current in indexed.items():
+        if id in seen:
+            continue
+        if missing == 'delete':
+            stats['deleted'] += 1
+            yield {"_op_type": "delete", "_index": index_name, "_id": id}
+        elif current.get('status') != CLOSED_STATUS:
+            stats['closed'] += 1
+            yield {"_op_type": "update", "_index": index_name, "_id": id, "doc": {"status": CLOSED_STATUS}}
+
+
+def get_sync_index(index_name: LiteralString) -> str:
+    return f"{index_name}_sync"
+
+
+def record_sync(client: Elasticsearch, index_name: LiteralString, extract: str, stats: Dict):
+    """Record the watermark of a sync in the {index}_sync index"""
+    document = {"index": index_name, "extract": extract,
+                "synced_at": datetime.now(timezone.utc).isoformat(), **stats}
+    client.index(index=get_sync_index(index_name), document=document, refresh=True)
+
+
+def get_last_sync(client: Elasticsearch, index_name: LiteralString) -> Optional[Dict]:
+    """Get the watermark of the last sync of an index, or None if it was never synced"""
+    try:
+        res = client.search(index=get_sync_index(index_name), size=1, sort=[{"synced_at": {"order": "desc"}}])
+    except NotFoundError:
+        return None
+    hits = res['hits']['hits']
+    return hits[0]['_source'] if hits else None
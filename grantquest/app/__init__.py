@@ -1,23 +1,188 @@
 """
 Initialize the Flask application and its components.
 
-Sets up the Flask app, configures it, initializes the Elasticsearch client,
-LLM client, and snippet generator. Also handles environment variable loading
+Sets up the Flask app, configures it, initializes the query embedder, search client
+(Elasticsearch, or the in-process vector search over a snapshot), search session cache, LLM client, LLM dispatcher, snippet cache and snippet generator. Also handles environment variable loading
 and basic error checking for critical configuration items.
 """
 
 import os
 import sys
+import atexit
 from flask import Flask
 from dotenv import load_dotenv
 from config import Config
 from app.search.search import Search
+from app.search.local_search import LocalVectorSearch
+from app.search.session_cache import SearchSessionCache
 from app.clients.clients import create_client
+from app.cache.cache import LRUCache, SQLiteCache, create_cache
+from app.embeddings.embeddings import CachedEmbedder, create_embedder
+from app.dispatcher.dispatcher import LLMDispatcher
+from app.snippet_generator.snippet_cache import SnippetCache
 from app.snippet_generator.snippet_generator import SnippetGenerator
 
 # Load environment variables
 load_dotenv()
 
+def init_embedder(app):
+    """
+    Initialize the cached query embedder and attach it to the app.
+
+    Shared by the WSGI app and the ASGI app. Sets `app.query_embedder` to None when
+    EMBEDDER_TYPE is 'none', in which case Elasticsearch embeds queries itself.
+
+    Args:
+        app: The Flask or Quart application, already configured.
+    """
+    try:
+        embedder = create_embedder(
+            app.config.get('EMBEDDER_TYPE', 'none'),
+            os.getenv('OPENAI_KEY'),
+            model_name=app.config.get('EMBEDDING_MODEL', 'text-embedding-3-small'),
+            dimensions=app.config.get('EMBEDDING_DIMENSIONS')
+        )
+        if embedder is not None:
+            ttl = app.config.get('QUERY_EMBEDDING_CACHE_TTL')
+            store_path = app.config.get('QUERY_EMBEDDING_STORE_PATH')
+            embedder = CachedEmbedder(
+                embedder,
+                LRUCache(app.config.get('QUERY_EMBEDDING_CACHE_SIZE', 10000), ttl),
+                store=SQLiteCache(store_path, ttl) if store_path else None
+            )
+    except Exception as e:
+        app.logger.error(f'Failed to initialize query embedder: {e}')
+        sys.exit(1)
+
+    app.query_embedder = embedder
+
+
+def create_search_client(app, asynchronous: bool = False):
+    """
+    Create the search client of the backend selected by SEARCH_BACKEND.
+
+    Shared by the WSGI app and the ASGI app. 'elasticsearch' searches the Elasticsearch
+    cluster; 'local' searches snapshots of the indices in process (see local_search.py);
+    'fallback' searches the cluster and falls back to the snapshots when it is slow or
+    fails (see fallback_search.py).
+
+    Args:
+        app: The Flask or Quart application, with its query embedder initialized.
+        asynchronous (bool, optional): Whether to create the asynchronous client. Defaults to False.
+
+    Returns:
+        The search client.
+
+    Raises:
+        ValueError: If SEARCH_BACKEND is unknown.
+    """
+    backend = app.config.get('SEARCH_BACKEND', 'elasticsearch')
+    if backend not in ('elasticsearch', 'local', 'fallback'):
+        raise ValueError(f"Unknown search backend: {backend}")
+
+    local_client = None
+    if backend in ('local', 'fallback'):
+        if asynchronous:
+            from app.search.local_search import AsyncLocalVectorSearch as local_class
+        else:
+            local_class = LocalVectorSearch
+        local_client = local_class(app.config['LOCAL_SEARCH_PATH'], app.query_embedder,
+                                   ivf_lists=app.config.get('LOCAL_SEARCH_IVF_LISTS', 0),
+                                   ivf_probes=app.config.get('LOCAL_SEARCH_IVF_PROBES', 8),
+                                   profiles=app.config.get('SEARCH_PROFILES'))
+        if backend == 'local':
+            return local_client
+
+    search_options = {}
+    if asynchronous:
+        from app.search.async_search import AsyncSearch as search_class
+    else:
+        search_class = Search
+        if backend == 'fallback':
+            # FallbackSearch checks the connection itself, and falls back instead of failing
+            search_options['check_connection'] = False
+    search_client = search_class(app.config['ELASTICSEARCH_URL'], os.getenv('ELASTICSEARCH_USER'), os.getenv('ELASTICSEARCH_PASSWORD'),
+                                 embedder=app.query_embedder, knn_oversample=app.config['KNN_OVERSAMPLE'],
+                                 knn_rescore=app.config['KNN_RESCORE'], knn_short_dims=app.config['KNN_SHORT_DIMS'],
+                                 profiles=app.config.get('SEARCH_PROFILES'), **search_options)
+    if backend == 'elasticsearch':
+        return search_client
+
+    if asynchronous:
+        from app.search.fallback_search import AsyncFallbackSearch as fallback_class
+    else:
+        from app.search.fallback_search import FallbackSearch as fallback_class
+    return fallback_class(search_client, local_client, timeout=app.config.get('SEARCH_FALLBACK_TIMEOUT', 2.0),
+                          cooldown=app.config.get('SEARCH_FALLBACK_COOLDOWN', 30.0))
+
+
+def init_session_cache(app):
+    """
+    Initialize the search session cache used for pagination and attach it to the app.
+
+    Shared by the WSGI app and the ASGI app. Sets `app.search_session_cache` to None
+    when SEARCH_SESSION_CACHE is disabled, in which case every page is searched.
+
+    Args:
+        app: The Flask or Quart application, already configured.
+    """
+    session_cache = None
+    if app.config.get('SEARCH_SESSION_CACHE', False):
+        session_cache = SearchSessionCache(
+            LRUCache(app.config.get('SEARCH_SESSION_CACHE_SIZE', 1000), app.config.get('SEARCH_SESSION_TTL')),
+            window=app.config.get('SEARCH_WINDOW', 50)
+        )
+    app.search_session_cache = session_cache
+
+
+def init_llm_components(app):
+    """
+    Initialize the LLM client, LLM dispatcher, snippet cache and snippet generator, and attach them to the app.
+
+    Shared by the WSGI app and the ASGI app.
+
+    Args:
+        app: The Flask or Quart application, already configured.
+    """
+    # Initialize LLM client
+    try:
+        llm_client = create_client(app.config['CLIENT_TYPE'], os.getenv('OPENAI_KEY')
+        )
+    except Exception as e:
+        app.logger.error(f'Failed to initialize LLM client: {e}')
+        sys.exit(1)
+
+    # Initialize the app-wide LLM dispatcher
+    llm_dispatcher = LLMDispatcher(
+        max_in_flight=app.config['LLM_MAX_IN_FLIGHT'],
+        requests_per_minute=app.config.get('LLM_REQUESTS_PER_MINUTE'),
+        tokens_per_minute=app.config.get('LLM_TOKENS_PER_MINUTE')
+    )
+
+    # Initialize snippet cache
+    try:
+        cache_backend = create_cache(
+            app.config.get('SNIPPET_CACHE_TYPE', 'none'),
+            max_size=app.config.get('SNIPPET_CACHE_SIZE', 10000),
+            ttl=app.config.get('SNIPPET_CACHE_TTL'),
+            path=app.config.get('SNIPPET_CACHE_PATH', '')
+        )
+    except Exception as e:
+        app.logger.error(f'Failed to initialize snippet cache: {e}')
+        sys.exit(1)
+    snippet_cache = SnippetCache(cache_backend) if cache_backend is not None else None
+
+    # Initialize SnippetGenerator
+    snippet_generator = SnippetGenerator(llm_client, app.config['MODEL'], cache=snippet_cache,
+                                         dispatcher=llm_dispatcher, deadline=app.config.get('SNIPPET_DEADLINE'),
+                                         batch_size=app.config.get('SNIPPET_BATCH_SIZE', 1))
+
+    app.llm_client = llm_client
+    app.llm_dispatcher = llm_dispatcher
+    app.snippet_cache = snippet_cache
+    app.snippet_generator = snippet_generator
+
+
 def create_app(config_class=Config):
     """
     Create and configure the Flask application.
@@ -36,28 +201,21 @@ def create_app(config_class=Config):
         app.logger.error('ELASTICSEARCH_URL not set in config.py')
         sys.exit(1)
 
-    try:
-        search_client = Search(app.config['ELASTICSEARCH_URL'], os.getenv('ELASTICSEARCH_USER'), os.getenv('ELASTICSEARCH_PASSWORD')
-        )
-    except Exception as e:
-        app.logger.error(f'Failed to initialize Elasticsearch client: {e}')
-        sys.exit(1)
+    init_embedder(app)
 
-    # Initialize LLM client
     try:
-        llm_client = create_client(app.config['CLIENT_TYPE'], os.getenv('OPENAI_KEY')
-        )
+        search_client = create_search_client(app)
     except Exception as e:
-        app.logger.error(f'Failed to initialize LLM client: {e}')
+        app.logger.error(f'Failed to initialize search client: {e}')
         sys.exit(1)
 
-    # Initialize SnippetGenerator
-    snippet_generator = SnippetGenerator(llm_client, app.config['MODEL'])
+    init_session_cache(app)
+    init_llm_components(app)
+    # Release the dispatcher's worker threads when the process exits
+    atexit.register(app.llm_dispatcher.shutdown, wait=False)
 
     # Attach clients to app
     app.elasticsearch = search_client
-    app.llm_client = llm_client
-    app.snippet_generator = snippet_generator
     app.index_name = app.config['INDEX_NAME']
 
     # Import and register blueprints
@@ -0,0 +1,64 @@
+"""
+Initialize the asynchronous (ASGI) variant of the application.
+
+Sets up a Quart app that shares configuration, templates and the LLM components
+with the Flask app, but executes searches with AsyncSearch (or AsyncLocalVectorSearch) and generates snippets
+with the async LLM clients. A single worker can therefore serve many concurrent
+searches, with the number of in-flight LLM calls bounded by the shared LLM dispatcher.
+"""
+
+import sys
+from quart import Quart
+from config import Config
+from app import create_search_client, init_embedder, init_llm_components, init_session_cache
+
+
+def create_async_app(config_class=Config):
+    """
+    Create and configure the Quart application.
+
+    Args:
+        config_class: The configuration class to use (default: Config)
+
+    Returns:
+        Quart: The configured Quart application
+    """
+    app = Quart(__name__)
+    app.config.from_object(config_class)
+
+    # Initialize Elasticsearch
+    if 'ELASTICSEARCH_URL' not in app.config:
+        app.logger.error('ELASTICSEARCH_URL not set in config.py')
+        sys.exit(1)
+
+    init_embedder(app)
+    try:
+        search_client = create_search_client(app, asynchronous=True)
+    except Exception as e:
+        app.logger.error(f'Failed to initialize search client: {e}')
+        sys.exit(1)
+
+    init_session_cache(app)
+    init_llm_components(app)
+
+    # Attach clients to app
+    app.elasticsearch = search_client
+    app.index_name = app.config['INDEX_NAME']
+
+    @app.before_serving
+    async def check_elasticsearch():
+        await search_client.check_connection()
+
+    @app.after_serving
+    async def close_elasticsearch():
+        await search_client.close()
+
+    @app.after_serving
+    async def shutdown_llm_dispatcher():
+        app.llm_dispatcher.shutdown(wait=False)
+
+    # Import and register blueprints
+    from app import async_routes
+    app.register_blueprint(async_routes.bp)
+
+    return app
@@ -0,0 +1,253 @@
+"""
+This module defines the routes for the Quart (ASGI) application.
+
+The routes mirror those in routes.py, but await the Elasticsearch client and the
+LLM calls instead of blocking a worker thread. Pages are served from the search
+session cache in the same way.
+
+Routes:
+    /: Handles both GET and POST requests for the main search functionality.
+    /api/search: Searches a batch of queries, returning JSON.
+    /document/<int:id>: Retrieves a specific document by ID.
+    /stats: Returns cache counters and LLM dispatcher metrics as JSON.
+"""
+
+from typing import AsyncIterator, Dict, List, Tuple
+import asyncio
+from quart import Blueprint, Response, render_template, request, current_app, abort, jsonify, stream_with_context
+from http import HTTPStatus
+from app.routes import PAGE_SIZE, SEARCH_FIELD, SEARCH_MODE, format_batch_result, format_event, parse_batch_request
+
+bp = Blueprint('main', __name__)
+
+
+def wants_event_stream() -> bool:
+    """
+    Check whether the search results should be streamed.
+
+    Returns:
+        bool: True if streaming is enabled and the client accepts Server-Sent Events.
+    """
+    return (current_app.config.get('STREAM_SNIPPETS', False)
+            and request.accept_mimetypes.best == 'text/event-stream')
+
+
+@bp.route('/', methods=['GET', 'POST'])
+async def handle_search():
+    """
+    Handle the main search functionality.
+
+    On GET: Render the search form.
+    On POST: Process the search query and return results, streamed if the
+    request accepts `text/event-stream`.
+
+    Returns:
+        str: Rendered HTML template with search results or form.
+    """
+    if request.method == 'POST':
+        form = await request.form
+        query = form.get('query', '').strip()
+        from_ = form.get('from_', type=int, default=0)
+
+        if not query:
+            return await render_template('results.html', error="Please enter a search query."), HTTPStatus.BAD_REQUEST
+
+        try:
+            search_results, total = await search_page(query, from_)
+
+            if wants_event_stream():
+                return await stream_search_results(search_results, query, from_, total)
+
+            results = await current_app.snippet_generator.agenerate_snippets(search_results, query)
+            prefetch_next_page(query, from_, total)
+
+            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                return await render_template('results.html', results=results, query=query, from_=from_, total=total)
+            else:
+                return await render_template('index.html', results=results, query=query, from_=from_, total=total)
+        except Exception as e:
+            current_app.logger.error(f"Search error: {str(e)}")
+            return await render_template('error.html', error="An error occurred during the search. Please try again."), HTTPStatus.INTERNAL_SERVER_ERROR
+
+    return await render_template('index.html')
+
+
+async def search_page(query: str, from_: int) -> Tuple[List[Dict], int]:
+    """
+    Get a page of search results, from the search session cache when possible.
+
+    Args:
+        query (str): The user's query.
+        from_ (int): The starting point for pagination.
+
+    Returns:
+        Tuple[List[Dict], int]: The hits of the page and the total number of matches.
+    """
+    search = current_app.elasticsearch
+    session_cache = current_app.search_session_cache
+    if session_cache is not None:
+        page = session_cache.get_page(query, SEARCH_MODE, SEARCH_FIELD, from_, PAGE_SIZE)
+        if page is not None:
+            return page
+
+    # full-text search does not use the query vector
+    query_vector = await search.aget_query_vector(query) if SEARCH_MODE != 'fulltext' else None
+    if session_cache is not None and session_cache.covers(from_, PAGE_SIZE):
+        query_args = search.get_query_args(SEARCH_MODE, query, session_cache.window, 0, field=SEARCH_FIELD,
+                                           query_vector=query_vector)
+        hits, total = await search.search(current_app.index_name, **query_args)
+        session_cache.set_window(query, SEARCH_MODE, SEARCH_FIELD, hits, total)
+        return hits[from_:from_ + PAGE_SIZE], total
+
+    query_args = search.get_query_args(SEARCH_MODE, query, PAGE_SIZE, from_, field=SEARCH_FIELD,
+                                       query_vector=query_vector)
+    return await search.search(current_app.index_name, **query_args)
+
+
+def prefetch_next_page(query: str, from_: int, total: int) -> None:
+    """
+    Start generating the snippets of the next page in the background, if it is in the cached window.
+
+    The prefetch calls run on the dispatcher's thread pool, so they do not hold up the event loop.
+
+    Args:
+        query (str): The user's query.
+        from_ (int): The starting point of the current page.
+        total (int): The total number of matches.
+    """
+    session_cache = current_app.search_session_cache
+    next_from = from_ + PAGE_SIZE
+    if (not current_app.config.get('PREFETCH_SNIPPETS', False) or session_cache is None
+            or next_from >= total or not session_cache.covers(next_from, PAGE_SIZE)):
+        return
+    window = session_cache.get_window(query, SEARCH_MODE, SEARCH_FIELD)
+    if window is None:
+        return
+    hits, _ = window
+    current_app.snippet_generator.prefetch_snippets(
+        hits[next_from:next_from + PAGE_SIZE], query,
+        max_queue_depth=current_app.config.get('PREFETCH_MAX_QUEUE_DEPTH', 0)
+    )
+
+
+async def stream_search_results(search_results: List[Dict], query: str, from_: int, total: int) -> Response:
+    """
+    Stream search results as Server-Sent Events.
+
+    Args:
+        search_results (List[Dict]): A list of search result dictionaries.
+        query (str): The user's query.
+        from_ (int): The starting point for pagination.
+        total (int): The total number of matches.
+
+    Returns:
+        Response: The streaming response.
+    """
+    snippet_generator = current_app.snippet_generator
+    placeholders = [snippet_generator.make_result(result) for result in search_results]
+
+    @stream_with_context
+    async def generate() -> AsyncIterator[str]:
+        html = await render_template('results.html', results=placeholders, query=query, from_=from_, total=total)
+        yield format_event('results', {'html': html})
+        try:
+            async for _, result in snippet_generator.aiter_snippets(search_results, query):
+                yield format_event('snippet', {'id': result['id'], 'html': await render_template('snippet.html', result=result)})
+            prefetch_next_page(query, from_, total)
+        except Exception as e:
+            current_app.logger.error(f"Snippet streaming error: {str(e)}")
+            yield format_event('error', {'message': "An error occurred while generating snippets."})
+        yield format_event('done', {})
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@bp.route('/api/search', methods=['POST'])
+async def batch_search():
+    """
+    Search a batch of queries, as batch_search in routes.py.
+
+    The snippets of all the queries are generated concurrently when asked for.
+
+    Returns:
+        Response: JSON with the query, total and hits of each query, in order.
+    """
+    try:
+        batch = parse_batch_request(await request.get_json(silent=True), current_app.config)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), HTTPStatus.BAD_REQUEST
+
+    search = current_app.elasticsearch
+    queries = batch['queries']
+    try:
+        vectors = await search.aget_query_vectors(queries) if batch['mode'] != 'fulltext' else [None] * len(queries)
+        queries_args = [search.get_query_args(batch['mode'], query, batch['size'], batch['from_'], field=SEARCH_FIELD,
+                                              query_vector=vector)
+                        for query, vector in zip(queries, vectors)]
+        # snippets need the whole source
+        results = await search.search_many(current_app.index_name, queries_args,
+                                           source=batch['source'] if batch['snippets'] == 'none' else None)
+    except Exception as e:
+        current_app.logger.error(f"Batch search error: {str(e)}")
+        return jsonify({'error': "An error occurred during the search. Please try again."}), HTTPStatus.INTERNAL_SERVER_ERROR
+
+    snippet_generator = current_app.snippet_generator
+    if batch['snippets'] == 'generate':
+        snippets = await asyncio.gather(*[snippet_generator.agenerate_snippets(result[0], query) if result else asyncio.sleep(0)
+                                          for query, result in zip(queries, results)])
+        formatted = [format_batch_result(query, result, batch['source'], snippets=query_snippets if result else None)
+                     for query, result, query_snippets in zip(queries, results, snippets)]
+    elif batch['snippets'] == 'defer':
+        max_queue_depth = current_app.config.get('BATCH_MAX_QUEUE_DEPTH', 1000)
+        formatted = [format_batch_result(query, result, batch['source'],
+                                         deferred=snippet_generator.prefetch_snippets(result[0], query, max_queue_depth=max_queue_depth) if result else 0)
+                     for query, result in zip(queries, results)]
+    else:
+        formatted = [format_batch_result(query, result, batch['source']) for query, result in zip(queries, results)]
+    return jsonify({'results': formatted})
+
+
+@bp.route('/document/<int:id>')
+async def get_document(id):
+    """
+    Retrieve and display a specific document.
+
+    Args:
+        id (int): The ID of the document to retrieve.
+
+    Returns:
+        str: Rendered HTML template with the document details.
+
+    Raises:
+        HTTPException: 404 if the document is not found.
+    """
+    try:
+        document = await current_app.elasticsearch.retrieve_document(current_app.index_name, str(id))
+    except Exception as e:
+        current_app.logger.error(f"Error retrieving document {id}: {str(e)}")
+        abort(HTTPStatus.INTERNAL_SERVER_ERROR)
+    if not document:
+        abort(HTTPStatus.NOT_FOUND)
+    return await render_template('document.html', grant=document['_source'])
+
+
+@bp.route('/stats')
+async def get_stats():
+    """
+    Report cache counters and LLM dispatcher metrics.
+
+    Returns:
+        Response: JSON with the hit and miss counters of the snippet cache, the query embedding
+        cache and the search session cache, and the queue depth, in-flight calls and wait times
+        of the LLM dispatcher.
+    """
+    snippet_cache = current_app.snippet_cache
+    query_embedder = current_app.query_embedder
+    session_cache = current_app.search_session_cache
+    return jsonify({
+        'snippet_cache': snippet_cache.stats() if snippet_cache is not None else None,
+        'search_session_cache': session_cache.stats() if session_cache is not None else None,
+        'query_embeddings': query_embedder.stats() if query_embedder is not None else None,
+        'llm_dispatcher': current_app.llm_dispatcher.stats(),
+    })
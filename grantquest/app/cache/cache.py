@@ -0,0 +1,391 @@
+"""
+This module provides key-value cache backends used across the application.
+
+Each cache stores JSON-serializable values under string keys, with an optional
+time-to-live and an optional group tag. Groups allow all entries belonging to
+the same object (for example, every cached snippet of one grant) to be evicted
+in a single call. All backends keep hit, miss and eviction counters.
+
+Classes:
+    BaseCache: Abstract base class for cache backends.
+    LRUCache: In-process least-recently-used cache with TTL.
+    SQLiteCache: On-disk cache backed by SQLite that survives restarts.
+
+Functions:
+    normalize_query: Normalize a query string for use in cache keys.
+    create_cache: Factory function to create the appropriate cache based on the cache type.
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Union
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a query string for use in cache keys.
+
+    Lowercases the query and collapses runs of whitespace, so that trivially
+    different spellings of the same query share cache entries.
+
+    Args:
+        query (str): The user's query.
+
+    Returns:
+        str: The normalized query.
+    """
+    return re.sub(r'\s+', ' ', query).strip().lower()
+
+
+class BaseCache(ABC):
+    """
+    Abstract base class for cache backends.
+
+    This class defines the common interface and the shared hit/miss accounting
+    for all cache implementations.
+
+    Attributes:
+        ttl (Optional[float]): Default time-to-live of entries in seconds, or None for no expiry.
+        hits (int): Number of lookups that returned a value.
+        misses (int): Number of lookups that returned nothing.
+        evictions (int): Number of entries removed by expiry, size limits or invalidation.
+    """
+
+    def __init__(self, ttl: Optional[float] = None):
+        """
+        Initialize the BaseCache.
+
+        Args:
+            ttl (Optional[float], optional): Default time-to-live of entries in seconds. Defaults to None.
+        """
+        self.ttl: Optional[float] = ttl
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self._stats_lock = threading.Lock()
+
+    @abstractmethod
+    def _get(self, key: str) -> Optional[Any]:
+        """
+        Look up a key without touching the counters.
+
+        Args:
+            key (str): The key to look up.
+
+        Returns:
+            Optional[Any]: The cached value, or None if absent or expired.
+        """
+        raise NotImplementedError("Subclasses must implement _get method")
+
+    @abstractmethod
+    def set(self, key: str, value: Any, group: Optional[str] = None, ttl: Optional[float] = None) -> None:
+        """
+        Store a value.
+
+        Args:
+            key (str): The key to store the value under.
+            value (Any): A JSON-serializable value.
+            group (Optional[str], optional): A tag used for bulk invalidation. Defaults to None.
+            ttl (Optional[float], optional): Time-to-live overriding the default. Defaults to None.
+        """
+        raise NotImplementedError("Subclasses must implement set method")
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """
+        Remove a single entry.
+
+        Args:
+            key (str): The key to remove.
+        """
+        raise NotImplementedError("Subclasses must implement delete method")
+
+    @abstractmethod
+    def delete_group(self, group: str) -> int:
+        """
+        Remove every entry tagged with the given group.
+
+        Args:
+            group (str): The group tag.
+
+        Returns:
+            int: The number of entries removed.
+        """
+        raise NotImplementedError("Subclasses must implement delete_group method")
+
+    @abstractmethod
+    def clear(self) -> None:
+        """
+        Remove every entry.
+        """
+        raise NotImplementedError("Subclasses must implement clear method")
+
+    @abstractmethod
+    def __len__(self) -> int:
+        raise NotImplementedError("Subclasses must implement __len__ method")
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Look up a key and record a hit or a miss.
+
+        Args:
+            key (str): The key to look up.
+
+        Returns:
+            Optional[Any]: The cached value, or None if absent or expired.
+        """
+        value = self._get(key)
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def _record_evictions(self, count: int) -> None:
+        with self._stats_lock:
+            self.evictions += count
+
+    def _expiry(self, ttl: Optional[float]) -> Optional[float]:
+        ttl = self.ttl if ttl is None else ttl
+        return time.time() + ttl if ttl else None
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        """
+        Get the cache counters.
+
+        Returns:
+            Dict[str, Union[int, float]]: Hits, misses, evictions, hit rate and current size.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'size': len(self),
+        }
+
+
+class LRUCache(BaseCache):
+    """
+    In-process least-recently-used cache with TTL.
+
+    Entries are kept in an OrderedDict; the least recently used entry is dropped
+    once max_size is reached. A group index makes delete_group proportional to
+    the size of the group rather than the size of the cache.
+
+    Attributes:
+        max_size (int): Maximum number of entries held.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: Optional[float] = None):
+        """
+        Initialize the LRUCache.
+
+        Args:
+            max_size (int, optional): Maximum number of entries held. Defaults to 10000.
+            ttl (Optional[float], optional): Default time-to-live of entries in seconds. Defaults to None.
+        """
+        super().__init__(ttl)
+        self.max_size: int = max_size
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._groups: Dict[str, set] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at, _ = entry
+            if expires_at is not None and expires_at < time.time():
+                self._remove(key)
+                self._record_evictions(1)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, group: Optional[str] = None, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, self._expiry(ttl), group)
+            if group is not None:
+                self._groups.setdefault(group, set()).add(key)
+            evicted = 0
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                evicted += 1
+        if evicted:
+            self._record_evictions(evicted)
+
+    def _remove(self, key: str) -> None:
+        # callers must hold self._lock
+        _, _, group = self._entries.pop(key)
+        if group is not None:
+            keys = self._groups.get(group)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._groups[group]
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def delete_group(self, group: str) -> int:
+        with self._lock:
+            keys = list(self._groups.get(group, ()))
+            for key in keys:
+                self._remove(key)
+        if keys:
+            self._record_evictions(len(keys))
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._groups.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCache(BaseCache):
+    """
+    On-disk cache backed by a single SQLite table.
+
+    Values are stored as JSON. The database runs in WAL mode so that concurrent
+    readers from request threads do not block each other, and each thread uses
+    its own connection.
+
+    Attributes:
+        path (str): Path of the SQLite database file.
+    """
+
+    def __init__(self, path: str, ttl: Optional[float] = None):
+        """
+        Initialize the SQLiteCache, creating the database file if needed.
+
+        Args:
+            path (str): Path of the SQLite database file.
+            ttl (Optional[float], optional): Default time-to-live of entries in seconds. Defaults to None.
+        """
+        super().__init__(ttl)
+        self.path: str = path
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, grp TEXT, expires_at REAL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS cache_grp ON cache (grp)')
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            self._local.conn = conn
+        return conn
+
+    def _get(self, key: str) -> Optional[Any]:
+        conn = self._connection()
+        row = conn.execute('SELECT value, expires_at FROM cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at < time.time():
+            self.delete(key)
+            self._record_evictions(1)
+            return None
+        return json.loads(value)
+
+    def set(self, key: str, value: Any, group: Optional[str] = None, ttl: Optional[float] = None) -> None:
+        conn = self._connection()
+        conn.execute(
+            'INSERT OR REPLACE INTO cache (key, value, grp, expires_at) VALUES (?, ?, ?, ?)',
+            (key, json.dumps(value), group, self._expiry(ttl))
+        )
+        conn.commit()
+
+    def delete(self, key: str) -> None:
+        conn = self._connection()
+        conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+        conn.commit()
+
+    def delete_group(self, group: str) -> int:
+        conn = self._connection()
+        removed = conn.execute('DELETE FROM cache WHERE grp = ?', (group,)).rowcount
+        conn.commit()
+        if removed:
+            self._record_evictions(removed)
+        return removed
+
+    def purge_expired(self) -> int:
+        """
+        Remove every expired entry.
+
+        Returns:
+            int: The number of entries removed.
+        """
+        conn = self._connection()
+        removed = conn.execute('DELETE FROM cache WHERE expires_at < ?', (time.time(),)).rowcount
+        conn.commit()
+        if removed:
+            self._record_evictions(removed)
+        return removed
+
+    def clear(self) -> None:
+        conn = self._connection()
+        conn.execute('DELETE FROM cache')
+        conn.commit()
+
+    def __len__(self) -> int:
+        return self._connection().execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+
+def create_cache(cache_type: str, max_size: int = 10000, ttl: Optional[float] = None,
+                 path: str = '') -> Optional[BaseCache]:
+    """
+    Factory function to create the appropriate cache based on the cache type.
+
+    Args:
+        cache_type (str): The type of cache to create ('lru', 'sqlite' or 'none').
+        max_size (int, optional): Maximum number of entries (LRU only). Defaults to 10000.
+        ttl (Optional[float], optional): Default time-to-live of entries in seconds. Defaults to None.
+        path (str, optional): Database file path (SQLite only).
+
+    Returns:
+        Optional[BaseCache]: The cache instance, or None if caching is disabled.
+
+    Raises:
+        ValueError: If an invalid cache type is provided.
+    """
+    if not cache_type or cache_type == 'none':
+        return None
+    elif cache_type == 'lru':
+        return LRUCache(max_size, ttl)
+    elif cache_type == 'sqlite':
+        if not path:
+            raise ValueError("A path is required for the sqlite cache")
+        return SQLiteCache(path, ttl)
+    else:
+        raise ValueError(f"Invalid cache type: {cache_type}")
@@ -3,7 +3,8 @@ This module provides client classes for interacting with various LLM APIs.
 
 It includes a base abstract class and specific implementations for OpenAI, Ollama,
 HuggingFace, and Litellm clients. Each client handles API calls, token encoding/decoding,
-and implements retry logic for improved reliability.
+and implements retry logic for improved reliability. Every client offers both a blocking
+`chat` method and an asynchronous `achat` method for use in the ASGI app.
 
 Classes:
     BaseClient: Abstract base class for LLM clients.
@@ -19,7 +20,7 @@ Functions:
 import os
 import logging
 from abc import ABC, abstractmethod
-from typing import List, Any, Callable, Dict, Union
+from typing import List, Any, Awaitable, Callable, Dict, Union
 from tenacity import retry, stop_after_attempt, wait_exponential
 from dotenv import load_dotenv
 
@@ -111,6 +112,24 @@ class BaseClient(ABC):
         """
         raise NotImplementedError("Subclasses must implement decode method")
 
+    async def _make_async_api_call(self, *args: Any, **kwargs: Any) -> Dict[str, Any]:
+        """
+        Make an asynchronous API call to the LLM service.
+
+        This method should be implemented by subclasses that support async usage.
+
+        Args:
+            *args: Variable length argument list.
+            **kwargs: Arbitrary keyword arguments.
+
+        Returns:
+            Dict[str, Any]: The response from the API call.
+
+        Raises:
+            NotImplementedError: If the method is not implemented by a subclass.
+        """
+        raise NotImplementedError("Subclasses must implement _make_async_api_call method for async usage")
+
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=0.5, min=0.5, max=2))
     def _retry_with_tenacity(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
         """
@@ -136,6 +155,28 @@ class BaseClient(ABC):
             logger.error(f"Error in API call: {str(e)}")
             raise
 
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=0.5, min=0.5, max=2))
+    async def _aretry_with_tenacity(self, func: Callable[..., Awaitable[Any]], *args: Any, **kwargs: Any) -> Any:
+        """
+        Retry a coroutine function with exponential backoff.
+
+        Args:
+            func (Callable): The coroutine function to retry.
+            *args: Variable length argument list for the function.
+            **kwargs: Arbitrary keyword arguments for the function.
+
+        Returns:
+            Any: The result of the function call.
+
+        Raises:
+            Exception: If all retry attempts fail.
+        """
+        try:
+            return await func(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"Error in API call: {str(e)}")
+            raise
+
     def chat(self, *args: Any, **kwargs: Any) -> str:
         """
         Initiate a chat interaction with the LLM.
@@ -159,6 +200,29 @@ class BaseClient(ABC):
             logger.error(f"Chat interaction failed: {str(e)}")
             raise
 
+    async def achat(self, *args: Any, **kwargs: Any) -> str:
+        """
+        Initiate a chat interaction with the LLM without blocking the event loop.
+
+        This method wraps the asynchronous API call with retry logic for improved reliability.
+
+        Args:
+            *args: Variable length argument list.
+            **kwargs: Arbitrary keyword arguments.
+
+        Returns:
+            str: The response from the LLM.
+
+        Raises:
+            Exception: If the API call fails after all retry attempts.
+        """
+        try:
+            response = await self._aretry_with_tenacity(self._make_async_api_call, *args, **kwargs)
+            return response
+        except Exception as e:
+            logger.error(f"Async chat interaction failed: {str(e)}")
+            raise
+
 
 class OpenAIClient(BaseClient):
     """
@@ -169,6 +233,7 @@ class OpenAIClient(BaseClient):
 
     Attributes:
         client (OpenAI): The OpenAI client instance.
+        async_client (AsyncOpenAI): The asynchronous OpenAI client instance.
         tokenizer (Encoding): The tokenizer for encoding/decoding messages.
     """
 
@@ -182,10 +247,11 @@ class OpenAIClient(BaseClient):
             max_output_len (int, optional): Maximum output length. Defaults to MAX_OUTPUT_LEN.
         """
         super().__init__(api_key, max_input_len, max_output_len)
-        from openai import OpenAI
+        from openai import OpenAI, AsyncOpenAI
         from tiktoken import get_encoding
         
         self.client: OpenAI = OpenAI(api_key=self.api_key)
+        self.async_client: AsyncOpenAI = AsyncOpenAI(api_key=self.api_key)
         self.tokenizer = get_encoding("cl100k_base")
 
     def encode(self, message: str) -> List[int]:
@@ -238,6 +304,32 @@ class OpenAIClient(BaseClient):
             logger.error(f"OpenAI API call failed: {str(e)}")
             raise
 
+    async def _make_async_api_call(self, *args: Any, **kwargs: Any) -> Dict[str, Any]:
+        """
+        Make an asynchronous API call to OpenAI's chat completions endpoint.
+
+        Args:
+            *args: Variable length argument list.
+            **kwargs: Arbitrary keyword arguments.
+
+        Returns:
+            Dict[str, Any]: The API response.
+
+        Raises:
+            Exception: If the API call fails.
+        """
+        try:
+            completion = await self.async_client.chat.completions.create(
+                *args, 
+                **kwargs, 
+                timeout=API_TIMEOUT, 
+                max_tokens=self.max_output_len
+            )
+            return completion.choices[0].message.content
+        except Exception as e:
+            logger.error(f"OpenAI API call failed: {str(e)}")
+            raise
+
 
 class OllamaClient(BaseClient):
     """
@@ -249,6 +341,7 @@ class OllamaClient(BaseClient):
     Attributes:
         api_base (str): The base URL for the ollama API.
         client (OpenAI): The OpenAI-compatible client instance for ollama.
+        async_client (AsyncOpenAI): The asynchronous OpenAI-compatible client instance for ollama.
         tokenizer (AutoTokenizer): The tokenizer for encoding/decoding messages.
     """
 
@@ -265,11 +358,12 @@ class OllamaClient(BaseClient):
             max_output_len (int, optional): Maximum output length. Defaults to MAX_OUTPUT_LEN.
         """
         super().__init__(api_key, max_input_len, max_output_len)
-        from openai import OpenAI
+        from openai import OpenAI, AsyncOpenAI
         from transformers import AutoTokenizer
 
         self.api_base: str = api_base
         self.client: OpenAI = OpenAI(base_url=f"{self.api_base}", api_key=self.api_key)
+        self.async_client: AsyncOpenAI = AsyncOpenAI(base_url=f"{self.api_base}", api_key=self.api_key)
         self.tokenizer = AutoTokenizer.from_pretrained(f"meta-llama/{model_name}")
 
     def encode(self, message: str) -> List[int]:
@@ -322,6 +416,32 @@ class OllamaClient(BaseClient):
             logger.error(f"ollama API call failed: {str(e)}")
             raise
 
+    async def _make_async_api_call(self, *args: Any, **kwargs: Any) -> Dict[str, Any]:
+        """
+        Make an asynchronous API call to ollama's chat completions endpoint.
+
+        Args:
+            *args: Variable length argument list.
+            **kwargs: Arbitrary keyword arguments.
+
+        Returns:
+            Dict[str, Any]: The API response.
+
+        Raises:
+            Exception: If the API call fails.
+        """
+        try:
+            completion = await self.async_client.chat.completions.create(
+                *args, 
+                **kwargs, 
+                timeout=API_TIMEOUT, 
+                max_tokens=self.max_output_len
+            )
+            return completion.choices[0].message.content
+        except Exception as e:
+            logger.error(f"ollama API call failed: {str(e)}")
+            raise
+
 
 class HFLlamaClient(BaseClient):
     """
@@ -333,6 +453,7 @@ class HFLlamaClient(BaseClient):
     Attributes:
         api_base (str): The base URL for the HuggingFace inference endpoint.
         client (OpenAI): The OpenAI-compatible client instance for HuggingFace inference endpoint.
+        async_client (AsyncOpenAI): The asynchronous OpenAI-compatible client instance for HuggingFace inference endpoint.
         tokenizer (AutoTokenizer): The tokenizer for encoding/decoding messages.
     """
 
@@ -349,11 +470,12 @@ class HFLlamaClient(BaseClient):
             max_output_len (int, optional): Maximum output length. Defaults to MAX_OUTPUT_LEN.
         """
         super().__init__(api_key, max_input_len, max_output_len)
-        from openai import OpenAI
+        from openai import OpenAI, AsyncOpenAI
         from transformers import AutoTokenizer
 
         self.api_base: str = api_base
         self.client: OpenAI = OpenAI(base_url=f"{self.api_base}", api_key=self.api_key)
+        self.async_client: AsyncOpenAI = AsyncOpenAI(base_url=f"{self.api_base}", api_key=self.api_key)
         self.tokenizer = AutoTokenizer.from_pretrained(f"meta-llama/{model_name}")
 
     def encode(self, message: str) -> List[int]:
@@ -406,6 +528,32 @@ class HFLlamaClient(BaseClient):
             logger.error(f"HuggingFace API call failed: {str(e)}")
             raise
 
+    async def _make_async_api_call(self, *args: Any, **kwargs: Any) -> Dict[str, Any]:
+        """
+        Make an asynchronous API call to HuggingFace's chat completions endpoint.
+
+        Args:
+            *args: Variable length argument list.
+            **kwargs: Arbitrary keyword arguments.
+
+        Returns:
+            Dict[str, Any]: The API response.
+
+        Raises:
+            Exception: If the API call fails.
+        """
+        try:
+            completion = await self.async_client.chat.completions.create(
+                *args, 
+                **kwargs, 
+                timeout=API_TIMEOUT, 
+                max_tokens=self.max_output_len
+            )
+            return completion.choices[0].message.content
+        except Exception as e:
+            logger.error(f"HuggingFace API call failed: {str(e)}")
+            raise
+
 
 
 class LitellmClient(BaseClient):
@@ -494,6 +642,36 @@ class LitellmClient(BaseClient):
             logger.error(f"Litellm API call failed: {str(e)}")
             raise
 
+    async def _make_async_api_call(self, *args: Any, **kwargs: Any) -> Dict[str, Any]:
+        """
+        Make an asynchronous API call using Litellm.
+
+        Args:
+            *args: Variable length argument list.
+            **kwargs: Arbitrary keyword arguments.
+
+        Returns:
+            Dict[str, Any]: The API response.
+
+        Raises:
+            Exception: If the API call fails.
+        """
+        try:
+            from litellm import acompletion
+            response = await acompletion(
+                model=self.model_name,
+                api_key=self.api_key, 
+                api_base=self.api_base, 
+                *args, 
+                **kwargs,
+                max_tokens=self.max_output_len,
+                request_timeout=API_TIMEOUT
+            )
+            return response.choices[0].message.content
+        except Exception as e:
+            logger.error(f"Litellm API call failed: {str(e)}")
+            raise
+
 
 def create_client(client_type: str, api_key: str, api_base: str = "", model_name: str = "", 
                   max_input_len: int = MAX_INPUT_LEN, max_output_len: int = MAX_OUTPUT_LEN) -> Union[OpenAIClient, OllamaClient, HFLlamaClient, LitellmClient]:
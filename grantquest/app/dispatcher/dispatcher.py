@@ -0,0 +1,334 @@
+"""
+This module provides an LLMDispatcher class that runs every LLM call of the application.
+
+A single dispatcher is created by the app factory and shared by all requests. It bounds
+the number of calls in flight, paces them with a token-bucket rate limiter sized to the
+provider's requests-per-minute and tokens-per-minute limits, and sheds calls that could
+not start before their deadline. Queue depth, in-flight calls and wait times are
+exported through `stats`.
+
+Classes:
+    DeadlineExceeded: Raised when a call is shed because its deadline passed.
+    RateLimiter: Token-bucket limiter for requests and tokens per minute.
+    LLMDispatcher: Long-lived, bounded executor for LLM calls.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# Used when no limit is passed; the app passes Config.LLM_MAX_IN_FLIGHT
+DEFAULT_MAX_IN_FLIGHT = 32
+
+# Load configuration from environment variables
+# seconds of sustained throughput a rate limiter allows in a single burst
+RATE_LIMIT_BURST_SECONDS = float(os.getenv('RATE_LIMIT_BURST_SECONDS', 10))
+WAIT_SAMPLES = 1000
+
+
+class DeadlineExceeded(Exception):
+    """Raised when an LLM call is shed because it could not start before its deadline."""
+
+
+class RateLimiter:
+    """
+    Token-bucket rate limiter for requests per minute and tokens per minute.
+
+    Both buckets refill continuously and are debited together, so a call is only
+    admitted when it fits in both.
+
+    Attributes:
+        requests_per_minute (Optional[float]): The request limit, or None for no limit.
+        tokens_per_minute (Optional[float]): The token limit, or None for no limit.
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 burst_seconds: float = RATE_LIMIT_BURST_SECONDS):
+        """
+        Initialize the RateLimiter.
+
+        Args:
+            requests_per_minute (Optional[float], optional): The request limit. Defaults to None.
+            tokens_per_minute (Optional[float], optional): The token limit. Defaults to None.
+            burst_seconds (float, optional): Seconds of throughput allowed in one burst. Defaults to RATE_LIMIT_BURST_SECONDS.
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._buckets = {}
+        for name, per_minute in (('requests', requests_per_minute), ('tokens', tokens_per_minute)):
+            if per_minute:
+                rate = per_minute / 60.0
+                capacity = max(1.0, rate * burst_seconds)
+                self._buckets[name] = {'rate': rate, 'capacity': capacity, 'level': capacity}
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, tokens: int) -> float:
+        """
+        Admit a call if both buckets allow it.
+
+        Args:
+            tokens (int): The estimated number of tokens of the call.
+
+        Returns:
+            float: 0 if the call was admitted, otherwise the number of seconds to wait before retrying.
+        """
+        amounts = {'requests': 1, 'tokens': tokens}
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._last_refill
+            self._last_refill = now
+
+            wait = 0.0
+            for name, bucket in self._buckets.items():
+                bucket['level'] = min(bucket['capacity'], bucket['level'] + elapsed * bucket['rate'])
+                # a single call larger than the bucket is admitted once the bucket is full
+                amount = min(amounts[name], bucket['capacity'])
+                if bucket['level'] < amount:
+                    wait = max(wait, (amount - bucket['level']) / bucket['rate'])
+            if wait > 0:
+                return wait
+
+            for name, bucket in self._buckets.items():
+                bucket['level'] -= min(amounts[name], bucket['capacity'])
+            return 0.0
+
+    def acquire(self, tokens: int = 0, deadline: Optional[float] = None) -> bool:
+        """
+        Block until a call is admitted.
+
+        Args:
+            tokens (int, optional): The estimated number of tokens of the call. Defaults to 0.
+            deadline (Optional[float], optional): A `time.monotonic()` deadline. Defaults to None.
+
+        Returns:
+            bool: True if the call was admitted, False if it could not be admitted before the deadline.
+        """
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait == 0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(min(wait, 1.0))
+
+    async def aacquire(self, tokens: int = 0, deadline: Optional[float] = None) -> bool:
+        """
+        Wait without blocking the event loop until a call is admitted.
+
+        Args:
+            tokens (int, optional): The estimated number of tokens of the call. Defaults to 0.
+            deadline (Optional[float], optional): A `time.monotonic()` deadline. Defaults to None.
+
+        Returns:
+            bool: True if the call was admitted, False if it could not be admitted before the deadline.
+        """
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait == 0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(min(wait, 1.0))
+
+
+class LLMDispatcher:
+    """
+    A long-lived, bounded executor for LLM calls shared by all requests.
+
+    Blocking calls run on a fixed-size thread pool; coroutine calls are bounded by a
+    semaphore of the same size. Calls that cannot start (or pass the rate limiter)
+    before their deadline raise DeadlineExceeded instead of adding load.
+
+    Attributes:
+        max_in_flight (int): Maximum number of calls running at once.
+        rate_limiter (Optional[RateLimiter]): The rate limiter, if any limits are configured.
+    """
+
+    def __init__(self, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT, requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None):
+        """
+        Initialize the LLMDispatcher.
+
+        Args:
+            max_in_flight (int, optional): Maximum number of calls running at once. Defaults to DEFAULT_MAX_IN_FLIGHT.
+            requests_per_minute (Optional[float], optional): The provider's request limit. Defaults to None.
+            tokens_per_minute (Optional[float], optional): The provider's token limit. Defaults to None.
+        """
+        self.max_in_flight = max_in_flight
+        self.rate_limiter = (RateLimiter(requests_per_minute, tokens_per_minute)
+                             if requests_per_minute or tokens_per_minute else None)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='llm-dispatcher')
+        self._async_semaphore: Optional[asyncio.Semaphore] = None
+
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._in_flight = 0
+        self._counters = {'submitted': 0, 'completed': 0, 'failed': 0, 'shed': 0}
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of calls waiting for a free slot."""
+        return self._queued
+
+    def _start(self, enqueued_at: float) -> None:
+        with self._lock:
+            self._queued -= 1
+            self._in_flight += 1
+            self._waits.append(time.monotonic() - enqueued_at)
+
+    def _finish(self, outcome: str) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            self._counters[outcome] += 1
+
+    @staticmethod
+    def _check_deadline(deadline: Optional[float]) -> None:
+        if deadline is not None and time.monotonic() > deadline:
+            raise DeadlineExceeded("Deadline passed while queued")
+
+    def submit(self, func: Callable[..., Any], *args: Any, tokens: int = 0,
+               deadline: Optional[float] = None, **kwargs: Any) -> Future:
+        """
+        Schedule a blocking LLM call.
+
+        Args:
+            func (Callable): The function making the call.
+            *args: Variable length argument list for the function.
+            tokens (int, optional): The estimated number of tokens of the call, for the rate limiter. Defaults to 0.
+            deadline (Optional[float], optional): A `time.monotonic()` deadline after which the call is shed.
+            **kwargs: Arbitrary keyword arguments for the function.
+
+        Returns:
+            Future: A future resolving to the result of the function, or to DeadlineExceeded if the call was shed.
+        """
+        enqueued_at = time.monotonic()
+        with self._lock:
+            self._queued += 1
+            self._counters['submitted'] += 1
+
+        def run() -> Any:
+            self._start(enqueued_at)
+            outcome = 'failed'
+            try:
+                self._check_deadline(deadline)
+                if self.rate_limiter is not None and not self.rate_limiter.acquire(tokens, deadline):
+                    raise DeadlineExceeded("Rate limit not available before deadline")
+                result = func(*args, **kwargs)
+                outcome = 'completed'
+                return result
+            except DeadlineExceeded:
+                outcome = 'shed'
+                raise
+            finally:
+                self._finish(outcome)
+
+        future = self._executor.submit(run)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future: Future) -> None:
+        # calls cancelled before they started never left the queue
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+                self._counters['shed'] += 1
+
+    async def run_async(self, func: Callable[..., Awaitable[Any]], *args: Any, tokens: int = 0,
+                        deadline: Optional[float] = None, **kwargs: Any) -> Any:
+        """
+        Run a coroutine LLM call within the dispatcher's limits.
+
+        Args:
+            func (Callable): The coroutine function making the call.
+            *args: Variable length argument list for the function.
+            tokens (int, optional): The estimated number of tokens of the call, for the rate limiter. Defaults to 0.
+            deadline (Optional[float], optional): A `time.monotonic()` deadline after which the call is shed.
+            **kwargs: Arbitrary keyword arguments for the function.
+
+        Returns:
+            Any: The result of the function.
+
+        Raises:
+            DeadlineExceeded: If the call could not start before its deadline.
+        """
+        if self._async_semaphore is None:
+            self._async_semaphore = asyncio.Semaphore(self.max_in_flight)
+        enqueued_at = time.monotonic()
+        with self._lock:
+            self._queued += 1
+            self._counters['submitted'] += 1
+
+        try:
+            timeout = None if deadline is None else max(0.0, deadline - enqueued_at)
+            await asyncio.wait_for(self._async_semaphore.acquire(), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                self._queued -= 1
+                self._counters['shed'] += 1
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise DeadlineExceeded("Deadline passed while queued")
+
+        self._start(enqueued_at)
+        outcome = 'failed'
+        try:
+            self._check_deadline(deadline)
+            if self.rate_limiter is not None and not await self.rate_limiter.aacquire(tokens, deadline):
+                raise DeadlineExceeded("Rate limit not available before deadline")
+            result = await func(*args, **kwargs)
+            outcome = 'completed'
+            return result
+        except (DeadlineExceeded, asyncio.CancelledError):
+            outcome = 'shed'
+            raise
+        finally:
+            self._finish(outcome)
+            self._async_semaphore.release()
+
+    def stats(self) -> Dict[str, Union[int, float, None]]:
+        """
+        Get the dispatcher metrics.
+
+        Returns:
+            Dict[str, Union[int, float, None]]: Queue depth, in-flight calls, call counters and
+            queue wait times (in milliseconds) over the most recent calls.
+        """
+        with self._lock:
+            waits = sorted(self._waits)
+            stats = {
+                'queue_depth': self._queued,
+                'in_flight': self._in_flight,
+                'max_in_flight': self.max_in_flight,
+                **self._counters,
+            }
+        if waits:
+            stats.update({
+                'wait_ms_avg': 1000 * sum(waits) / len(waits),
+                'wait_ms_p50': 1000 * waits[len(waits) // 2],
+                'wait_ms_p95': 1000 * waits[min(len(waits) - 1, int(len(waits) * 0.95))],
+                'wait_ms_max': 1000 * waits[-1],
+            })
+        else:
+            stats.update({'wait_ms_avg': None, 'wait_ms_p50': None, 'wait_ms_p95': None, 'wait_ms_max': None})
+        return stats
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stop accepting calls and release the worker threads.
+
+        Args:
+            wait (bool, optional): Whether to wait for running calls to finish. Defaults to True.
+        """
+        self._executor.shutdown(wait=wait, cancel_futures=True)
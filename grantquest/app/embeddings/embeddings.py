@@ -0,0 +1,311 @@
+"""
+This module provides embedder classes for computing query vectors on the client side.
+
+Computing query vectors in the application, instead of through an Elasticsearch
+`query_vector_builder`, lets repeated queries and pagination reuse a cached vector
+rather than paying the embedding round trip on every search.
+
+Classes:
+    BaseEmbedder: Abstract base class for query embedders.
+    OpenAIEmbedder: Embedder backed by OpenAI's embeddings API.
+    CachedEmbedder: Wraps an embedder with an in-process cache and an optional persistent store.
+
+Functions:
+    create_embedder: Factory function to create the appropriate embedder based on the embedder type.
+"""
+
+import os
+import asyncio
+import hashlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Union
+from tenacity import retry, stop_after_attempt, wait_exponential
+from app.cache.cache import BaseCache, normalize_query
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# Load configuration from environment variables
+EMBEDDING_TIMEOUT = int(os.getenv('EMBEDDING_TIMEOUT', 10))
+
+
+class BaseEmbedder(ABC):
+    """
+    Abstract base class for query embedders.
+
+    Attributes:
+        model_name (str): The name of the embedding model.
+        dimensions (Optional[int]): The requested number of dimensions, or None for the model default.
+    """
+
+    def __init__(self, model_name: str, dimensions: Optional[int] = None):
+        """
+        Initialize the BaseEmbedder.
+
+        Args:
+            model_name (str): The name of the embedding model.
+            dimensions (Optional[int], optional): The requested number of dimensions. Defaults to None.
+        """
+        self.model_name: str = model_name
+        self.dimensions: Optional[int] = dimensions
+
+    @abstractmethod
+    def embed_many(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed several texts in one request.
+
+        Args:
+            texts (List[str]): The texts to embed.
+
+        Returns:
+            List[List[float]]: The embeddings, in the order of the texts.
+
+        Raises:
+            NotImplementedError: If the method is not implemented by a subclass.
+        """
+        raise NotImplementedError("Subclasses must implement embed_many method")
+
+    def embed(self, text: str) -> List[float]:
+        """
+        Embed a single text.
+
+        Args:
+            text (str): The text to embed.
+
+        Returns:
+            List[float]: The embedding.
+        """
+        return self.embed_many([text])[0]
+
+    async def aembed(self, text: str) -> List[float]:
+        """
+        Embed a single text without blocking the event loop.
+
+        Subclasses with a native async client should override this method.
+
+        Args:
+            text (str): The text to embed.
+
+        Returns:
+            List[float]: The embedding.
+        """
+        return await asyncio.to_thread(self.embed, text)
+
+
+class OpenAIEmbedder(BaseEmbedder):
+    """
+    Embedder backed by OpenAI's embeddings API.
+
+    Attributes:
+        client (OpenAI): The OpenAI client instance.
+        async_client (AsyncOpenAI): The asynchronous OpenAI client instance.
+    """
+
+    def __init__(self, api_key: str, model_name: str = 'text-embedding-3-small', dimensions: Optional[int] = None):
+        """
+        Initialize the OpenAIEmbedder.
+
+        Args:
+            api_key (str): The OpenAI API key.
+            model_name (str, optional): The name of the embedding model. Defaults to 'text-embedding-3-small'.
+            dimensions (Optional[int], optional): The requested number of dimensions. Defaults to None.
+        """
+        super().__init__(model_name, dimensions)
+        from openai import OpenAI, AsyncOpenAI
+
+        self.client: OpenAI = OpenAI(api_key=api_key)
+        self.async_client: AsyncOpenAI = AsyncOpenAI(api_key=api_key)
+
+    def _request_args(self, texts: List[str]) -> Dict[str, Any]:
+        args = {'input': texts, 'model': self.model_name, 'timeout': EMBEDDING_TIMEOUT}
+        if self.dimensions:
+            args['dimensions'] = self.dimensions
+        return args
+
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=0.5, min=0.5, max=2))
+    def embed_many(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed several texts in one request to the OpenAI embeddings endpoint.
+
+        Args:
+            texts (List[str]): The texts to embed.
+
+        Returns:
+            List[List[float]]: The embeddings, in the order of the texts.
+        """
+        try:
+            response = self.client.embeddings.create(**self._request_args(texts))
+            return [item.embedding for item in response.data]
+        except Exception as e:
+            logger.error(f"OpenAI embeddings call failed: {str(e)}")
+            raise
+
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=0.5, min=0.5, max=2))
+    async def aembed(self, text: str) -> List[float]:
+        """
+        Embed a single text without blocking the event loop, using the async OpenAI client.
+
+        Args:
+            text (str): The text to embed.
+
+        Returns:
+            List[float]: The embedding.
+        """
+        try:
+            response = await self.async_client.embeddings.create(**self._request_args([text]))
+            return response.data[0].embedding
+        except Exception as e:
+            logger.error(f"OpenAI embeddings call failed: {str(e)}")
+            raise
+
+
+class CachedEmbedder(BaseEmbedder):
+    """
+    Wraps an embedder with a bounded in-process cache and an optional persistent store.
+
+    Vectors are keyed on the model, the number of dimensions and the normalized text,
+    and the normalized text is what gets embedded, so a cached vector is the one the
+    wrapped embedder would have returned for any spelling sharing its key.
+    Lookups try the in-process cache first, then the persistent store; new vectors
+    are written to both.
+
+    Attributes:
+        embedder (BaseEmbedder): The embedder computing vectors on a miss.
+        cache (BaseCache): The in-process cache, typically an LRUCache with TTL.
+        store (Optional[BaseCache]): The persistent store, typically a SQLiteCache, if any.
+        api_calls (int): Number of texts sent to the wrapped embedder.
+    """
+
+    def __init__(self, embedder: BaseEmbedder, cache: BaseCache, store: Optional[BaseCache] = None):
+        """
+        Initialize the CachedEmbedder.
+
+        Args:
+            embedder (BaseEmbedder): The embedder computing vectors on a miss.
+            cache (BaseCache): The in-process cache.
+            store (Optional[BaseCache], optional): The persistent store. Defaults to None.
+        """
+        super().__init__(embedder.model_name, embedder.dimensions)
+        self.embedder = embedder
+        self.cache = cache
+        self.store = store
+        self.api_calls: int = 0
+        self._lock = threading.Lock()
+
+    def make_key(self, text: str) -> str:
+        """
+        Build the cache key for a text.
+
+        Args:
+            text (str): The text to embed.
+
+        Returns:
+            str: The cache key.
+        """
+        raw = '\x1f'.join([self.model_name, str(self.dimensions or ''), normalize_query(text)])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _lookup(self, key: str) -> Optional[List[float]]:
+        vector = self.cache.get(key)
+        if vector is None and self.store is not None:
+            vector = self.store.get(key)
+            if vector is not None:
+                self.cache.set(key, vector)
+        return vector
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        self.cache.set(key, vector)
+        if self.store is not None:
+            try:
+                self.store.set(key, vector)
+            except Exception as e:
+                logger.error(f"Error storing query embedding: {str(e)}")
+
+    def embed_many(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed several texts in one request, sending only cache misses to the wrapped embedder, once per key.
+
+        Args:
+            texts (List[str]): The texts to embed.
+
+        Returns:
+            List[List[float]]: The embeddings, in the order of the texts.
+        """
+        keys = [self.make_key(text) for text in texts]
+        vectors = [self._lookup(key) for key in keys]
+        # texts sharing a key are embedded once
+        missing: Dict[str, List[int]] = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(keys[i], []).append(i)
+        if missing:
+            with self._lock:
+                self.api_calls += len(missing)
+            computed = self.embedder.embed_many([normalize_query(texts[indices[0]]) for indices in missing.values()])
+            for (key, indices), vector in zip(missing.items(), computed):
+                self._remember(key, vector)
+                for i in indices:
+                    vectors[i] = vector
+        return vectors
+
+    async def aembed(self, text: str) -> List[float]:
+        """
+        Embed a single text without blocking the event loop, consulting the caches first.
+
+        Args:
+            text (str): The text to embed.
+
+        Returns:
+            List[float]: The embedding.
+        """
+        key = self.make_key(text)
+        vector = self._lookup(key)
+        if vector is None:
+            with self._lock:
+                self.api_calls += 1
+            vector = await self.embedder.aembed(normalize_query(text))
+            self._remember(key, vector)
+        return vector
+
+    def stats(self) -> Dict[str, Union[int, float, Dict, None]]:
+        """
+        Get the cache counters.
+
+        Returns:
+            Dict[str, Union[int, float, Dict, None]]: Counters of the in-process cache and the store,
+            and the number of texts sent to the embedding API.
+        """
+        return {
+            'cache': self.cache.stats(),
+            'store': self.store.stats() if self.store is not None else None,
+            'api_calls': self.api_calls,
+        }
+
+
+def create_embedder(embedder_type: str, api_key: str, model_name: str = 'text-embedding-3-small',
+                    dimensions: Optional[int] = None) -> Optional[BaseEmbedder]:
+    """
+    Factory function to create the appropriate embedder based on the embedder type.
+
+    Args:
+        embedder_type (str): The type of embedder to create ('openai' or 'none').
+        api_key (str): The API key for authentication.
+        model_name (str, optional): The name of the embedding model. Defaults to 'text-embedding-3-small'.
+        dimensions (Optional[int], optional): The requested number of dimensions. Defaults to None.
+
+    Returns:
+        Optional[BaseEmbedder]: The embedder instance, or None to let Elasticsearch embed queries.
+
+    Raises:
+        ValueError: If an invalid embedder type is provided.
+    """
+    if not embedder_type or embedder_type == 'none':
+        return None
+    elif embedder_type == 'openai':
+        return OpenAIEmbedder(api_key, model_name, dimensions)
+    else:
+        raise ValueError(f"Invalid embedder type: {embedder_type}")
@@ -4,23 +4,47 @@ This module defines the routes for the Flask application.
 It includes routes for handling searches and retrieving individual documents.
 The module uses the search client, LLM client, and snippet generator initialized in the main application file.
 
+When the client asks for `text/event-stream`, search results are streamed: the
+Elasticsearch hits are rendered first and each snippet is pushed as a Server-Sent
+Event as soon as it has been generated.
+
+The first search of a query retrieves a larger candidate window that is kept in the
+search session cache, so that later pages are sliced from it instead of searching
+again; snippets of the next page are prefetched while the user reads the current one.
+
+Batch jobs post many queries at once to /api/search: they are embedded in one
+embeddings request and searched in one `_msearch` request, and the hits are returned
+as compact JSON, without snippets unless asked for.
+
 Routes:
     /: Handles both GET and POST requests for the main search functionality.
+    /api/search: Searches a batch of queries, returning JSON.
     /document/<int:id>: Retrieves a specific document by ID.
+    /stats: Returns cache counters and LLM dispatcher metrics as JSON.
 """
 
-from flask import Blueprint, render_template, request, current_app, abort, jsonify
+import json
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from flask import Blueprint, Response, render_template, request, current_app, abort, jsonify, stream_with_context
 from http import HTTPStatus
+from app.search.search import SEARCH_MODES
 
 bp = Blueprint('main', __name__)
 
+PAGE_SIZE = 10
+SEARCH_MODE = 'semantic'
+SEARCH_FIELD = 'normalized_embeddings'
+# snippets of batch searches: not generated, generated in the background to fill the snippet cache, or returned
+BATCH_SNIPPET_MODES = ['none', 'defer', 'generate']
+
 @bp.route('/', methods=['GET', 'POST'])
 def handle_search():
     """
     Handle the main search functionality.
 
     On GET: Render the search form.
-    On POST: Process the search query and return results.
+    On POST: Process the search query and return results. If the request accepts
+    `text/event-stream`, the results are streamed (see `stream_search_results`).
 
     Returns:
         str: Rendered HTML template with search results or form.
@@ -33,12 +57,13 @@ def handle_search():
             return render_template('results.html', error="Please enter a search query."), HTTPStatus.BAD_REQUEST
         
         try:
-            query_args = current_app.elasticsearch.get_query_args_semantic(
-                query, 10, from_, field='normalized_embeddings'
-            )
-            search_results, total = current_app.elasticsearch.search(current_app.index_name, **query_args)
+            search_results, total = search_page(query, from_)
+
+            if wants_event_stream():
+                return stream_search_results(search_results, query, from_, total)
 
             results = current_app.snippet_generator.generate_snippets(search_results, query)
+            prefetch_next_page(query, from_, total)
 
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return render_template('results.html', results=results, query=query, from_=from_, total=total)
@@ -51,6 +76,258 @@ def handle_search():
     return render_template('index.html')
 
 
+def search_page(query: str, from_: int) -> Tuple[List[Dict], int]:
+    """
+    Get a page of search results, from the search session cache when possible.
+
+    A page inside the candidate window is sliced from the cached window, which is
+    retrieved on the first request for the query. Pages beyond the window, or all
+    pages when the session cache is disabled, are searched directly.
+
+    Args:
+        query (str): The user's query.
+        from_ (int): The starting point for pagination.
+
+    Returns:
+        Tuple[List[Dict], int]: The hits of the page and the total number of matches.
+    """
+    search = current_app.elasticsearch
+    session_cache = current_app.search_session_cache
+    if session_cache is not None:
+        page = session_cache.get_page(query, SEARCH_MODE, SEARCH_FIELD, from_, PAGE_SIZE)
+        if page is not None:
+            return page
+        if session_cache.covers(from_, PAGE_SIZE):
+            query_args = search.get_query_args(SEARCH_MODE, query, session_cache.window, 0, field=SEARCH_FIELD)
+            hits, total = search.search(current_app.index_name, **query_args)
+            session_cache.set_window(query, SEARCH_MODE, SEARCH_FIELD, hits, total)
+            return hits[from_:from_ + PAGE_SIZE], total
+
+    query_args = search.get_query_args(SEARCH_MODE, query, PAGE_SIZE, from_, field=SEARCH_FIELD)
+    return search.search(current_app.index_name, **query_args)
+
+
+def prefetch_next_page(query: str, from_: int, total: int) -> None:
+    """
+    Start generating the snippets of the next page in the background, if it is in the cached window.
+
+    Args:
+        query (str): The user's query.
+        from_ (int): The starting point of the current page.
+        total (int): The total number of matches.
+    """
+    session_cache = current_app.search_session_cache
+    next_from = from_ + PAGE_SIZE
+    if (not current_app.config.get('PREFETCH_SNIPPETS', False) or session_cache is None
+            or next_from >= total or not session_cache.covers(next_from, PAGE_SIZE)):
+        return
+    window = session_cache.get_window(query, SEARCH_MODE, SEARCH_FIELD)
+    if window is None:
+        return
+    hits, _ = window
+    submitted = current_app.snippet_generator.prefetch_snippets(
+        hits[next_from:next_from + PAGE_SIZE], query,
+        max_queue_depth=current_app.config.get('PREFETCH_MAX_QUEUE_DEPTH', 0)
+    )
+    if submitted:
+        current_app.logger.debug(f"Prefetching {submitted} snippets for results {next_from}-{next_from + PAGE_SIZE}")
+
+
+def wants_event_stream() -> bool:
+    """
+    Check whether the search results should be streamed.
+
+    Returns:
+        bool: True if streaming is enabled and the client accepts Server-Sent Events.
+    """
+    return (current_app.config.get('STREAM_SNIPPETS', False)
+            and request.accept_mimetypes.best == 'text/event-stream')
+
+
+def format_event(event: str, data: Dict[str, Any]) -> str:
+    """
+    Format a Server-Sent Event.
+
+    Args:
+        event (str): The event name.
+        data (Dict[str, Any]): The JSON-serializable event payload.
+
+    Returns:
+        str: The encoded event.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_search_results(search_results: List[Dict], query: str, from_: int, total: int) -> Response:
+    """
+    Stream search results as Server-Sent Events.
+
+    A `results` event carrying the rendered hits (with snippet placeholders) is sent
+    immediately, followed by one `snippet` event per hit as each snippet finishes,
+    and a final `done` event.
+
+    Args:
+        search_results (List[Dict]): A list of search result dictionaries.
+        query (str): The user's query.
+        from_ (int): The starting point for pagination.
+        total (int): The total number of matches.
+
+    Returns:
+        Response: The streaming response.
+    """
+    snippet_generator = current_app.snippet_generator
+    placeholders = [snippet_generator.make_result(result) for result in search_results]
+
+    def generate() -> Iterator[str]:
+        html = render_template('results.html', results=placeholders, query=query, from_=from_, total=total)
+        yield format_event('results', {'html': html})
+        try:
+            for _, result in snippet_generator.iter_snippets(search_results, query):
+                yield format_event('snippet', {'id': result['id'], 'html': render_template('snippet.html', result=result)})
+            prefetch_next_page(query, from_, total)
+        except Exception as e:
+            current_app.logger.error(f"Snippet streaming error: {str(e)}")
+            yield format_event('error', {'message': "An error occurred while generating snippets."})
+        yield format_event('done', {})
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def parse_batch_request(data: Any, config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Validate the JSON body of a batch search.
+
+    Args:
+        data (Any): The decoded JSON body.
+        config (Dict[str, Any]): The app configuration, with the batch limits.
+
+    Returns:
+        Dict[str, Any]: The queries, mode, size, from, source fields and snippet mode of the batch.
+
+    Raises:
+        ValueError: If the body is invalid.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("The body must be a JSON object")
+    queries = data.get('queries')
+    if not isinstance(queries, list) or not queries:
+        raise ValueError("'queries' must be a non-empty list of strings")
+    if not all(isinstance(query, str) and query.strip() for query in queries):
+        raise ValueError("'queries' must be a non-empty list of strings")
+    max_queries = config.get('BATCH_MAX_QUERIES', 500)
+    if len(queries) > max_queries:
+        raise ValueError(f"At most {max_queries} queries per batch")
+
+    mode = data.get('mode', SEARCH_MODE)
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"'mode' must be one of {SEARCH_MODES}")
+    size, from_ = data.get('size', PAGE_SIZE), data.get('from', 0)
+    max_size = config.get('BATCH_MAX_SIZE', 100)
+    if not isinstance(size, int) or not 0 < size <= max_size:
+        raise ValueError(f"'size' must be an integer from 1 to {max_size}")
+    if not isinstance(from_, int) or from_ < 0:
+        raise ValueError("'from' must be a non-negative integer")
+    source = data.get('source', [])
+    if not isinstance(source, list) or not all(isinstance(field, str) for field in source):
+        raise ValueError("'source' must be a list of field names")
+    snippets = data.get('snippets', 'none')
+    if snippets not in BATCH_SNIPPET_MODES:
+        raise ValueError(f"'snippets' must be one of {BATCH_SNIPPET_MODES}")
+    # the request waits for generated snippets, so each query adds up to SNIPPET_DEADLINE of waiting
+    max_generate_queries = config.get('BATCH_MAX_GENERATE_QUERIES', 20)
+    if snippets == 'generate' and len(queries) > max_generate_queries:
+        raise ValueError(f"At most {max_generate_queries} queries per batch with 'snippets': 'generate'")
+    return {'queries': [query.strip() for query in queries], 'mode': mode, 'size': size, 'from_': from_,
+            'source': source, 'snippets': snippets}
+
+
+def format_batch_result(query: str, result: Optional[Tuple[List[Dict], int]], source: List[str],
+                        snippets: Optional[List[Dict]] = None, deferred: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Build the compact JSON result of a query of a batch search.
+
+    Args:
+        query (str): The query.
+        result (Optional[Tuple[List[Dict], int]]): The hits and total number of matches, or None if the search failed.
+        source (List[str]): The source fields returned with each hit.
+        snippets (Optional[List[Dict]], optional): The results of the snippet generator, one per hit. Defaults to None.
+        deferred (Optional[int], optional): The number of snippets generated in the background. Defaults to None.
+
+    Returns:
+        Dict[str, Any]: The query, total and hits, or an error.
+    """
+    if result is None:
+        return {'query': query, 'error': "The search failed."}
+    hits, total = result
+    formatted = []
+    for i, hit in enumerate(hits):
+        item = {'id': hit['_id'], 'score': hit['_score']}
+        if source:
+            document = hit.get('_source', {})
+            item['source'] = {field: document[field] for field in source if field in document}
+        if snippets is not None:
+            item['snippet'] = snippets[i]['snippet']
+            item['llm_score'] = snippets[i]['llm_score']
+        formatted.append(item)
+    batch_result = {'query': query, 'total': total, 'hits': formatted}
+    if deferred is not None:
+        batch_result['snippets_deferred'] = deferred
+    return batch_result
+
+
+@bp.route('/api/search', methods=['POST'])
+def batch_search():
+    """
+    Search a batch of queries.
+
+    The JSON body holds `queries` (a list of strings) and optionally `mode` (one of
+    SEARCH_MODES), `size`, `from`, `source` (source fields returned with each hit) and
+    `snippets`: 'none' (default), 'defer' to generate them in the background into the
+    snippet cache, so that later searches of the same queries find them, or 'generate'.
+    The queries are embedded in one request and searched in one `_msearch` request.
+
+    Returns:
+        Response: JSON with the query, total and hits of each query, in order.
+    """
+    try:
+        batch = parse_batch_request(request.get_json(silent=True), current_app.config)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), HTTPStatus.BAD_REQUEST
+
+    search = current_app.elasticsearch
+    queries = batch['queries']
+    try:
+        vectors = search.get_query_vectors(queries) if batch['mode'] != 'fulltext' else [None] * len(queries)
+        queries_args = [search.get_query_args(batch['mode'], query, batch['size'], batch['from_'], field=SEARCH_FIELD,
+                                              query_vector=vector)
+                        for query, vector in zip(queries, vectors)]
+        # snippets need the whole source
+        results = search.search_many(current_app.index_name, queries_args,
+                                     source=batch['source'] if batch['snippets'] == 'none' else None)
+    except Exception as e:
+        current_app.logger.error(f"Batch search error: {str(e)}")
+        return jsonify({'error': "An error occurred during the search. Please try again."}), HTTPStatus.INTERNAL_SERVER_ERROR
+
+    snippet_generator = current_app.snippet_generator
+    max_queue_depth = current_app.config.get('BATCH_MAX_QUEUE_DEPTH', 1000)
+    if batch['snippets'] == 'generate':
+        # the snippets of every query are submitted before any is waited for, so the LLM calls of the batch run concurrently
+        searched = [n for n, result in enumerate(results) if result]
+        snippets = [None] * len(queries)
+        for n, generated in zip(searched, snippet_generator.generate_snippets_many([(results[n][0], queries[n]) for n in searched])):
+            snippets[n] = generated
+        formatted = [format_batch_result(query, result, batch['source'], snippets=snippets[n])
+                     for n, (query, result) in enumerate(zip(queries, results))]
+    elif batch['snippets'] == 'defer':
+        formatted = [format_batch_result(query, result, batch['source'],
+                                         deferred=snippet_generator.prefetch_snippets(result[0], query, max_queue_depth=max_queue_depth) if result else 0)
+                     for query, result in zip(queries, results)]
+    else:
+        formatted = [format_batch_result(query, result, batch['source']) for query, result in zip(queries, results)]
+    return jsonify({'results': formatted})
+
+
 @bp.route('/document/<int:id>')
 def get_document(id):
     """
@@ -73,4 +350,25 @@ def get_document(id):
             abort(HTTPStatus.NOT_FOUND)
     except Exception as e:
         current_app.logger.error(f"Error retrieving document {id}: {str(e)}")
-        abort(HTTPStatus.INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        abort(HTTPStatus.INTERNAL_SERVER_ERROR)
+
+
+@bp.route('/stats')
+def get_stats():
+    """
+    Report cache counters and LLM dispatcher metrics.
+
+    Returns:
+        Response: JSON with the hit and miss counters of the snippet cache, the query embedding
+        cache and the search session cache, and the queue depth, in-flight calls and wait times
+        of the LLM dispatcher.
+    """
+    snippet_cache = current_app.snippet_cache
+    query_embedder = current_app.query_embedder
+    session_cache = current_app.search_session_cache
+    return jsonify({
+        'snippet_cache': snippet_cache.stats() if snippet_cache is not None else None,
+        'search_session_cache': session_cache.stats() if session_cache is not None else None,
+        'query_embeddings': query_embedder.stats() if query_embedder is not None else None,
+        'llm_dispatcher': current_app.llm_dispatcher.stats(),
+    })
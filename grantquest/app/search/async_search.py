@@ -0,0 +1,190 @@
+"""
+This module provides an AsyncSearch class for interacting with Elasticsearch from async code.
+
+AsyncSearch reuses the query construction of Search and executes the requests with
+AsyncElasticsearch, so that a single ASGI worker can serve many searches concurrently.
+
+Classes:
+    AsyncSearch: Asynchronous variant of Search.
+"""
+
+from typing import Dict, Tuple, Any, List, Optional
+from elasticsearch import AsyncElasticsearch
+import asyncio
+import logging
+from app.embeddings.embeddings import BaseEmbedder
+from app.search.search import Search, get_search_profiles
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class AsyncSearch(Search):
+    """
+    A class for handling Elasticsearch operations asynchronously.
+
+    Query construction (`get_query_args_*`) is inherited from Search; the methods
+    that talk to Elasticsearch or the embedder are coroutines. Compute the query
+    vector with `aget_query_vector` and pass it to the query builders, so that
+    embedding does not block the event loop.
+
+    Attributes:
+        es (AsyncElasticsearch): The asynchronous Elasticsearch client instance.
+        embedder (Optional[BaseEmbedder]): The embedder for query vectors, or None to embed in Elasticsearch.
+        knn_oversample (float): Factor by which semantic search oversamples the kNN candidates.
+        knn_rescore (str): How the oversampled candidates are rescored, one of KNN_RESCORE_MODES.
+        knn_short_dims (Optional[int]): Dimensions of the short vectors of two-stage kNN, or None for single-stage kNN.
+        profiles (Dict[str, Dict[str, Any]]): The parameters of each search mode (see get_search_profiles).
+    """
+
+    def __init__(self, elastic_url: str, elastic_user_name: str, elastic_password: str,
+                 embedder: Optional[BaseEmbedder] = None, knn_oversample: float = 1.0, knn_rescore: str = 'none',
+                 knn_short_dims: Optional[int] = None, profiles: Optional[Dict[str, Dict[str, Any]]] = None):
+        """
+        Initialize the AsyncSearch class with Elasticsearch connection details.
+
+        The connection is not checked here since it requires a running event loop;
+        call `check_connection` once the loop has started.
+
+        Args:
+            elastic_url (str): The URL of the Elasticsearch instance.
+            elastic_user_name (str): The username for Elasticsearch authentication.
+            elastic_password (str): The password for Elasticsearch authentication.
+            embedder (Optional[BaseEmbedder], optional): The embedder for query vectors. Defaults to None.
+            knn_oversample (float, optional): Oversampling factor of semantic search. Defaults to 1.0 (none).
+            knn_rescore (str, optional): Rescoring of the oversampled candidates. Defaults to 'none'.
+            knn_short_dims (Optional[int], optional): Dimensions of the short vectors for two-stage kNN. Defaults to None.
+            profiles (Optional[Dict[str, Dict[str, Any]]], optional): Parameters overriding DEFAULT_SEARCH_PROFILES. Defaults to None.
+
+        Raises:
+            ValueError: If the kNN options or the profiles are invalid.
+        """
+        self.es = AsyncElasticsearch(elastic_url, basic_auth=(elastic_user_name, elastic_password))
+        self.embedder = embedder
+        self._set_knn_options(knn_oversample, knn_rescore, knn_short_dims)
+        self.profiles = get_search_profiles(profiles)
+
+    async def check_connection(self):
+        """
+        Check the connection to Elasticsearch.
+
+        Raises:
+            ConnectionError: If unable to connect to Elasticsearch.
+        """
+        try:
+            client_info = await self.es.info()
+            logger.info('Connected to Elasticsearch!')
+            logger.debug(f'Client info: {client_info}')
+        except Exception as e:
+            logger.error(f'Error connecting to Elasticsearch: {e}')
+            raise ConnectionError(f"Failed to connect to Elasticsearch: {e}")
+
+    async def aget_query_vector(self, query: str) -> Optional[List[float]]:
+        """
+        Compute the query vector on the client without blocking the event loop.
+
+        Args:
+            query (str): The search query.
+
+        Returns:
+            Optional[List[float]]: The query vector, or None if Elasticsearch should embed the query.
+        """
+        if self.embedder is None:
+            return None
+        return await self.embedder.aembed(query)
+
+    async def aget_query_vectors(self, queries: List[str]) -> List[Optional[List[float]]]:
+        """
+        Compute the vectors of several queries in one embeddings request without blocking the event loop.
+
+        Args:
+            queries (List[str]): The search queries.
+
+        Returns:
+            List[Optional[List[float]]]: The query vectors, or Nones if Elasticsearch should embed the queries.
+        """
+        if self.embedder is None:
+            return [None] * len(queries)
+        return await asyncio.to_thread(self.embedder.embed_many, queries)
+
+    async def search(self, index_name: str, **query_args: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Execute a search query on the specified Elasticsearch index.
+
+        The sub-searches of an RRF search are sent in one `_msearch` request and fused.
+
+        Args:
+            index_name (str): The name of the Elasticsearch index to search.
+            **query_args: Arbitrary keyword arguments for the search query.
+
+        Returns:
+            Tuple[List[Dict[str, Any]], int]: A tuple containing the list of search hits and the total number of matches.
+
+        Raises:
+            ElasticsearchException: If an error occurs during the search operation.
+        """
+        try:
+            if 'retrievers' in query_args:
+                res = await self.es.msearch(searches=self._get_msearch_args(index_name, [query_args]))
+                return self._fuse_responses(res['responses'], query_args)
+            res = await self.es.search(index=index_name, **query_args)
+            hits = res['hits']['hits']
+            total = res['hits']['total']['value']
+            return hits, total
+        except Exception as e:
+            logger.error(f'Error executing search: {e}')
+            raise
+
+    async def search_many(self, index_name: str, queries_args: List[Dict[str, Any]],
+                          source: Optional[List[str]] = None) -> List[Optional[Tuple[List[Dict[str, Any]], int]]]:
+        """
+        Execute several search queries on the specified Elasticsearch index in one `_msearch` request.
+
+        Args:
+            index_name (str): The name of the Elasticsearch index to search.
+            queries_args (List[Dict[str, Any]]): Query arguments from the `get_query_args_*` methods.
+            source (Optional[List[str]], optional): The source fields returned, [] for none. Defaults to None (all).
+
+        Returns:
+            List[Optional[Tuple[List[Dict[str, Any]], int]]]: The hits and total number of matches of each query,
+                or None for a query whose search failed.
+
+        Raises:
+            ElasticsearchException: If the request fails as a whole.
+        """
+        if not queries_args:
+            return []
+        try:
+            res = await self.es.msearch(searches=self._get_msearch_args(index_name, queries_args, source))
+            return self._split_responses(res['responses'], queries_args)
+        except Exception as e:
+            logger.error(f'Error executing batch search: {e}')
+            raise
+
+    async def retrieve_document(self, index_name: str, id: str) -> Dict[str, Any]:
+        """
+        Retrieve a specific document from the Elasticsearch index by its ID.
+
+        Args:
+            index_name (str): The name of the Elasticsearch index.
+            id (str): The ID of the document to retrieve.
+
+        Returns:
+            Dict[str, Any]: The retrieved document.
+
+        Raises:
+            ElasticsearchException: If an error occurs during the document retrieval.
+        """
+        try:
+            res = await self.es.get(index=index_name, id=id, _source_excludes=['embeddings*', 'normalized_embeddings*'])
+            return res
+        except Exception as e:
+            logger.error(f'Error retrieving document: {e}')
+            raise
+
+    async def close(self):
+        """
+        Close the underlying Elasticsearch connections.
+        """
+        await self.es.close()
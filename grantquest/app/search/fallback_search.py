@@ -0,0 +1,304 @@
+"""
+This module provides search clients that fall back to the in-process backend when Elasticsearch is slow or down.
+
+FallbackSearch sends each search to Elasticsearch and waits at most `timeout` seconds
+for it. When the search fails or times out, the same query is answered by a
+LocalVectorSearch over a snapshot of the index, and Elasticsearch is skipped for the
+next `cooldown` seconds, so that a struggling cluster does not add its timeout to
+every search. Query vectors are computed once and shared by both backends. Batches of
+searches are not timed out, since a large batch legitimately takes longer than a search,
+but fall back when they fail.
+
+Classes:
+    FallbackSearch: Search client with a local fallback.
+    AsyncFallbackSearch: Asynchronous variant of FallbackSearch.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Tuple, Any, List, Optional
+import asyncio
+import logging
+import threading
+import time
+from elasticsearch import NotFoundError
+from app.search.search import Search
+from app.search.local_search import LocalVectorSearch
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class FallbackSearch(Search):
+    """
+    A search client that uses Elasticsearch, and a local backend when Elasticsearch is slow or fails.
+
+    Attributes:
+        primary (Search): The Elasticsearch client.
+        fallback (LocalVectorSearch): The local backend.
+        embedder (BaseEmbedder): The embedder for query vectors, shared with the backends.
+        timeout (float): Seconds to wait for Elasticsearch before falling back.
+        cooldown (float): Seconds during which Elasticsearch is skipped after a failure.
+        fallbacks (int): The number of searches answered by the fallback.
+    """
+
+    def __init__(self, primary: Search, fallback: LocalVectorSearch, timeout: float = 2.0, cooldown: float = 30.0):
+        """
+        Initialize the FallbackSearch class.
+
+        Args:
+            primary (Search): The Elasticsearch client.
+            fallback (LocalVectorSearch): The local backend.
+            timeout (float, optional): Seconds to wait for Elasticsearch. Defaults to 2.0.
+            cooldown (float, optional): Seconds to skip Elasticsearch after a failure. Defaults to 30.0.
+        """
+        self.primary = primary
+        self.fallback = fallback
+        self.embedder = fallback.embedder
+        self.timeout = timeout
+        self.cooldown = cooldown
+        self.fallbacks = 0
+        self.skip_until = 0.0
+        self.lock = threading.Lock()
+        # searches left running by a timeout still hold a worker, so there are a few spares
+        self.executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='es-search')
+        # a cluster that is down at startup only sends the first searches to the local backend
+        try:
+            primary._check_connection()
+        except ConnectionError as e:
+            self._primary_failed(e)
+
+    def _primary_available(self) -> bool:
+        return time.monotonic() >= self.skip_until
+
+    def _primary_failed(self, error: BaseException) -> None:
+        """
+        Record a failure of Elasticsearch, skipping it for the cooldown.
+
+        Args:
+            error (BaseException): The error or timeout.
+        """
+        with self.lock:
+            self.fallbacks += 1
+            self.skip_until = time.monotonic() + self.cooldown
+        reason = str(error) or f'no answer in {self.timeout}s'
+        logger.warning(f'Elasticsearch search failed ({type(error).__name__}: {reason}), '
+                       f'using the local backend for {self.cooldown:.0f}s')
+
+    def get_query_args_semantic(self, query: str, n: int, from_: int, field: str = 'embeddings',
+                                query_vector: Optional[List[float]] = None) -> Dict[str, Any]:
+        """
+        Construct query arguments for semantic search on both backends.
+
+        Args:
+            query (str): The search query.
+            n (int): The number of results to return.
+            from_ (int): The starting point for pagination.
+            field (str, optional): The embeddings field to search. Defaults to 'embeddings'.
+            query_vector (Optional[List[float]], optional): A precomputed query vector. Defaults to None.
+
+        Returns:
+            Dict[str, Any]: The query arguments of each backend.
+        """
+        if query_vector is None:
+            query_vector = self.get_query_vector(query)
+        return {'primary': self.primary.get_query_args_semantic(query, n, from_, field=field, query_vector=query_vector),
+                'fallback': self.fallback.get_query_args_semantic(query, n, from_, field=field, query_vector=query_vector)}
+
+    def get_query_args_fulltext(self, query: str, n: int, from_: int) -> Dict[str, Any]:
+        """
+        Construct query arguments for full-text search on both backends.
+
+        Args:
+            query (str): The search query.
+            n (int): The number of results to return.
+            from_ (int): The starting point for pagination.
+
+        Returns:
+            Dict[str, Any]: The query arguments of each backend.
+        """
+        return {'primary': self.primary.get_query_args_fulltext(query, n, from_),
+                'fallback': self.fallback.get_query_args_fulltext(query, n, from_)}
+
+    def get_query_args_hybrid(self, query: str, n: int, from_: int, field: str = 'embeddings',
+                              query_vector: Optional[List[float]] = None) -> Dict[str, Any]:
+        """
+        Construct query arguments for hybrid search on both backends.
+
+        Args:
+            query (str): The search query.
+            n (int): The number of results to return.
+            from_ (int): The starting point for pagination.
+            field (str, optional): The embeddings field to use for semantic search. Defaults to 'embeddings'.
+            query_vector (Optional[List[float]], optional): A precomputed query vector. Defaults to None.
+
+        Returns:
+            Dict[str, Any]: The query arguments of each backend.
+        """
+        if query_vector is None:
+            query_vector = self.get_query_vector(query)
+        return {'primary': self.primary.get_query_args_hybrid(query, n, from_, field=field, query_vector=query_vector),
+                'fallback': self.fallback.get_query_args_hybrid(query, n, from_, field=field, query_vector=query_vector)}
+
+    def get_query_args_rrf(self, query: str, n: int, from_: int, field: str = 'embeddings',
+                           query_vector: Optional[List[float]] = None) -> Dict[str, Any]:
+        """
+        Construct query arguments for hybrid search with reciprocal rank fusion on both backends.
+
+        Args:
+            query (str): The search query.
+            n (int): The number of results to return.
+            from_ (int): The starting point for pagination.
+            field (str, optional): The embeddings field to use for semantic search. Defaults to 'embeddings'.
+            query_vector (Optional[List[float]], optional): A precomputed query vector. Defaults to None.
+
+        Returns:
+            Dict[str, Any]: The query arguments of each backend.
+        """
+        if query_vector is None:
+            query_vector = self.get_query_vector(query)
+        return {'primary': self.primary.get_query_args_rrf(query, n, from_, field=field, query_vector=query_vector),
+                'fallback': self.fallback.get_query_args_rrf(query, n, from_, field=field, query_vector=query_vector)}
+
+    def search(self, index_name: str, **query_args: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Execute a search on Elasticsearch, or on the local backend if Elasticsearch is slow or fails.
+
+        Args:
+            index_name (str): The name of the index to search.
+            **query_args: Query arguments from one of the `get_query_args_*` methods.
+
+        Returns:
+            Tuple[List[Dict[str, Any]], int]: A tuple containing the list of search hits and the total number of matches.
+        """
+        if self._primary_available():
+            future = self.executor.submit(self.primary.search, index_name, **query_args['primary'])
+            try:
+                return future.result(timeout=self.timeout)
+            except Exception as e:
+                self._primary_failed(e)
+        return self.fallback.search(index_name, **query_args['fallback'])
+
+    def search_many(self, index_name: str, queries_args: List[Dict[str, Any]],
+                    source: Optional[List[str]] = None) -> List[Optional[Tuple[List[Dict[str, Any]], int]]]:
+        """
+        Execute several searches on Elasticsearch, or on the local backend if Elasticsearch fails.
+
+        Args:
+            index_name (str): The name of the index to search.
+            queries_args (List[Dict[str, Any]]): Query arguments from the `get_query_args_*` methods.
+            source (Optional[List[str]], optional): The source fields returned, [] for none. Defaults to None (all).
+
+        Returns:
+            List[Optional[Tuple[List[Dict[str, Any]], int]]]: The hits and total number of matches of each query,
+                or None for a query whose search failed.
+        """
+        if self._primary_available():
+            try:
+                return self.primary.search_many(index_name, [query_args['primary'] for query_args in queries_args], source)
+            except Exception as e:
+                self._primary_failed(e)
+        return self.fallback.search_many(index_name, [query_args['fallback'] for query_args in queries_args], source)
+
+    def retrieve_document(self, index_name: str, id: str) -> Optional[Dict[str, Any]]:
+        """
+        Retrieve a document from Elasticsearch, or from the snapshot if Elasticsearch is slow or fails.
+
+        Args:
+            index_name (str): The name of the index.
+            id (str): The ID of the document to retrieve.
+
+        Returns:
+            Optional[Dict[str, Any]]: The retrieved document.
+
+        Raises:
+            NotFoundError: If Elasticsearch does not have the document.
+        """
+        if self._primary_available():
+            future = self.executor.submit(self.primary.retrieve_document, index_name, id)
+            try:
+                return future.result(timeout=self.timeout)
+            except NotFoundError:
+                # a missing document is an answer, not a failure of the cluster
+                raise
+            except Exception as e:
+                self._primary_failed(e)
+        return self.fallback.retrieve_document(index_name, id)
+
+
+class AsyncFallbackSearch(FallbackSearch):
+    """
+    Asynchronous variant of FallbackSearch, over an AsyncSearch and an AsyncLocalVectorSearch.
+    """
+
+    def __init__(self, primary: Search, fallback: LocalVectorSearch, timeout: float = 2.0, cooldown: float = 30.0):
+        """
+        Initialize the AsyncFallbackSearch class.
+
+        Args:
+            primary (Search): The asynchronous Elasticsearch client.
+            fallback (LocalVectorSearch): The asynchronous local backend.
+            timeout (float, optional): Seconds to wait for Elasticsearch. Defaults to 2.0.
+            cooldown (float, optional): Seconds to skip Elasticsearch after a failure. Defaults to 30.0.
+        """
+        self.primary = primary
+        self.fallback = fallback
+        self.embedder = fallback.embedder
+        self.timeout = timeout
+        self.cooldown = cooldown
+        self.fallbacks = 0
+        self.skip_until = 0.0
+        self.lock = threading.Lock()
+
+    async def check_connection(self):
+        """
+        Check the snapshot directory, and Elasticsearch without failing, since searches can fall back.
+
+        Raises:
+            ConnectionError: If the snapshot directory does not exist.
+        """
+        await self.fallback.check_connection()
+        try:
+            await self.primary.check_connection()
+        except ConnectionError as e:
+            self._primary_failed(e)
+
+    async def aget_query_vector(self, query: str) -> Optional[List[float]]:
+        return await self.embedder.aembed(query)
+
+    async def search(self, index_name: str, **query_args: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], int]:
+        if self._primary_available():
+            try:
+                return await asyncio.wait_for(self.primary.search(index_name, **query_args['primary']), self.timeout)
+            except Exception as e:
+                self._primary_failed(e)
+        return await self.fallback.search(index_name, **query_args['fallback'])
+
+    async def aget_query_vectors(self, queries: List[str]) -> List[Optional[List[float]]]:
+        return await asyncio.to_thread(self.embedder.embed_many, queries)
+
+    async def search_many(self, index_name: str, queries_args: List[Dict[str, Any]],
+                          source: Optional[List[str]] = None) -> List[Optional[Tuple[List[Dict[str, Any]], int]]]:
+        if self._primary_available():
+            try:
+                return await self.primary.search_many(index_name, [query_args['primary'] for query_args in queries_args], source)
+            except Exception as e:
+                self._primary_failed(e)
+        return await self.fallback.search_many(index_name, [query_args['fallback'] for query_args in queries_args], source)
+
+    async def retrieve_document(self, index_name: str, id: str) -> Optional[Dict[str, Any]]:
+        if self._primary_available():
+            try:
+                return await asyncio.wait_for(self.primary.retrieve_document(index_name, id), self.timeout)
+            except NotFoundError:
+                raise
+            except Exception as e:
+                self._primary_failed(e)
+        return await self.fallback.retrieve_document(index_name, id)
+
+    async def close(self):
+        """
+        Close both backends.
+        """
+        await self.primary.close()
+        await self.fallback.close()
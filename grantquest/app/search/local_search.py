@@ -0,0 +1,629 @@
+"""
+This module provides an in-process vector search backend, as an alternative to Elasticsearch.
+
+LocalVectorSearch serves semantic search from a snapshot of an index exported with
+`elasticsearch/export_snapshot.py`, so a corpus that fits in memory can be searched
+without a network hop or a running Elasticsearch. A snapshot is a directory per index:
+
+    meta.json          index name, number of documents and vector fields with their dimensions
+    ids.json           document ids, in row order
+    documents.jsonl    document sources without the vector fields, in row order
+    <field>.npy        unit-normalized float32 vectors of each dense_vector field, in row order
+
+The vectors are memory-mapped, and the top k are found exactly with matrix products
+over blocks of rows. With IVF partitioning, the vectors are clustered with spherical
+k-means (cached next to the snapshot) and only the rows of the clusters closest to
+the query are scored. Full-text, hybrid and RRF search use a BM25F text index of the
+snapshot (see text_index.py), built on first use and saved in its `text_index` directory.
+
+Classes:
+    IVFIndex: Inverted file partitioning of a vector matrix.
+    Snapshot: A snapshot of an index, loaded from disk.
+    LocalVectorSearch: Search backend over snapshots, with the interface of Search.
+    AsyncLocalVectorSearch: Asynchronous variant of LocalVectorSearch, with the interface of AsyncSearch.
+"""
+
+from typing import Dict, Tuple, Any, List, Optional
+import asyncio
+import json
+import logging
+import os
+import threading
+import numpy as np
+from app.embeddings.embeddings import BaseEmbedder
+from app.search.search import Search, get_search_profiles, reciprocal_rank_fusion
+from app.search.text_index import TextIndex
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# fields of the text index, searched by full-text queries as by Search.get_query_args_fulltext
+TEXT_FIELDS = ["normalized_info", "description", "submission_info", "eligibility"]
+# fields of the text part of hybrid queries, as in Search.get_query_args_hybrid
+HYBRID_TEXT_FIELDS = ["normalized_info", "description", "submission_info"]
+
+
+def top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find the k highest scores of each row.
+
+    Args:
+        scores (np.ndarray): Scores of shape (queries, candidates).
+        k (int): The number of scores kept per row.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The column indices and the scores, both of shape (queries, min(k, candidates)), best first.
+    """
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64), np.empty((scores.shape[0], 0), dtype=scores.dtype)
+    columns = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    best = np.take_along_axis(scores, columns, axis=1)
+    order = np.argsort(-best, axis=1, kind='stable')
+    return np.take_along_axis(columns, order, axis=1), np.take_along_axis(best, order, axis=1)
+
+
+class IVFIndex:
+    """
+    Inverted file partitioning of unit vectors, built with spherical k-means.
+
+    Attributes:
+        centroids (np.ndarray): Unit centroids of shape (lists, dims).
+        order (np.ndarray): Row indices sorted by list.
+        offsets (np.ndarray): Start of each list in `order`, of length lists + 1.
+    """
+
+    def __init__(self, centroids: np.ndarray, order: np.ndarray, offsets: np.ndarray):
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray, block_size: int) -> np.ndarray:
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), block_size):
+            block = np.asarray(vectors[start:start + block_size], dtype=np.float32)
+            assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return assignments
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, lists: int, iterations: int = 10, sample_size: int = 256,
+              block_size: int = 65536, seed: int = 0) -> 'IVFIndex':
+        """
+        Cluster unit vectors into lists with spherical k-means.
+
+        Args:
+            vectors (np.ndarray): Unit vectors of shape (rows, dims), possibly memory-mapped.
+            lists (int): The number of lists.
+            iterations (int, optional): k-means iterations. Defaults to 10.
+            sample_size (int, optional): Training rows per list. Defaults to 256.
+            block_size (int, optional): Rows assigned at a time. Defaults to 65536.
+            seed (int, optional): Random seed. Defaults to 0.
+
+        Returns:
+            IVFIndex: The partitioning.
+        """
+        rng = np.random.default_rng(seed)
+        lists = max(1, min(lists, len(vectors)))
+        sample_rows = np.sort(rng.choice(len(vectors), min(len(vectors), lists * sample_size), replace=False))
+        sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = cls._assign(sample, centroids, block_size)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            empty = ~np.bincount(assignments, minlength=lists).astype(bool)
+            # re-seed empty lists with random training rows
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.where(norms == 0, 1, norms)
+
+        assignments = cls._assign(vectors, centroids, block_size)
+        order = np.argsort(assignments, kind='stable')
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=lists))])
+        return cls(centroids, order, offsets)
+
+    @classmethod
+    def load_or_build(cls, path: str, vectors: np.ndarray, lists: int) -> 'IVFIndex':
+        """
+        Load the partitioning cached at path, or build it and cache it there.
+
+        Args:
+            path (str): The cache file (.npz).
+            vectors (np.ndarray): Unit vectors of shape (rows, dims).
+            lists (int): The number of lists.
+
+        Returns:
+            IVFIndex: The partitioning.
+        """
+        if os.path.exists(path):
+            data = np.load(path)
+            if len(data['order']) == len(vectors):
+                return cls(data['centroids'], data['order'], data['offsets'])
+        logger.info(f'Building IVF index with {lists} lists over {len(vectors)} vectors')
+        ivf = cls.build(vectors, lists)
+        np.savez(path, centroids=ivf.centroids, order=ivf.order, offsets=ivf.offsets)
+        return ivf
+
+    def candidates(self, query_vector: np.ndarray, probes: int) -> np.ndarray:
+        """
+        Get the rows of the lists whose centroids are closest to the query.
+
+        Args:
+            query_vector (np.ndarray): The unit query vector.
+            probes (int): The number of lists searched.
+
+        Returns:
+            np.ndarray: The sorted row indices.
+        """
+        lists, _ = top_k((self.centroids @ query_vector)[None, :], probes)
+        rows = np.concatenate([self.order[self.offsets[l]:self.offsets[l + 1]] for l in lists[0]])
+        return np.sort(rows)
+
+
+class Snapshot:
+    """
+    A snapshot of an index loaded in memory, with memory-mapped vectors.
+
+    Attributes:
+        path (str): The snapshot directory.
+        ids (List[str]): The document ids, in row order.
+        rows (Dict[str, int]): The row of each document id.
+        sources (List[Dict[str, Any]]): The document sources, in row order.
+        vectors (Dict[str, np.ndarray]): The memory-mapped vectors of each field.
+    """
+
+    def __init__(self, path: str):
+        """
+        Load a snapshot.
+
+        Args:
+            path (str): The snapshot directory.
+
+        Raises:
+            FileNotFoundError: If the snapshot does not exist.
+        """
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        with open(os.path.join(path, 'ids.json')) as f:
+            self.ids = json.load(f)
+        self.rows = {id: row for row, id in enumerate(self.ids)}
+        with open(os.path.join(path, 'documents.jsonl')) as f:
+            self.sources = [json.loads(line) for line in f]
+        self.vectors = {field: np.load(os.path.join(path, f'{field}.npy'), mmap_mode='r') for field in self.meta['fields']}
+        self.ivf: Dict[str, IVFIndex] = {}
+        self.text_index: Optional[TextIndex] = None
+        # guards the indices built on first use
+        self.lock = threading.Lock()
+
+    def get_ivf(self, field: str, lists: int) -> IVFIndex:
+        """
+        Get the IVF partitioning of a field, building it on first use.
+
+        Args:
+            field (str): The vector field.
+            lists (int): The number of lists.
+
+        Returns:
+            IVFIndex: The partitioning.
+        """
+        with self.lock:
+            if field not in self.ivf:
+                self.ivf[field] = IVFIndex.load_or_build(os.path.join(self.path, f'{field}.ivf{lists}.npz'), self.vectors[field], lists)
+            return self.ivf[field]
+
+    def get_text_index(self) -> TextIndex:
+        """
+        Get the text index of the snapshot, building it on first use.
+
+        Returns:
+            TextIndex: The text index over TEXT_FIELDS.
+        """
+        with self.lock:
+            if self.text_index is None:
+                self.text_index = TextIndex.load_or_build(os.path.join(self.path, 'text_index'), self.sources, TEXT_FIELDS,
+                                                          snapshot=self.meta.get('exported_at'))
+            return self.text_index
+
+
+class LocalVectorSearch(Search):
+    """
+    A search backend that serves searches from in-process snapshots of the indices.
+
+    Query construction and execution follow the interface of Search; the query arguments
+    are only understood by this class. Query vectors are computed with the embedder.
+    Full-text search scores the same fields as Search with BM25F, hybrid search adds
+    the boosted text and kNN scores of the documents, like Elasticsearch, and RRF search
+    fuses the full-text and kNN rankings.
+
+    Attributes:
+        path (str): The directory holding a snapshot directory per index.
+        embedder (BaseEmbedder): The embedder for query vectors.
+        ivf_lists (int): The number of IVF lists, or 0 for exact search over all rows.
+        ivf_probes (int): The number of IVF lists searched per query.
+        block_size (int): The number of rows scored per matrix product.
+        profiles (Dict[str, Dict[str, Any]]): The parameters of each search mode (see get_search_profiles).
+    """
+
+    def __init__(self, path: str, embedder: Optional[BaseEmbedder], ivf_lists: int = 0, ivf_probes: int = 8,
+                 block_size: int = 65536, profiles: Optional[Dict[str, Dict[str, Any]]] = None):
+        """
+        Initialize the LocalVectorSearch class. Snapshots are loaded on first use.
+
+        Args:
+            path (str): The directory holding a snapshot directory per index.
+            embedder (Optional[BaseEmbedder]): The embedder for query vectors.
+            ivf_lists (int, optional): The number of IVF lists, 0 for exact search. Defaults to 0.
+            ivf_probes (int, optional): The number of IVF lists searched per query. Defaults to 8.
+            block_size (int, optional): The number of rows scored per matrix product. Defaults to 65536.
+            profiles (Optional[Dict[str, Dict[str, Any]]], optional): Parameters overriding DEFAULT_SEARCH_PROFILES. Defaults to None.
+
+        Raises:
+            ValueError: If there is no embedder, or the profiles are invalid.
+        """
+        if embedder is None:
+            raise ValueError("LocalVectorSearch needs an embedder to compute query vectors")
+        self.path = path
+        self.embedder = embedder
+        self.ivf_lists = ivf_lists
+        self.ivf_probes = ivf_probes
+        self.block_size = block_size
+        self.profiles = get_search_profiles(profiles)
+        self.snapshots: Dict[str, Snapshot] = {}
+        self.lock = threading.Lock()
+
+    def get_snapshot(self, index_name: str) -> Snapshot:
+        """
+        Get the snapshot of an index, loading it on first use.
+
+        Args:
+            index_name (str): The name of the index.
+
+        Returns:
+            Snapshot: The snapshot.
+
+        Raises:
+            FileNotFoundError: If there is no snapshot of the index.
+        """
+        with self.lock:
+            if index_name not in self.snapshots:
+                snapshot = Snapshot(os.path.join(self.path, index_name))
+                logger.info(f"Loaded snapshot of '{index_name}' with {len(snapshot.ids)} documents")
+                self.snapshots[index_name] = snapshot
+            return self.snapshots[index_name]
+
+    def get_query_args_semantic(self, query: str, n: int, from_: int, field: str = 'embeddings',
+                                query_vector: Optional[List[float]] = None) -> Dict[str, Any]:
+        """
+        Construct query arguments for semantic search.
+
+        Args:
+            query (str): The search query.
+            n (int): The number of results to return.
+            from_ (int): The starting point for pagination.
+            field (str, optional): The embeddings field to search. Defaults to 'embeddings'.
+            query_vector (Optional[List[float]], optional): A precomputed query vector. Defaults to None.
+
+        Returns:
+            Dict[str, Any]: The constructed query arguments.
+        """
+        if query_vector is None:
+            query_vector = self.get_query_vector(query)
+        return {'mode': 'semantic', 'field': field, 'query_vector': query_vector, 'size': n, 'from_': from_}
+
+    def get_query_args_fulltext(self, query: str, n: int, from_: int) -> Dict[str, Any]:
+        """
+        Construct query arguments for full-text search.
+
+        Args:
+            query (str): The search query.
+            n (int): The number of results to return.
+            from_ (int): The starting point for pagination.
+
+        Returns:
+            Dict[str, Any]: The constructed query arguments.
+        """
+        return {'mode': 'fulltext', 'query': query, 'fields': TEXT_FIELDS, 'size': n, 'from_': from_}
+
+    def get_query_args_hybrid(self, query: str, n: int, from_: int, field: str = 'embeddings',
+                              query_vector: Optional[List[float]] = None) -> Dict[str, Any]:
+        """
+        Construct query arguments for hybrid search (combination of semantic and full-text).
+
+        Args:
+            query (str): The search query.
+            n (int): The number of results to return.
+            from_ (int): The starting point for pagination.
+            field (str, optional): The embeddings field to use for semantic search. Defaults to 'embeddings'.
+            query_vector (Optional[List[float]], optional): A precomputed query vector. Defaults to None.
+
+        Returns:
+            Dict[str, Any]: The constructed query arguments.
+        """
+        if query_vector is None:
+            query_vector = self.get_query_vector(query)
+        profile = self.profiles['hybrid']
+        return {'mode': 'hybrid', 'query': query, 'fields': HYBRID_TEXT_FIELDS, 'field': field,
+                'query_vector': query_vector, 'size': n, 'from_': from_, 'num_candidates': profile['num_candidates'],
+                'text_boost': profile['text_boost'], 'knn_boost': profile['knn_boost']}
+
+    def get_query_args_rrf(self, query: str, n: int, from_: int, field: str = 'embeddings',
+                           query_vector: Optional[List[float]] = None) -> Dict[str, Any]:
+        """
+        Construct query arguments for hybrid search with reciprocal rank fusion.
+
+        Args:
+            query (str): The search query.
+            n (int): The number of results to return.
+            from_ (int): The starting point for pagination.
+            field (str, optional): The embeddings field to use for semantic search. Defaults to 'embeddings'.
+            query_vector (Optional[List[float]], optional): A precomputed query vector. Defaults to None.
+
+        Returns:
+            Dict[str, Any]: The constructed query arguments.
+        """
+        if query_vector is None:
+            query_vector = self.get_query_vector(query)
+        profile = self.profiles['rrf']
+        return {'mode': 'rrf', 'query': query, 'fields': TEXT_FIELDS, 'field': field, 'query_vector': query_vector,
+                'size': n, 'from_': from_, 'rank_window': profile['rank_window'], 'rank_constant': profile['rank_constant']}
+
+    def search_vectors(self, index_name: str, field: str, query_vectors: np.ndarray,
+                       k: int) -> Tuple[List[np.ndarray], List[np.ndarray], int]:
+        """
+        Find the k nearest rows of each query vector.
+
+        Without IVF, all the query vectors are scored against each block of rows with one matrix product.
+
+        Args:
+            index_name (str): The name of the index.
+            field (str): The vector field.
+            query_vectors (np.ndarray): Query vectors of shape (queries, dims).
+            k (int): The number of rows returned per query.
+
+        Returns:
+            Tuple[List[np.ndarray], List[np.ndarray], int]: The rows and cosine similarities of each query, at most k
+                best first (fewer with IVF if the probed lists are small), and the number of rows scored per query.
+
+        Raises:
+            ValueError: If the query vectors do not have the dimensions of the field.
+        """
+        snapshot = self.get_snapshot(index_name)
+        vectors = snapshot.vectors[field]
+        if query_vectors.shape[1] != vectors.shape[1]:
+            raise ValueError(f"Query vectors have {query_vectors.shape[1]} dimensions, field '{field}' has {vectors.shape[1]}")
+        norms = np.linalg.norm(query_vectors, axis=1, keepdims=True)
+        query_vectors = (query_vectors / np.where(norms == 0, 1, norms)).astype(np.float32)
+
+        if self.ivf_lists:
+            ivf = snapshot.get_ivf(field, self.ivf_lists)
+            results, scored = [], 0
+            for query_vector in query_vectors:
+                rows = ivf.candidates(query_vector, self.ivf_probes)
+                best, scores = top_k((vectors[rows] @ query_vector)[None, :], k)
+                results.append((rows[best[0]], scores[0]))
+                scored = max(scored, len(rows))
+            return [rows for rows, _ in results], [scores for _, scores in results], scored
+
+        best_rows = np.empty((len(query_vectors), 0), dtype=np.int64)
+        best_scores = np.empty((len(query_vectors), 0), dtype=np.float32)
+        for start in range(0, len(vectors), self.block_size):
+            block = np.asarray(vectors[start:start + self.block_size])
+            rows, scores = top_k(query_vectors @ block.T, k)
+            # merge the best rows of this block with the best so far
+            best_rows, best_scores = np.concatenate([best_rows, rows + start], axis=1), np.concatenate([best_scores, scores], axis=1)
+            columns, best_scores = top_k(best_scores, k)
+            best_rows = np.take_along_axis(best_rows, columns, axis=1)
+        return list(best_rows), list(best_scores), len(vectors)
+
+    def search(self, index_name: str, **query_args: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Execute a search query on the snapshot of the specified index.
+
+        Args:
+            index_name (str): The name of the index to search.
+            **query_args: Query arguments from one of the `get_query_args_*` methods.
+
+        Returns:
+            Tuple[List[Dict[str, Any]], int]: A tuple containing the list of search hits and the total number of matches.
+        """
+        try:
+            snapshot = self.get_snapshot(index_name)
+            from_, size = query_args['from_'], query_args['size']
+            mode = query_args.get('mode', 'semantic')
+            if mode == 'fulltext':
+                rows, scores, total = snapshot.get_text_index().search(query_args['query'], from_ + size, query_args['fields'])
+            elif mode == 'hybrid':
+                rows, scores, total = self._search_hybrid(snapshot, index_name, from_ + size, **query_args)
+            elif mode == 'rrf':
+                rows, scores, total = self._search_rrf(snapshot, index_name, from_ + size, **query_args)
+            else:
+                query_vector = np.asarray(query_args['query_vector'], dtype=np.float32)[None, :]
+                rows, similarities, total = self.search_vectors(index_name, query_args['field'], query_vector, from_ + size)
+                # the kNN score of cosine similarity in Elasticsearch
+                rows, scores = rows[0], (1.0 + similarities[0]) / 2.0
+            return self._get_hits(snapshot, index_name, rows[from_:], scores[from_:]), total
+        except Exception as e:
+            logger.error(f'Error executing search: {e}')
+            raise
+
+    @staticmethod
+    def _get_hits(snapshot: Snapshot, index_name: str, rows: np.ndarray, scores: np.ndarray,
+                  source: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Build the search hits of rows of a snapshot.
+
+        Args:
+            snapshot (Snapshot): The snapshot of the index.
+            index_name (str): The name of the index.
+            rows (np.ndarray): The rows, best first.
+            scores (np.ndarray): The scores of the rows.
+            source (Optional[List[str]], optional): The source fields returned, [] for none. Defaults to None (all).
+
+        Returns:
+            List[Dict[str, Any]]: The hits, in the format of Elasticsearch.
+        """
+        hits = []
+        for row, score in zip(rows, scores):
+            document = snapshot.sources[row]
+            if source is not None:
+                document = {key: document[key] for key in source if key in document}
+            hits.append({'_index': index_name, '_id': snapshot.ids[row], '_score': float(score), '_source': document})
+        return hits
+
+    def search_many(self, index_name: str, queries_args: List[Dict[str, Any]],
+                    source: Optional[List[str]] = None) -> List[Optional[Tuple[List[Dict[str, Any]], int]]]:
+        """
+        Execute several search queries on the snapshot of the specified index.
+
+        Semantic queries of the same field and depth are scored together, with one matrix
+        product per block of rows (see `search_vectors`).
+
+        Args:
+            index_name (str): The name of the index to search.
+            queries_args (List[Dict[str, Any]]): Query arguments from the `get_query_args_*` methods.
+            source (Optional[List[str]], optional): The source fields returned, [] for none. Defaults to None (all).
+
+        Returns:
+            List[Optional[Tuple[List[Dict[str, Any]], int]]]: The hits and total number of matches of each query,
+                or None for a query whose search failed.
+        """
+        snapshot = self.get_snapshot(index_name)
+        results: List[Optional[Tuple[List[Dict[str, Any]], int]]] = [None] * len(queries_args)
+        groups: Dict[Tuple[str, int], List[int]] = {}
+        for i, query_args in enumerate(queries_args):
+            if query_args.get('mode', 'semantic') == 'semantic':
+                groups.setdefault((query_args['field'], query_args['from_'] + query_args['size']), []).append(i)
+                continue
+            try:
+                # not self.search, which is a coroutine in AsyncLocalVectorSearch
+                hits, total = LocalVectorSearch.search(self, index_name, **query_args)
+            except Exception:
+                continue
+            if source is not None:
+                hits = [{**hit, '_source': {key: hit['_source'][key] for key in source if key in hit['_source']}} for hit in hits]
+            results[i] = (hits, total)
+
+        for (field, k), indices in groups.items():
+            query_vectors = np.asarray([queries_args[i]['query_vector'] for i in indices], dtype=np.float32)
+            try:
+                rows, similarities, total = self.search_vectors(index_name, field, query_vectors, k)
+            except Exception as e:
+                logger.error(f'Error executing search of batch: {e}')
+                continue
+            for i, query_rows, query_similarities in zip(indices, rows, similarities):
+                from_ = queries_args[i]['from_']
+                hits = self._get_hits(snapshot, index_name, query_rows[from_:], (1.0 + query_similarities[from_:]) / 2.0, source)
+                results[i] = (hits, total)
+        return results
+
+    def _search_hybrid(self, snapshot: Snapshot, index_name: str, k: int, **query_args: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray, int]:
+        """
+        Find the k documents with the highest sum of boosted BM25F and kNN scores.
+
+        Args:
+            snapshot (Snapshot): The snapshot of the index.
+            index_name (str): The name of the index.
+            k (int): The number of documents returned.
+            **query_args: Query arguments from `get_query_args_hybrid`.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, int]: The rows and scores, best first, and the number of matching documents.
+        """
+        scores = query_args['text_boost'] * snapshot.get_text_index().score(query_args['query'], query_args['fields'])
+        query_vector = np.asarray(query_args['query_vector'], dtype=np.float32)[None, :]
+        rows, similarities, _ = self.search_vectors(index_name, query_args['field'], query_vector, max(k, query_args['num_candidates']))
+        scores[rows[0]] += query_args['knn_boost'] * (1.0 + similarities[0]) / 2.0
+        matches = np.flatnonzero(scores)
+        best, best_scores = top_k(scores[matches][None, :], k)
+        return matches[best[0]], best_scores[0], len(matches)
+
+    def _search_rrf(self, snapshot: Snapshot, index_name: str, k: int, **query_args: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray, int]:
+        """
+        Find the k documents with the highest reciprocal rank fusion of their full-text and kNN ranks.
+
+        Args:
+            snapshot (Snapshot): The snapshot of the index.
+            index_name (str): The name of the index.
+            k (int): The number of documents returned.
+            **query_args: Query arguments from `get_query_args_rrf`.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, int]: The rows and fused scores, best first, and the number of matching documents.
+        """
+        window = max(k, query_args['rank_window'])
+        text_rows, _, text_total = snapshot.get_text_index().search(query_args['query'], window, query_args['fields'])
+        query_vector = np.asarray(query_args['query_vector'], dtype=np.float32)[None, :]
+        vector_rows, _, _ = self.search_vectors(index_name, query_args['field'], query_vector, window)
+        fused = reciprocal_rank_fusion([text_rows.tolist(), vector_rows[0].tolist()], query_args['rank_constant'])
+        rows = np.array([row for row, _ in fused[:k]], dtype=np.int64)
+        scores = np.array([score for _, score in fused[:k]], dtype=np.float32)
+        return rows, scores, max(len(fused), text_total)
+
+    def retrieve_document(self, index_name: str, id: str) -> Optional[Dict[str, Any]]:
+        """
+        Retrieve a specific document from the snapshot of an index by its ID.
+
+        Args:
+            index_name (str): The name of the index.
+            id (str): The ID of the document to retrieve.
+
+        Returns:
+            Optional[Dict[str, Any]]: The retrieved document, or None if it is not in the snapshot.
+        """
+        snapshot = self.get_snapshot(index_name)
+        row = snapshot.rows.get(id)
+        if row is None:
+            return None
+        return {'_index': index_name, '_id': id, 'found': True, '_source': snapshot.sources[row]}
+
+
+class AsyncLocalVectorSearch(LocalVectorSearch):
+    """
+    Asynchronous variant of LocalVectorSearch, with the interface of AsyncSearch.
+
+    Searches run in a worker thread, so that scoring does not block the event loop.
+    """
+
+    async def check_connection(self):
+        """
+        Check that the snapshot directory exists.
+
+        Raises:
+            ConnectionError: If the snapshot directory does not exist.
+        """
+        if not os.path.isdir(self.path):
+            raise ConnectionError(f"Snapshot directory '{self.path}' does not exist")
+
+    async def aget_query_vector(self, query: str) -> Optional[List[float]]:
+        """
+        Compute the query vector without blocking the event loop.
+
+        Args:
+            query (str): The search query.
+
+        Returns:
+            Optional[List[float]]: The query vector.
+        """
+        return await self.embedder.aembed(query)
+
+    async def search(self, index_name: str, **query_args: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], int]:
+        return await asyncio.to_thread(LocalVectorSearch.search, self, index_name, **query_args)
+
+    async def aget_query_vectors(self, queries: List[str]) -> List[Optional[List[float]]]:
+        return await asyncio.to_thread(self.embedder.embed_many, queries)
+
+    async def search_many(self, index_name: str, queries_args: List[Dict[str, Any]],
+                          source: Optional[List[str]] = None) -> List[Optional[Tuple[List[Dict[str, Any]], int]]]:
+        return await asyncio.to_thread(LocalVectorSearch.search_many, self, index_name, queries_args, source)
+
+    async def retrieve_document(self, index_name: str, id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(LocalVectorSearch.retrieve_document, self, index_name, id)
+
+    async def close(self):
+        """
+        Release the snapshots.
+        """
+        self.snapshots.clear()
@@ -3,16 +3,38 @@ This module provides a Search class for interacting with Elasticsearch.
 
 The Search class handles connection to Elasticsearch, query construction,
 and search operations for different types of searches including semantic,
-full-text, and hybrid searches.
+full-text, and hybrid searches. When an embedder is configured, query vectors
+are computed (and cached) on the client and passed to Elasticsearch directly;
+otherwise Elasticsearch embeds the query through its inference endpoint.
+
+Indices with quantized vectors (int8_hnsw, int4_hnsw, bbq_hnsw) trade some recall for
+memory. Semantic search can make up for it by oversampling the kNN candidates and
+rescoring them with the float vectors, which quantized indices keep. Indices with
+shortened (Matryoshka) vectors in a `{field}_short` field are searched in two stages:
+kNN on the short vectors, then rescoring of the candidates with the full vectors.
+
+The kNN candidates and the boosts of each mode come from search profiles (see
+DEFAULT_SEARCH_PROFILES), tuned per index with benchmarks/knn_sweep.py and set with
+SEARCH_PROFILES in config.py.
+
+Hybrid search adds the boosted scores of a text query and a kNN query. RRF search
+instead sends a kNN search and a full-text search in one `_msearch` request, which
+Elasticsearch runs concurrently, and fuses their rankings with reciprocal rank fusion
+on the client, so that the BM25 and cosine scales do not have to be balanced.
+
+Batches of queries are embedded in one embeddings request (`get_query_vectors`) and
+searched in one `_msearch` request (`search_many`).
 
 Classes:
     Search: Main class for handling Elasticsearch operations.
 """
 
-from typing import Dict, Tuple, Any, List
+from typing import Dict, Tuple, Any, List, Optional
 from elasticsearch import Elasticsearch
 import logging
+import math
 import os
+from app.embeddings.embeddings import BaseEmbedder
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -21,6 +43,117 @@ logger = logging.getLogger(__name__)
 # the id of the inference endpoint created in ElasticSearch, for embeddings 
 INFERENCE_ID = os.getenv('INFERENCE_ID', "openai-embeddings-small")
 
+# how oversampled kNN candidates are rescored: 'none', 'native' (the rescore_vector option of the
+# knn query, Elasticsearch 8.18+) or 'script' (a rescore phase computing the exact cosine similarity,
+# which needs the query vector to be computed on the client)
+KNN_RESCORE_MODES = ['none', 'native', 'script']
+
+SEARCH_MODES = ['semantic', 'fulltext', 'hybrid', 'rrf']
+
+# the tunable parameters of each search mode; SEARCH_PROFILES in config.py overrides some of them.
+# RRF fuses the top rank_window hits of each sub-search, scoring each hit 1 / (rank_constant + rank)
+DEFAULT_SEARCH_PROFILES = {
+    'semantic': {'num_candidates': 30},
+    'hybrid': {'num_candidates': 50, 'text_boost': 0.2, 'knn_boost': 0.9},
+    'rrf': {'rank_window': 50, 'rank_constant': 60},
+}
+
+
+def get_search_profiles(profiles: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Get the search profiles, with the given parameters overriding the defaults.
+
+    Args:
+        profiles (Optional[Dict[str, Dict[str, Any]]], optional): Parameters per mode, e.g.
+            {'semantic': {'num_candidates': 100}}. Defaults to None.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: The parameters of every mode of DEFAULT_SEARCH_PROFILES.
+
+    Raises:
+        ValueError: If a mode or parameter is unknown.
+    """
+    merged = {mode: dict(profile) for mode, profile in DEFAULT_SEARCH_PROFILES.items()}
+    for mode, profile in (profiles or {}).items():
+        if mode not in merged:
+            raise ValueError(f"Unknown search mode {mode!r}, expected one of {list(merged)}")
+        unknown = set(profile) - set(merged[mode])
+        if unknown:
+            raise ValueError(f"Unknown parameters {sorted(unknown)} of search mode {mode!r}")
+        merged[mode].update(profile)
+    return merged
+
+
+def get_short_field(field: str) -> str:
+    """
+    Get the name of the field holding the shortened vectors of an embeddings field.
+
+    Args:
+        field (str): The embeddings field.
+
+    Returns:
+        str: The short field, as named by the indexing scripts.
+    """
+    return f"{field}_short"
+
+
+def reciprocal_rank_fusion(rankings: List[List[Any]], rank_constant: int = 60) -> List[Tuple[Any, float]]:
+    """
+    Fuse rankings with reciprocal rank fusion.
+
+    Args:
+        rankings (List[List[Any]]): The rankings, each a list of document keys, best first.
+        rank_constant (int, optional): The constant added to the ranks; larger values flatten the scores. Defaults to 60.
+
+    Returns:
+        List[Tuple[Any, float]]: Every key of the rankings with its fused score, best first.
+    """
+    scores: Dict[Any, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rank_constant + rank)
+    # ties keep the order in which the keys were first ranked
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+
+def get_msearch_body(query_args: Dict[str, Any], source: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Convert the keyword arguments of a search into the body of a search of an `_msearch` request.
+
+    Args:
+        query_args (Dict[str, Any]): Query arguments from one of the `get_query_args_*` methods.
+        source (Optional[List[str]], optional): The source fields returned, [] for none. Defaults to None (all).
+
+    Returns:
+        Dict[str, Any]: The search body.
+    """
+    body = {key: value for key, value in query_args.items() if key not in ('from_', '_source_excludes')}
+    if 'from_' in query_args:
+        body['from'] = query_args['from_']
+    if source is not None and not source:
+        body['_source'] = False
+    elif source is not None or '_source_excludes' in query_args:
+        body['_source'] = {'excludes': query_args.get('_source_excludes', [])}
+        if source is not None:
+            body['_source']['includes'] = source
+    return body
+
+
+def truncate_vector(vector: List[float], dims: int) -> List[float]:
+    """
+    Shorten an embedding the Matryoshka way: keep the first dims and renormalize.
+
+    Args:
+        vector (List[float]): The embedding.
+        dims (int): The number of dimensions kept.
+
+    Returns:
+        List[float]: The shortened unit vector.
+    """
+    vector = vector[:dims]
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
 class Search:
     """
     A class for handling Elasticsearch operations including connection,
@@ -28,9 +161,17 @@ class Search:
 
     Attributes:
         es (Elasticsearch): The Elasticsearch client instance.
+        embedder (Optional[BaseEmbedder]): The embedder for query vectors, or None to embed in Elasticsearch.
+        knn_oversample (float): Factor by which semantic search oversamples the kNN candidates.
+        knn_rescore (str): How the oversampled candidates are rescored, one of KNN_RESCORE_MODES.
+        knn_short_dims (Optional[int]): Dimensions of the short vectors of two-stage kNN, or None for single-stage kNN.
+        profiles (Dict[str, Dict[str, Any]]): The parameters of each search mode (see get_search_profiles).
     """
 
-    def __init__(self, elastic_url: str, elastic_user_name: str, elastic_password: str):
+    def __init__(self, elastic_url: str, elastic_user_name: str, elastic_password: str,
+                 embedder: Optional[BaseEmbedder] = None, knn_oversample: float = 1.0, knn_rescore: str = 'none',
+                 knn_short_dims: Optional[int] = None, profiles: Optional[Dict[str, Dict[str, Any]]] = None,
+                 check_connection: bool = True):
         """
         Initialize the Search class with Elasticsearch connection details.
 
@@ -38,12 +179,39 @@ class Search:
             elastic_url (str): The URL of the Elasticsearch instance.
             elastic_user_name (str): The username for Elasticsearch authentication.
             elastic_password (str): The password for Elasticsearch authentication.
+            embedder (Optional[BaseEmbedder], optional): The embedder for query vectors. Defaults to None.
+            knn_oversample (float, optional): Oversampling factor of semantic search. Defaults to 1.0 (none).
+            knn_rescore (str, optional): Rescoring of the oversampled candidates. Defaults to 'none'.
+            knn_short_dims (Optional[int], optional): Dimensions of the short vectors for two-stage kNN. Defaults to None.
+            profiles (Optional[Dict[str, Dict[str, Any]]], optional): Parameters overriding DEFAULT_SEARCH_PROFILES. Defaults to None.
+            check_connection (bool, optional): Whether to check the connection to Elasticsearch. Defaults to True.
 
         Raises:
             ConnectionError: If unable to connect to Elasticsearch.
+            ValueError: If the kNN options or the profiles are invalid.
         """
         self.es = Elasticsearch(elastic_url, basic_auth=(elastic_user_name, elastic_password))
-        self._check_connection()
+        self.embedder = embedder
+        self._set_knn_options(knn_oversample, knn_rescore, knn_short_dims)
+        self.profiles = get_search_profiles(profiles)
+        if check_connection:
+            self._check_connection()
+
+    def _set_knn_options(self, knn_oversample: float, knn_rescore: str, knn_short_dims: Optional[int] = None):
+        """
+        Set the oversampling, rescoring and two-stage mode of semantic search.
+
+        Raises:
+            ValueError: If knn_rescore is not one of KNN_RESCORE_MODES, or two-stage kNN
+                is requested without an embedder to compute the full query vector.
+        """
+        if knn_rescore not in KNN_RESCORE_MODES:
+            raise ValueError(f"knn_rescore must be one of {KNN_RESCORE_MODES}, not {knn_rescore!r}")
+        if knn_short_dims and self.embedder is None:
+            raise ValueError("Two-stage kNN needs the query vector to be computed on the client")
+        self.knn_oversample = max(1.0, knn_oversample)
+        self.knn_rescore = knn_rescore
+        self.knn_short_dims = knn_short_dims
 
     def _check_connection(self):
         """
@@ -60,37 +228,153 @@ class Search:
             logger.error(f'Error connecting to Elasticsearch: {e}')
             raise ConnectionError(f"Failed to connect to Elasticsearch: {e}")
 
-    def get_query_args_semantic(self, query: str, n: int, from_: int, field: str = 'embeddings') -> Dict[str, Any]:
+    def get_query_vector(self, query: str) -> Optional[List[float]]:
+        """
+        Compute the query vector on the client, if an embedder is configured.
+
+        Args:
+            query (str): The search query.
+
+        Returns:
+            Optional[List[float]]: The query vector, or None if Elasticsearch should embed the query.
+        """
+        if self.embedder is None:
+            return None
+        return self.embedder.embed(query)
+
+    def get_query_vectors(self, queries: List[str]) -> List[Optional[List[float]]]:
+        """
+        Compute the vectors of several queries on the client in one embeddings request, if an embedder is configured.
+
+        Args:
+            queries (List[str]): The search queries.
+
+        Returns:
+            List[Optional[List[float]]]: The query vectors, or Nones if Elasticsearch should embed the queries.
+        """
+        if self.embedder is None:
+            return [None] * len(queries)
+        return self.embedder.embed_many(queries)
+
+    def _get_knn_vector_args(self, query: str, query_vector: Optional[List[float]]) -> Dict[str, Any]:
+        """
+        Construct the query vector part of a kNN clause.
+
+        Args:
+            query (str): The search query.
+            query_vector (Optional[List[float]]): A precomputed query vector, if any.
+
+        Returns:
+            Dict[str, Any]: Either a `query_vector` or a `query_vector_builder` using the inference endpoint.
+        """
+        if query_vector is None:
+            query_vector = self.get_query_vector(query)
+        if query_vector is not None:
+            return {"query_vector": query_vector}
+        return {
+            "query_vector_builder": {
+                "text_embedding": {
+                    "model_id": INFERENCE_ID,
+                    "model_text": query,
+                }
+            },
+        }
+
+    def _get_knn_field_args(self, query: str, field: str, query_vector: Optional[List[float]]) -> Dict[str, Any]:
+        """
+        Construct the field and query vector parts of a kNN clause.
+
+        In two-stage mode, the clause searches the short field with the shortened query vector.
+
+        Args:
+            query (str): The search query.
+            field (str): The embeddings field.
+            query_vector (Optional[List[float]]): A precomputed query vector, if any.
+
+        Returns:
+            Dict[str, Any]: The `field` and query vector arguments.
+        """
+        if self.knn_short_dims:
+            if query_vector is None:
+                query_vector = self.get_query_vector(query)
+            return {"field": get_short_field(field), "query_vector": truncate_vector(query_vector, self.knn_short_dims)}
+        return {"field": field, **self._get_knn_vector_args(query, query_vector)}
+
+    def _get_script_rescore_args(self, field: str, query_vector: List[float], window_size: int) -> Dict[str, Any]:
+        """
+        Construct a rescore phase replacing the kNN scores of the top window_size hits with exact cosine similarities.
+
+        Args:
+            field (str): The embeddings field.
+            query_vector (List[float]): The query vector.
+            window_size (int): The number of hits rescored.
+
+        Returns:
+            Dict[str, Any]: The rescore argument of the search.
+        """
+        return {
+            "window_size": window_size,
+            "query": {
+                "rescore_query": {
+                    "script_score": {
+                        "query": {"match_all": {}},
+                        "script": {
+                            # same scale as the kNN score of cosine similarity
+                            "source": f"(cosineSimilarity(params.query_vector, '{field}') + 1.0) / 2.0",
+                            "params": {"query_vector": query_vector},
+                        },
+                    }
+                },
+                "query_weight": 0.0,
+                "rescore_query_weight": 1.0,
+            },
+        }
+
+    def get_query_args_semantic(self, query: str, n: int, from_: int, field: str = 'embeddings',
+                                query_vector: Optional[List[float]] = None) -> Dict[str, Any]:
         """
         Construct query arguments for semantic search.
 
+        The kNN clause considers the num_candidates of the semantic profile. With oversampling,
+        knn_oversample times more candidates than the requested hits are retrieved, and rescored with the float vectors if knn_rescore is set. In two-stage
+        mode, the candidates found with the short vectors are always rescored with the full ones.
+
         Args:
             query (str): The search query.
             n (int): The number of results to return.
             from_ (int): The starting point for pagination.
             field (str, optional): The embeddings field to search. Defaults to 'embeddings'.
+            query_vector (Optional[List[float]], optional): A precomputed query vector. Defaults to None.
 
         Returns:
             Dict[str, Any]: The constructed query arguments.
         """
-        return {
-            'query': {
-                'knn': {
-                    "field": field,
-                    "num_candidates": 30,
-                    "query_vector_builder": {
-                        "text_embedding": {
-                            "model_id": INFERENCE_ID,
-                            "model_text": query,
-                        }
-                    },
-                },
-            },
+        window = from_ + n
+        oversampled = math.ceil(window * self.knn_oversample)
+        if self.knn_short_dims and query_vector is None:
+            query_vector = self.get_query_vector(query)
+        knn = {
+            **self._get_knn_field_args(query, field, query_vector),
+            # the knn query returns at most num_candidates hits per shard, so deeper pages need more
+            "num_candidates": max(self.profiles['semantic']['num_candidates'], oversampled),
+        }
+        query_args = {
+            'query': {'knn': knn},
             'size': n,
             'from_': from_,
-            '_source_excludes': ['embeddings', 'normalized_embeddings'],
+            '_source_excludes': ['embeddings*', 'normalized_embeddings*'],
             # remember to exclude embedding fields and any other large fields for efficiency!!
         }
+        if self.knn_short_dims:
+            query_args['rescore'] = self._get_script_rescore_args(field, query_vector, knn["num_candidates"])
+        elif self.knn_oversample > 1 and self.knn_rescore == 'native':
+            knn["rescore_vector"] = {"oversample": self.knn_oversample}
+        elif self.knn_oversample > 1 and self.knn_rescore == 'script':
+            if "query_vector" in knn:
+                query_args['rescore'] = self._get_script_rescore_args(field, knn["query_vector"], knn["num_candidates"])
+            else:
+                logger.warning('Script rescoring needs the query vector to be computed on the client, not rescoring')
+        return query_args
     
     def get_query_args_fulltext(self, query: str, n: int, from_: int) -> Dict[str, Any]:
         """
@@ -114,53 +398,189 @@ class Search:
             },
             'size': n,
             'from_': from_,
-            '_source_excludes': ['embeddings', 'normalized_embeddings'],
+            '_source_excludes': ['embeddings*', 'normalized_embeddings*'],
             # remember to exclude embedding fields and any other large fields for efficiency!!
         }
     
-    def get_query_args_hybrid(self, query: str, n: int, from_: int, field: str = 'embeddings') -> Dict[str, Any]:
+    def get_query_args_hybrid(self, query: str, n: int, from_: int, field: str = 'embeddings',
+                              query_vector: Optional[List[float]] = None) -> Dict[str, Any]:
         """
         Construct query arguments for hybrid search (combination of semantic and full-text).
 
+        The scores of the text and kNN parts are added, weighted by the boosts of the hybrid profile.
+
         Args:
             query (str): The search query.
             n (int): The number of results to return.
             from_ (int): The starting point for pagination.
             field (str, optional): The embeddings field to use for semantic search. Defaults to 'embeddings'.
+            query_vector (Optional[List[float]], optional): A precomputed query vector. Defaults to None.
 
         Returns:
             Dict[str, Any]: The constructed query arguments.
         """
+        profile = self.profiles['hybrid']
         return {
             "query": {
                 "multi_match": {
                     "query": query,
                     "type": "most_fields",
                     "fields": ["normalized_info", "description", "submission_info"],
-                    "boost": 0.2
+                    "boost": profile['text_boost']
                 }
             },
             "knn": {
-                "field": field,
-                "num_candidates": 50,
-                "boost": 0.9,
-                "query_vector_builder": {
-                    "text_embedding": {
-                        "model_id": INFERENCE_ID,
-                        "model_text": query,
-                    }
-                },
+                **self._get_knn_field_args(query, field, query_vector),
+                "num_candidates": max(profile['num_candidates'], from_ + n),
+                "boost": profile['knn_boost'],
             },
             'size': n,
             'from_': from_,
-            '_source_excludes': ['embeddings', 'normalized_embeddings'],
+            '_source_excludes': ['embeddings*', 'normalized_embeddings*'],
             # remember to exclude embedding fields and any other large fields for efficiency!!
         }
 
+    def get_query_args_rrf(self, query: str, n: int, from_: int, field: str = 'embeddings',
+                           query_vector: Optional[List[float]] = None) -> Dict[str, Any]:
+        """
+        Construct query arguments for hybrid search with reciprocal rank fusion.
+
+        The arguments hold a semantic and a full-text search of the top rank_window hits
+        (at least from_ + n), which `search` sends in one `_msearch` request and fuses.
+
+        Args:
+            query (str): The search query.
+            n (int): The number of results to return.
+            from_ (int): The starting point for pagination.
+            field (str, optional): The embeddings field to use for semantic search. Defaults to 'embeddings'.
+            query_vector (Optional[List[float]], optional): A precomputed query vector. Defaults to None.
+
+        Returns:
+            Dict[str, Any]: The constructed query arguments.
+        """
+        profile = self.profiles['rrf']
+        window = max(profile['rank_window'], from_ + n)
+        return {
+            'retrievers': [
+                self.get_query_args_semantic(query, window, 0, field=field, query_vector=query_vector),
+                self.get_query_args_fulltext(query, window, 0),
+            ],
+            'rank_constant': profile['rank_constant'],
+            'size': n,
+            'from_': from_,
+        }
+
+    def get_query_args(self, mode: str, query: str, n: int, from_: int, field: str = 'embeddings',
+                       query_vector: Optional[List[float]] = None) -> Dict[str, Any]:
+        """
+        Construct query arguments for a search mode.
+
+        Args:
+            mode (str): One of SEARCH_MODES.
+            query (str): The search query.
+            n (int): The number of results to return.
+            from_ (int): The starting point for pagination.
+            field (str, optional): The embeddings field, unused by full-text search. Defaults to 'embeddings'.
+            query_vector (Optional[List[float]], optional): A precomputed query vector. Defaults to None.
+
+        Returns:
+            Dict[str, Any]: The constructed query arguments.
+
+        Raises:
+            ValueError: If the mode is unknown.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode {mode!r}, expected one of {SEARCH_MODES}")
+        if mode == 'fulltext':
+            return self.get_query_args_fulltext(query, n, from_)
+        return getattr(self, f'get_query_args_{mode}')(query, n, from_, field=field, query_vector=query_vector)
+
+    def _get_msearch_args(self, index_name: str, queries_args: List[Dict[str, Any]],
+                          source: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Construct the searches of an `_msearch` request, with the sub-searches of RRF searches in turn.
+
+        Args:
+            index_name (str): The name of the index.
+            queries_args (List[Dict[str, Any]]): Query arguments from the `get_query_args_*` methods.
+            source (Optional[List[str]], optional): The source fields returned, [] for none. Defaults to None (all).
+
+        Returns:
+            List[Dict[str, Any]]: The header and body of each search.
+        """
+        searches = []
+        for query_args in queries_args:
+            for retriever_args in query_args.get('retrievers', [query_args]):
+                searches.extend([{'index': index_name}, get_msearch_body(retriever_args, source)])
+        return searches
+
+    def _split_responses(self, responses: List[Dict[str, Any]],
+                         queries_args: List[Dict[str, Any]]) -> List[Optional[Tuple[List[Dict[str, Any]], int]]]:
+        """
+        Get the results of each query of an `_msearch` request, fusing the responses of RRF searches.
+
+        Args:
+            responses (List[Dict[str, Any]]): The `_msearch` responses.
+            queries_args (List[Dict[str, Any]]): The query arguments the searches were built from.
+
+        Returns:
+            List[Optional[Tuple[List[Dict[str, Any]], int]]]: The hits and total number of matches of each query,
+                or None for a query whose search failed.
+        """
+        results, position = [], 0
+        for query_args in queries_args:
+            count = len(query_args.get('retrievers', [query_args]))
+            query_responses = responses[position:position + count]
+            position += count
+            try:
+                if 'retrievers' in query_args:
+                    results.append(self._fuse_responses(query_responses, query_args))
+                elif 'error' in query_responses[0]:
+                    raise RuntimeError(query_responses[0]['error'])
+                else:
+                    res = query_responses[0]
+                    results.append((res['hits']['hits'], res['hits']['total']['value']))
+            except RuntimeError as e:
+                logger.error(f'Error executing search of batch: {e}')
+                results.append(None)
+        return results
+
+    def _fuse_responses(self, responses: List[Dict[str, Any]], query_args: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Fuse the responses of the sub-searches of an RRF search.
+
+        Args:
+            responses (List[Dict[str, Any]]): The `_msearch` responses.
+            query_args (Dict[str, Any]): Query arguments from `get_query_args_rrf`.
+
+        Returns:
+            Tuple[List[Dict[str, Any]], int]: The hits of the page, with their fused scores, and the total number of matches.
+
+        Raises:
+            RuntimeError: If a sub-search failed.
+        """
+        for response in responses:
+            if 'error' in response:
+                raise RuntimeError(f"Sub-search of RRF search failed: {response['error']}")
+        hits = {}
+        rankings = []
+        for response in responses:
+            ranking = response['hits']['hits']
+            for hit in ranking:
+                hits.setdefault(hit['_id'], hit)
+            rankings.append([hit['_id'] for hit in ranking])
+        fused = reciprocal_rank_fusion(rankings, query_args['rank_constant'])
+        from_, size = query_args['from_'], query_args['size']
+        page = [{**hits[id], '_score': score} for id, score in fused[from_:from_ + size]]
+        total = max([len(fused)] + [response['hits']['total']['value'] for response in responses])
+        return page, total
+
     def search(self, index_name: str, **query_args: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], int]:
         """
         Execute a search query on the specified Elasticsearch index.
 
+        The sub-searches of an RRF search are sent in one `_msearch` request and fused.
+
         Args:
             index_name (str): The name of the Elasticsearch index to search.
             **query_args: Arbitrary keyword arguments for the search query.
@@ -172,6 +592,9 @@ class Search:
             ElasticsearchException: If an error occurs during the search operation.
         """
         try:
+            if 'retrievers' in query_args:
+                res = self.es.msearch(searches=self._get_msearch_args(index_name, [query_args]))
+                return self._fuse_responses(res['responses'], query_args)
             res = self.es.search(index=index_name, **query_args)
             hits = res['hits']['hits']
             total = res['hits']['total']['value']
@@ -180,6 +603,32 @@ class Search:
             logger.error(f'Error executing search: {e}')
             raise
 
+    def search_many(self, index_name: str, queries_args: List[Dict[str, Any]],
+                    source: Optional[List[str]] = None) -> List[Optional[Tuple[List[Dict[str, Any]], int]]]:
+        """
+        Execute several search queries on the specified Elasticsearch index in one `_msearch` request.
+
+        Args:
+            index_name (str): The name of the Elasticsearch index to search.
+            queries_args (List[Dict[str, Any]]): Query arguments from the `get_query_args_*` methods.
+            source (Optional[List[str]], optional): The source fields returned, [] for none. Defaults to None (all).
+
+        Returns:
+            List[Optional[Tuple[List[Dict[str, Any]], int]]]: The hits and total number of matches of each query,
+                or None for a query whose search failed.
+
+        Raises:
+            ElasticsearchException: If the request fails as a whole.
+        """
+        if not queries_args:
+            return []
+        try:
+            res = self.es.msearch(searches=self._get_msearch_args(index_name, queries_args, source))
+            return self._split_responses(res['responses'], queries_args)
+        except Exception as e:
+            logger.error(f'Error executing batch search: {e}')
+            raise
+
     def retrieve_document(self, index_name: str, id: str) -> Dict[str, Any]:
         """
         Retrieve a specific document from the Elasticsearch index by its ID.
@@ -195,7 +644,7 @@ class Search:
             ElasticsearchException: If an error occurs during the document retrieval.
         """
         try:
-            res = self.es.get(index=index_name, id=id, _source_excludes=['embeddings', 'normalized_embeddings'])
+            res = self.es.get(index=index_name, id=id, _source_excludes=['embeddings*', 'normalized_embeddings*'])
             return res
         except Exception as e:
             logger.error(f'Error retrieving document: {e}')
@@ -0,0 +1,157 @@
+"""
+This module provides a SearchSessionCache class for serving result pages from a cached candidate window.
+
+The first search for a query retrieves a larger window of candidates (for example
+the top 50) and keeps it for a short time, keyed by the normalized query, the search
+mode and the embeddings field. Later pages that fall inside the window are sliced from
+the cache instead of running a new kNN search; pages beyond it go to Elasticsearch.
+
+Classes:
+    SearchSessionCache: Short-lived cache of candidate windows for pagination.
+"""
+
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple, Union
+from app.cache.cache import BaseCache, normalize_query
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class SearchSessionCache:
+    """
+    A short-lived cache of candidate windows, used to serve later result pages.
+
+    Attributes:
+        backend (BaseCache): The key-value store holding the windows, typically an LRUCache with a short TTL.
+        window (int): Number of candidates retrieved by the first search of a query.
+        hits (int): Number of pages served from a cached window.
+        misses (int): Number of pages that required a search.
+    """
+
+    def __init__(self, backend: BaseCache, window: int = 50):
+        """
+        Initialize the SearchSessionCache.
+
+        Args:
+            backend (BaseCache): The key-value store holding the windows.
+            window (int, optional): Number of candidates retrieved by the first search of a query. Defaults to 50.
+        """
+        self.backend = backend
+        self.window = window
+        self.hits: int = 0
+        self.misses: int = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(query: str, mode: str, field: str) -> str:
+        """
+        Build the cache key for a candidate window.
+
+        Args:
+            query (str): The user's query.
+            mode (str): The search mode, e.g. 'semantic' or 'hybrid'.
+            field (str): The embeddings field searched.
+
+        Returns:
+            str: The cache key.
+        """
+        raw = '\x1f'.join([normalize_query(query), mode, field])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def covers(self, from_: int, size: int) -> bool:
+        """
+        Check whether a page can be served from a window once it is cached.
+
+        Args:
+            from_ (int): The starting point of the page.
+            size (int): The number of results of the page.
+
+        Returns:
+            bool: True if the page lies inside the window.
+        """
+        return from_ + size <= self.window
+
+    def get_window(self, query: str, mode: str, field: str) -> Optional[Tuple[List[Dict], int]]:
+        """
+        Look up the cached window of a query, without counting a page hit or miss.
+
+        Args:
+            query (str): The user's query.
+            mode (str): The search mode.
+            field (str): The embeddings field searched.
+
+        Returns:
+            Optional[Tuple[List[Dict], int]]: The hits of the window and the total number of matches, or None.
+        """
+        entry = self.backend.get(self.make_key(query, mode, field))
+        if entry is None:
+            return None
+        return entry['hits'], entry['total']
+
+    def get_page(self, query: str, mode: str, field: str, from_: int,
+                 size: int) -> Optional[Tuple[List[Dict], int]]:
+        """
+        Slice a page out of the cached window of a query.
+
+        Args:
+            query (str): The user's query.
+            mode (str): The search mode.
+            field (str): The embeddings field searched.
+            from_ (int): The starting point of the page.
+            size (int): The number of results of the page.
+
+        Returns:
+            Optional[Tuple[List[Dict], int]]: The hits of the page and the total number of matches,
+            or None if no window is cached or the page lies beyond it.
+        """
+        window = self.get_window(query, mode, field)
+        page = None
+        if window is not None:
+            hits, total = window
+            # a window shorter than requested holds every match, so any page is covered
+            if from_ + size <= len(hits) or len(hits) >= total:
+                page = hits[from_:from_ + size], total
+
+        with self._lock:
+            if page is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return page
+
+    def set_window(self, query: str, mode: str, field: str, hits: List[Dict], total: int) -> None:
+        """
+        Store the candidate window of a query.
+
+        Args:
+            query (str): The user's query.
+            mode (str): The search mode.
+            field (str): The embeddings field searched.
+            hits (List[Dict]): The top hits, starting from the first one.
+            total (int): The total number of matches.
+        """
+        try:
+            self.backend.set(self.make_key(query, mode, field), {'hits': hits, 'total': total})
+        except Exception as e:
+            logger.error(f"Error caching search window: {str(e)}")
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        """
+        Get the cache counters.
+
+        Returns:
+            Dict[str, Union[int, float]]: Hits, misses, hit rate, evictions and size.
+        """
+        lookups = self.hits + self.misses
+        backend_stats = self.backend.stats()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': backend_stats['evictions'],
+            'size': backend_stats['size'],
+        }
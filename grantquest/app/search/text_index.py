@@ -0,0 +1,232 @@
+"""
+This module provides an in-process inverted index with BM25F scoring.
+
+The index is built over text fields of the documents of a snapshot (see local_search.py),
+so that full-text and hybrid search can run without Elasticsearch. Postings are stored in
+flat NumPy arrays, saved to disk and memory-mapped when loaded:
+
+    meta.json       fields, number of documents, average field lengths and the snapshot it was built from
+    terms.json      the terms, sorted; term i has postings offsets[i]:offsets[i + 1]
+    offsets.npy     int64 start of the postings of each term
+    docs.npy        int32 document rows of the postings, increasing within each term
+    tfs.npy         uint16 frequency of the term in each field, of shape (postings, fields)
+    lengths.npy     uint32 length in tokens of each field, of shape (documents, fields)
+
+Fields are combined with BM25F: the term frequencies of each field are normalized by
+the field length and weighted before saturation, so a term counts once per document.
+
+Classes:
+    TextIndex: Inverted index with BM25F scoring.
+"""
+
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import json
+import logging
+import os
+import re
+import numpy as np
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def tokenize(text: Any) -> List[str]:
+    """
+    Split text into lowercase word tokens, like the standard analyzer of Elasticsearch.
+
+    Args:
+        text (Any): The text, or a value converted to text.
+
+    Returns:
+        List[str]: The tokens.
+    """
+    if text is None:
+        return []
+    if not isinstance(text, str):
+        text = json.dumps(text) if isinstance(text, (dict, list)) else str(text)
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class TextIndex:
+    """
+    An inverted index over text fields with BM25F scoring.
+
+    Attributes:
+        fields (List[str]): The indexed fields.
+        terms (Dict[str, int]): The id of each term.
+        offsets (np.ndarray): The start of the postings of each term.
+        docs (np.ndarray): The document rows of the postings.
+        tfs (np.ndarray): The per-field term frequencies of the postings.
+        lengths (np.ndarray): The per-field lengths of the documents.
+        k1 (float): BM25 term frequency saturation.
+        b (float): BM25 length normalization.
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        """
+        Load an index, memory-mapping its arrays.
+
+        Args:
+            path (str): The index directory.
+            k1 (float, optional): BM25 term frequency saturation. Defaults to 1.2.
+            b (float, optional): BM25 length normalization. Defaults to 0.75.
+        """
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        with open(os.path.join(path, 'terms.json')) as f:
+            self.terms = {term: i for i, term in enumerate(json.load(f))}
+        self.fields: List[str] = self.meta['fields']
+        self.offsets = np.load(os.path.join(path, 'offsets.npy'), mmap_mode='r')
+        self.docs = np.load(os.path.join(path, 'docs.npy'), mmap_mode='r')
+        self.tfs = np.load(os.path.join(path, 'tfs.npy'), mmap_mode='r')
+        self.lengths = np.load(os.path.join(path, 'lengths.npy'), mmap_mode='r')
+        self.average_lengths = np.maximum(np.asarray(self.meta['average_lengths'], dtype=np.float32), 1.0)
+        self.k1 = k1
+        self.b = b
+
+    @property
+    def num_docs(self) -> int:
+        return self.meta['num_docs']
+
+    @staticmethod
+    def build(documents: List[Dict[str, Any]], fields: List[str], path: str, snapshot: Optional[str] = None) -> None:
+        """
+        Build the index of documents and save it.
+
+        Args:
+            documents (List[Dict[str, Any]]): The document sources, in row order.
+            fields (List[str]): The fields to index.
+            path (str): The index directory.
+            snapshot (Optional[str], optional): The version of the snapshot indexed. Defaults to None.
+        """
+        os.makedirs(path, exist_ok=True)
+        vocabulary: Dict[str, int] = {}
+        term_ids, rows, field_ids, counts = [], [], [], []
+        lengths = np.zeros((len(documents), len(fields)), dtype=np.uint32)
+        for row, document in enumerate(documents):
+            for f, field in enumerate(fields):
+                tokens = tokenize(document.get(field))
+                lengths[row, f] = len(tokens)
+                for term, count in Counter(tokens).items():
+                    term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                    rows.append(row)
+                    field_ids.append(f)
+                    counts.append(count)
+
+        # renumber the terms in sorted order, then sort the entries by term and row
+        terms = sorted(vocabulary)
+        rank = np.empty(len(vocabulary), dtype=np.int64)
+        rank[[vocabulary[term] for term in terms]] = np.arange(len(terms))
+        term_ids = rank[np.asarray(term_ids, dtype=np.int64)]
+        rows = np.asarray(rows, dtype=np.int64)
+        order = np.lexsort((rows, term_ids))
+        term_ids, rows = term_ids[order], rows[order]
+        field_ids = np.asarray(field_ids, dtype=np.int64)[order]
+        counts = np.asarray(counts, dtype=np.int64)[order]
+
+        # one posting per (term, row), with the frequencies of all fields
+        starts = np.ones(len(rows), dtype=bool)
+        starts[1:] = (term_ids[1:] != term_ids[:-1]) | (rows[1:] != rows[:-1])
+        posting_ids = np.cumsum(starts) - 1
+        tfs = np.zeros((int(starts.sum()), len(fields)), dtype=np.uint16)
+        np.add.at(tfs, (posting_ids, field_ids), np.minimum(counts, np.iinfo(np.uint16).max).astype(np.uint16))
+        posting_terms = term_ids[starts]
+        offsets = np.searchsorted(posting_terms, np.arange(len(terms) + 1)).astype(np.int64)
+
+        np.save(os.path.join(path, 'offsets.npy'), offsets)
+        np.save(os.path.join(path, 'docs.npy'), rows[starts].astype(np.int32))
+        np.save(os.path.join(path, 'tfs.npy'), tfs)
+        np.save(os.path.join(path, 'lengths.npy'), lengths)
+        with open(os.path.join(path, 'terms.json'), 'w') as f:
+            json.dump(terms, f)
+        # written last: an index without meta.json is incomplete
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({'fields': fields, 'num_docs': len(documents), 'snapshot': snapshot,
+                       'average_lengths': (lengths.mean(axis=0) if len(documents) else np.zeros(len(fields))).tolist()}, f)
+
+    @classmethod
+    def load_or_build(cls, path: str, documents: List[Dict[str, Any]], fields: List[str],
+                      snapshot: Optional[str] = None) -> 'TextIndex':
+        """
+        Load the index at path, or build it there if it is missing or was built from another snapshot.
+
+        Args:
+            path (str): The index directory.
+            documents (List[Dict[str, Any]]): The document sources, in row order.
+            fields (List[str]): The fields to index.
+            snapshot (Optional[str], optional): The version of the snapshot indexed. Defaults to None.
+
+        Returns:
+            TextIndex: The index.
+        """
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta['fields'] == fields and meta['num_docs'] == len(documents) and meta.get('snapshot') == snapshot:
+                return cls(path)
+            os.remove(meta_path)
+        logger.info(f'Building text index of {len(documents)} documents over {fields}')
+        cls.build(documents, fields, path, snapshot=snapshot)
+        return cls(path)
+
+    def score(self, query: str, fields: Optional[List[str]] = None, weights: Optional[Dict[str, float]] = None) -> np.ndarray:
+        """
+        Compute the BM25F score of every document for a query.
+
+        Args:
+            query (str): The query text.
+            fields (Optional[List[str]], optional): The fields searched. Defaults to all indexed fields.
+            weights (Optional[Dict[str, float]], optional): The weight of each field. Defaults to 1.0.
+
+        Returns:
+            np.ndarray: The scores, of shape (documents,); 0 for documents matching no query term.
+        """
+        weights = weights or {}
+        searched = set(fields or self.fields)
+        field_weights = np.array([weights.get(field, 1.0) if field in searched else 0.0 for field in self.fields],
+                                 dtype=np.float32)
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.terms.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.docs[start:end]
+            tfs = self.tfs[start:end].astype(np.float32)
+            norms = 1.0 - self.b + self.b * self.lengths[docs] / self.average_lengths
+            tf = (tfs / norms) @ field_weights
+            df = np.count_nonzero(tfs @ field_weights)
+            if df == 0:
+                continue
+            idf = np.log(1.0 + (self.num_docs - df + 0.5) / (df + 0.5))
+            # rows are unique within a term, so the fancy-indexed add is safe
+            scores[docs] += idf * tf / (self.k1 + tf)
+        return scores
+
+    def search(self, query: str, k: int, fields: Optional[List[str]] = None,
+               weights: Optional[Dict[str, float]] = None) -> Tuple[np.ndarray, np.ndarray, int]:
+        """
+        Find the k documents with the highest BM25F scores.
+
+        Args:
+            query (str): The query text.
+            k (int): The number of documents returned.
+            fields (Optional[List[str]], optional): The fields searched. Defaults to all indexed fields.
+            weights (Optional[Dict[str, float]], optional): The weight of each field. Defaults to 1.0.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, int]: The rows and scores, best first, and the number of matching documents.
+        """
+        scores = self.score(query, fields, weights)
+        matches = np.flatnonzero(scores)
+        k = min(k, len(matches))
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32), 0
+        best = matches[np.argpartition(-scores[matches], k - 1)[:k]]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return best, scores[best], len(matches)
@@ -0,0 +1,197 @@
+"""
+This module provides a PromptTemplate class that builds snippet prompts with precomputed token accounting.
+
+The fixed parts of a prompt (prefix, suffix and batch suffix) are tokenized once when
+the template is created. Grant payloads are memoized by grant id and content: the token
+count of each payload is remembered, and for payloads too long for the prompt the leading
+tokens are kept, so that truncating them for any query only needs a decode. Rebuilding
+the prompts of a page therefore no longer re-tokenizes every grant.
+
+Classes:
+    PromptTemplate: Prompt builder with memoized token accounting.
+"""
+
+import json
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional
+from app.cache.cache import LRUCache
+from app.clients.clients import BaseClient
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# tokens kept free for message framing when sizing the grant payload
+PROMPT_MARGIN_TOKENS = 50
+
+
+class PromptTemplate:
+    """
+    A snippet prompt builder that tokenizes the fixed parts once and memoizes grant payloads.
+
+    Attributes:
+        client (BaseClient): The client whose tokenizer and limits are used.
+        prefix (List[Dict[str, str]]): The messages preceding the query and grant information.
+        suffix (List[Dict[str, str]]): The messages following the query and grant information.
+        batch_suffix (Optional[List[Dict[str, str]]]): The suffix of batched prompts, if batching is used.
+        fixed_tokens (int): The tokens of the prefix and suffix.
+        batch_fixed_tokens (Optional[int]): The tokens of the prefix and batch suffix, if batching is used.
+        version (str): A hash of the fixed parts and generation settings, used in cache keys.
+    """
+
+    def __init__(self, client: BaseClient, prefix: List[Dict[str, str]], suffix: List[Dict[str, str]],
+                 batch_suffix: Optional[List[Dict[str, str]]] = None, settings: Optional[Dict[str, Any]] = None,
+                 payload_cache_size: int = 10000):
+        """
+        Initialize the PromptTemplate and tokenize its fixed parts.
+
+        Args:
+            client (BaseClient): The client whose tokenizer and limits are used.
+            prefix (List[Dict[str, str]]): The messages preceding the query and grant information.
+            suffix (List[Dict[str, str]]): The messages following the query and grant information.
+            batch_suffix (Optional[List[Dict[str, str]]], optional): The suffix of batched prompts. Defaults to None.
+            settings (Optional[Dict[str, Any]], optional): Generation settings included in the version, e.g. the temperature.
+            payload_cache_size (int, optional): Maximum number of memoized payload entries. Defaults to 10000.
+        """
+        self.client = client
+        self.prefix = prefix
+        self.suffix = suffix
+        self.batch_suffix = batch_suffix
+        self.fixed_tokens = self._count_messages(prefix + suffix)
+        self.batch_fixed_tokens = self._count_messages(prefix + batch_suffix) if batch_suffix is not None else None
+
+        fixed_prompt = prefix + suffix + (batch_suffix or [])
+        raw = json.dumps({'prompt': fixed_prompt, **(settings or {})}, sort_keys=True)
+        self.version = hashlib.sha256(raw.encode('utf-8')).hexdigest()[:16]
+
+        self._payloads = LRUCache(payload_cache_size)
+
+    def _count_messages(self, messages: List[Dict[str, str]]) -> int:
+        return sum(len(self.client.encode(message['content'])) for message in messages)
+
+    def _tokenize_payload(self, data: Dict[str, Any], grant_key: Optional[str], max_tokens: int) -> Dict[str, Any]:
+        """
+        Get the token count of a grant payload and, if it exceeds `max_tokens`, its leading tokens.
+
+        Args:
+            data (Dict[str, Any]): The grant information.
+            grant_key (Optional[str]): The grant id and version; None disables memoization.
+            max_tokens (int): The token budget the leading tokens must cover.
+
+        Returns:
+            Dict[str, Any]: The 'count' of tokens and the leading tokens as 'head' (None if not kept).
+        """
+        entry = self._payloads.get(grant_key) if grant_key is not None else None
+        if entry is None or (entry['count'] > max_tokens and (entry['head'] is None or len(entry['head']) < max_tokens)):
+            tokens = self.client.encode(str(data))
+            head = None
+            if len(tokens) > max_tokens:
+                # the largest budget any query can leave for the payload
+                head = tokens[:max(max_tokens, self.client.max_input_len - self.fixed_tokens - PROMPT_MARGIN_TOKENS)]
+            entry = {'count': len(tokens), 'head': head}
+            if grant_key is not None:
+                self._payloads.set(grant_key, entry)
+        return entry
+
+    def payload_tokens(self, data: Dict[str, Any], grant_key: Optional[str] = None) -> int:
+        """
+        Count the tokens of a grant payload, memoized by grant key.
+
+        Args:
+            data (Dict[str, Any]): The grant information.
+            grant_key (Optional[str], optional): The grant id and version; None disables memoization.
+
+        Returns:
+            int: The number of tokens of the payload.
+        """
+        return self._tokenize_payload(data, grant_key, self.client.max_input_len)['count']
+
+    def payload(self, data: Dict[str, Any], max_tokens: int, grant_key: Optional[str] = None) -> str:
+        """
+        Get a grant payload truncated to a token budget, memoized by grant key.
+
+        Args:
+            data (Dict[str, Any]): The grant information.
+            max_tokens (int): The maximum number of tokens of the payload.
+            grant_key (Optional[str], optional): The grant id and version; None disables memoization.
+
+        Returns:
+            str: The payload, truncated if needed.
+        """
+        entry = self._tokenize_payload(data, grant_key, max_tokens)
+        if entry['count'] <= max_tokens:
+            return str(data)
+        return self.client.decode(entry['head'][:max_tokens])
+
+    def max_payload_tokens(self, query: str) -> int:
+        """
+        Get the token budget of the grant payload of a single-grant prompt.
+
+        Args:
+            query (str): The user's query.
+
+        Returns:
+            int: The maximum number of tokens of the payload.
+        """
+        return self.client.max_input_len - self.fixed_tokens - len(self.client.encode(query)) - PROMPT_MARGIN_TOKENS
+
+    def max_batch_payload_tokens(self, query: str) -> int:
+        """
+        Get the token budget shared by the grant payloads of a batched prompt.
+
+        Args:
+            query (str): The user's query.
+
+        Returns:
+            int: The maximum number of tokens of all payloads together.
+
+        Raises:
+            ValueError: If the template has no batch suffix.
+        """
+        if self.batch_fixed_tokens is None:
+            raise ValueError("The template has no batch suffix")
+        return self.client.max_input_len - self.batch_fixed_tokens - len(self.client.encode(query)) - PROMPT_MARGIN_TOKENS
+
+    def build(self, query: str, data: Dict[str, Any], grant_key: Optional[str] = None) -> List[Dict[str, str]]:
+        """
+        Build the prompt for a single grant, truncating the grant to fit the input limit.
+
+        Args:
+            query (str): The user's query.
+            data (Dict[str, Any]): The grant information.
+            grant_key (Optional[str], optional): The grant id and version, used to memoize the payload.
+
+        Returns:
+            List[Dict[str, str]]: The full prompt as a list of message dictionaries.
+        """
+        payload = self.payload(data, self.max_payload_tokens(query), grant_key)
+        return [
+            *self.prefix,
+            {'role': "user", 'content': f'Query - <{query}>\nGrant - <{payload}>'},
+            *self.suffix,
+        ]
+
+    def build_batch(self, query: str, datas: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """
+        Build the prompt for several grants. The grants are not truncated.
+
+        Args:
+            query (str): The user's query.
+            datas (List[Dict[str, Any]]): The information of each grant.
+
+        Returns:
+            List[Dict[str, str]]: The full prompt as a list of message dictionaries.
+
+        Raises:
+            ValueError: If the template has no batch suffix.
+        """
+        if self.batch_suffix is None:
+            raise ValueError("The template has no batch suffix")
+        grants = '\n'.join(f'<grant id="{k + 1}">{data}</grant>' for k, data in enumerate(datas))
+        return [
+            *self.prefix,
+            {'role': "user", 'content': f'Query - <{query}>\nGrants -\n{grants}'},
+            *self.batch_suffix,
+        ]
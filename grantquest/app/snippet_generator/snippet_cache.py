@@ -0,0 +1,150 @@
+"""
+This module provides a SnippetCache class for reusing query-focused snippets across searches.
+
+Snippets are keyed by the normalized query, the grant id, the LLM name and a hash of
+the prompt template, so changing the model or the prompt never serves stale output.
+Each entry remembers the `modified_date` of the grant it was generated for; when a
+grant is modified, all of its cached snippets are evicted on the next lookup.
+
+Classes:
+    SnippetCache: Snippet-level cache layered over a pluggable cache backend.
+"""
+
+import hashlib
+import logging
+import threading
+from typing import Dict, Optional, Tuple, Union
+from app.cache.cache import BaseCache, normalize_query
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class SnippetCache:
+    """
+    A cache of generated snippets layered over a pluggable cache backend.
+
+    Attributes:
+        backend (BaseCache): The key-value store holding the snippets.
+        hits (int): Number of lookups served from the cache.
+        misses (int): Number of lookups that required a new LLM call.
+        stale (int): Number of lookups that found an entry for an outdated grant version.
+    """
+
+    def __init__(self, backend: BaseCache):
+        """
+        Initialize the SnippetCache.
+
+        Args:
+            backend (BaseCache): The key-value store holding the snippets.
+        """
+        self.backend = backend
+        self.hits: int = 0
+        self.misses: int = 0
+        self.stale: int = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(query: str, grant_id: str, model_name: str, prompt_version: str) -> str:
+        """
+        Build the cache key for a snippet.
+
+        Args:
+            query (str): The user's query.
+            grant_id (str): The id of the grant.
+            model_name (str): The name of the LLM used for generation.
+            prompt_version (str): A hash of the prompt template.
+
+        Returns:
+            str: The cache key.
+        """
+        raw = '\x1f'.join([normalize_query(query), str(grant_id), model_name, prompt_version])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, query: str, grant_id: str, model_name: str, prompt_version: str,
+            modified_date: Optional[str] = None, record: bool = True) -> Optional[Tuple[str, Optional[float]]]:
+        """
+        Look up a cached snippet.
+
+        If the entry was generated for a different `modified_date` of the grant,
+        every cached snippet of that grant is evicted and None is returned.
+
+        Args:
+            query (str): The user's query.
+            grant_id (str): The id of the grant.
+            model_name (str): The name of the LLM used for generation.
+            prompt_version (str): A hash of the prompt template.
+            modified_date (Optional[str], optional): The current `modified_date` of the grant.
+            record (bool, optional): Whether to count the lookup as a hit or a miss. Defaults to True.
+
+        Returns:
+            Optional[Tuple[str, Optional[float]]]: The snippet and its relevance score, or None on a miss.
+        """
+        entry = self.backend.get(self.make_key(query, grant_id, model_name, prompt_version))
+        if entry is not None and entry.get('modified_date') != modified_date:
+            removed = self.backend.delete_group(str(grant_id))
+            logger.info(f"Grant {grant_id} was modified, evicted {removed} cached snippets")
+            with self._lock:
+                self.stale += 1
+            entry = None
+
+        if record:
+            with self._lock:
+                if entry is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+        if entry is None:
+            return None
+        return entry['snippet'], entry['score']
+
+    def set(self, query: str, grant_id: str, model_name: str, prompt_version: str,
+            modified_date: Optional[str], snippet: str, score: Optional[float]) -> None:
+        """
+        Store a generated snippet.
+
+        Args:
+            query (str): The user's query.
+            grant_id (str): The id of the grant.
+            model_name (str): The name of the LLM used for generation.
+            prompt_version (str): A hash of the prompt template.
+            modified_date (Optional[str]): The current `modified_date` of the grant.
+            snippet (str): The generated snippet.
+            score (Optional[float]): The relevance score given by the LLM.
+        """
+        entry = {'snippet': snippet, 'score': score, 'modified_date': modified_date}
+        try:
+            self.backend.set(self.make_key(query, grant_id, model_name, prompt_version), entry, group=str(grant_id))
+        except Exception as e:
+            logger.error(f"Error caching snippet for grant {grant_id}: {str(e)}")
+
+    def invalidate_grant(self, grant_id: str) -> int:
+        """
+        Evict every cached snippet of a grant.
+
+        Args:
+            grant_id (str): The id of the grant.
+
+        Returns:
+            int: The number of entries removed.
+        """
+        return self.backend.delete_group(str(grant_id))
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        """
+        Get the cache counters.
+
+        Returns:
+            Dict[str, Union[int, float]]: Hits, misses, stale lookups, hit rate, evictions and size.
+        """
+        lookups = self.hits + self.misses
+        backend_stats = self.backend.stats()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale': self.stale,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': backend_stats['evictions'],
+            'size': backend_stats['size'],
+        }
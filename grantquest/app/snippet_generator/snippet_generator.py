@@ -2,19 +2,39 @@
 This module provides a SnippetGenerator class for generating snippets based on grant information and user queries.
 
 The SnippetGenerator uses a BaseClient to interact with an LLM and generate relevant snippets.
-It also handles concurrent snippet generation for improved performance.
+It also handles concurrent snippet generation for improved performance, and can reuse
+previously generated snippets through a SnippetCache. LLM calls are run by a shared
+LLMDispatcher, which bounds concurrency across requests and sheds calls that miss the
+per-request deadline; such results are returned without a snippet. Several grants can be
+packed into one call that returns JSON, sized to the model's input and output budgets;
+grants missing from a batched reply are retried one by one. Prompts are built by a
+PromptTemplate that tokenizes the fixed parts once and memoizes grant payloads by grant
+id and a hash of the payload. Grants with a precomputed `grant_summary` (see
+elasticsearch/distill/summarize.py) only get the query match judgement and score from the
+LLM, which is appended to the stored summary. Snippets of the next
+result page can be prefetched in the background to fill the cache; a page requested while
+its prefetch is still running waits for those calls instead of repeating them. Coroutine
+variants of the generation methods (prefixed with `a`) are provided for the ASGI app.
 
 Classes:
     SnippetGenerator: Main class for generating snippets based on grant information and queries.
 """
 
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List, Dict, Any, Optional, Tuple
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import List, Dict, Any, AsyncIterator, Callable, Iterator, Optional, Tuple
 import re
+import time
+import asyncio
 import os
+import json
+import hashlib
 import logging
+import threading
 from dotenv import load_dotenv
 from app.clients.clients import BaseClient
+from app.dispatcher.dispatcher import DeadlineExceeded, LLMDispatcher
+from app.snippet_generator.prompt_template import PromptTemplate
+from app.snippet_generator.snippet_cache import SnippetCache
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -22,7 +42,12 @@ logger = logging.getLogger(__name__)
 
 
 # Load configuration from environment variables
-SNIPPET_GEN_MAX_WORKERS = int(os.getenv('SNIPPET_GEN_MAX_WORKERS', 64))
+# expected completion length, used to estimate the tokens of a call for rate limiting
+SNIPPET_OUTPUT_TOKENS = int(os.getenv('SNIPPET_OUTPUT_TOKENS', 250))
+# expected completion length when the grant summary is precomputed
+MATCH_OUTPUT_TOKENS = int(os.getenv('MATCH_OUTPUT_TOKENS', 120))
+# tokens added around each grant of a batched prompt (tags and id)
+BATCH_ITEM_OVERHEAD_TOKENS = 10
 TEMPERATURE = int(os.getenv('TEMPERATURE', 0.5))
 
 
@@ -33,18 +58,50 @@ class SnippetGenerator:
     Attributes:
         client (BaseClient): The client used for interacting with the LLM.
         model_name (str): The name of the LLM to use.
+        cache (Optional[SnippetCache]): The cache of previously generated snippets, if any.
+        dispatcher (LLMDispatcher): The shared executor running the LLM calls.
+        deadline (Optional[float]): Seconds after which pending snippets of a request are dropped, or None.
+        batch_size (int): Maximum number of grants packed into one LLM call; 1 disables batching.
+        template (PromptTemplate): The prompt builder, holding the precomputed token counts.
+        match_template (PromptTemplate): The prompt builder for grants with a precomputed summary.
+        prompt_version (str): A hash of the prompt template, used in cache keys.
     """
 
-    def __init__(self, client: BaseClient, model_name: str):
+    def __init__(self, client: BaseClient, model_name: str, cache: Optional[SnippetCache] = None,
+                 dispatcher: Optional[LLMDispatcher] = None, deadline: Optional[float] = None,
+                 batch_size: int = 1):
         """
         Initialize the SnippetGenerator.
 
         Args:
             client (BaseClient): The client used for interacting with the LLM.
             model_name (str): The name of the LLM to use.
+            cache (Optional[SnippetCache], optional): The cache of previously generated snippets. Defaults to None.
+            dispatcher (Optional[LLMDispatcher], optional): The shared executor running the LLM calls.
+                A private dispatcher is created if none is given.
+            deadline (Optional[float], optional): Seconds after which pending snippets of a request are dropped. Defaults to None.
+            batch_size (int, optional): Maximum number of grants packed into one LLM call. Defaults to 1.
         """
         self.client = client
         self.model_name = model_name
+        self.cache = cache
+        self.dispatcher = dispatcher if dispatcher is not None else LLMDispatcher()
+        self.deadline = deadline
+        self.batch_size = max(1, batch_size)
+        self.template = PromptTemplate(
+            client, self.get_prompt_prefix(), self.get_prompt_suffix(),
+            batch_suffix=self.get_batch_prompt_suffix() if self.batch_size > 1 else None,
+            settings={'temperature': TEMPERATURE}
+        )
+        self.match_template = PromptTemplate(
+            client, self.get_prompt_prefix(), self.get_match_prompt_suffix(),
+            batch_suffix=self.get_match_batch_prompt_suffix() if self.batch_size > 1 else None,
+            settings={'temperature': TEMPERATURE}
+        )
+        self.prompt_version = self.get_prompt_version()
+        # prefetch calls still running, by cache key: (future, position in the batch, batch size)
+        self._prefetching: Dict[str, Tuple[Future, int, int]] = {}
+        self._prefetch_lock = threading.Lock()
 
     def get_prompt_prefix(self) -> List[Dict[str, str]]:
         """
@@ -78,30 +135,177 @@ class SnippetGenerator:
             Also give the grant a score between 0 to 100, based on the overall relevance to my interest/query. Start your reply with the score between score tags like so <score>value</score>."},
         ]
 
-    
-    def construct_prompt(self, query: str, data: Dict[str, Any]) -> List[Dict[str, str]]:
+    def get_batch_prompt_suffix(self) -> List[Dict[str, str]]:
+        """
+        Get the suffix for the prompt used in batched snippet generation.
+
+        Returns:
+            List[Dict[str, str]]: A list of message dictionaries forming the prompt suffix.
+        """
+        return [
+            {'role': 'assistant', 'content': 'Okay, got the query and grant information.'},
+            {'role': 'user', 'content': "Based on the given query and the information of each grant, create a snippet for every grant in the form of 2 points -\n\
+            1) Grant Summary - A detailed summary of the specific area or activity the grant will fund, that is, the purpose of the grant.\n\
+            2) Query Match - A nuanced judgement on whether the grant matches the query. Consider if the grant is for a topic that is closely related to the query, even if it's not an exact match, but do not be too flexible.\n\
+            DO NOT number the points. DO reuse the headings for the points(Grant Summary and Query Match). DO separate the 2 points with a newline. Try to not repeat yourself in different points. Each snippet MUST BE 100-120 words or less and COMPLETE.\n\
+            Also give each grant a score between 0 to 100, based on the overall relevance to my interest/query.\n\
+            Reply ONLY with a JSON object of the form {\"snippets\": [{\"id\": \"<grant id>\", \"score\": <score>, \"snippet\": \"Grant Summary - ...\\nQuery Match - ...\"}]}, with one entry per grant in the given order."},
+        ]
+
+    def get_match_prompt_suffix(self) -> List[Dict[str, str]]:
+        """
+        Get the suffix for the prompt used for grants with a precomputed summary.
+
+        Returns:
+            List[Dict[str, str]]: A list of message dictionaries forming the prompt suffix.
+        """
+        return [
+            {'role': 'assistant', 'content': 'Okay, got the query and grant information.'},
+            {'role': 'user', 'content': "The grant information includes a grant_summary that is already shown to me. Based on the given query and grant information, complete the snippet with a single point -\n\
+            Query Match - A nuanced judgement on whether the grant matches the query. Consider if the grant is for a topic that is closely related to the query, even if it's not an exact match, but do not be too flexible.\n\
+            DO NOT start with any prelude, just get straight to the point. DO reuse the heading (Query Match). DO NOT repeat the grant_summary. The point MUST BE 40-60 words or less and COMPLETE.\n\
+            Also give the grant a score between 0 to 100, based on the overall relevance to my interest/query. Start your reply with the score between score tags like so <score>value</score>."},
+        ]
+
+    def get_match_batch_prompt_suffix(self) -> List[Dict[str, str]]:
+        """
+        Get the suffix for the batched prompt used for grants with a precomputed summary.
+
+        Returns:
+            List[Dict[str, str]]: A list of message dictionaries forming the prompt suffix.
+        """
+        return [
+            {'role': 'assistant', 'content': 'Okay, got the query and grant information.'},
+            {'role': 'user', 'content': "The information of each grant includes a grant_summary that is already shown to me. Based on the given query and the information of each grant, complete the snippet of every grant with a single point -\n\
+            Query Match - A nuanced judgement on whether the grant matches the query. Consider if the grant is for a topic that is closely related to the query, even if it's not an exact match, but do not be too flexible.\n\
+            DO reuse the heading (Query Match). DO NOT repeat the grant_summary. Each point MUST BE 40-60 words or less and COMPLETE.\n\
+            Also give each grant a score between 0 to 100, based on the overall relevance to my interest/query.\n\
+            Reply ONLY with a JSON object of the form {\"snippets\": [{\"id\": \"<grant id>\", \"score\": <score>, \"snippet\": \"Query Match - ...\"}]}, with one entry per grant in the given order."},
+        ]
+
+    def get_prompt_version(self) -> str:
+        """
+        Get a hash identifying the prompt templates and generation settings.
+
+        Returns:
+            str: A short hex digest that changes whenever a prompt template changes.
+        """
+        raw = f'{self.template.version}\x1f{self.match_template.version}'
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:16]
+
+    @staticmethod
+    def _get_summary(data: Dict[str, Any]) -> Optional[str]:
+        """
+        Get the precomputed summary of a grant, if any.
+
+        Args:
+            data (Dict[str, Any]): The grant information.
+
+        Returns:
+            Optional[str]: The summary, or None if the full snippet must be generated.
+        """
+        return data.get('grant_summary') or None
+
+    def _get_template(self, data: Dict[str, Any]) -> PromptTemplate:
+        return self.match_template if self._get_summary(data) else self.template
+
+    def _get_output_tokens(self, data: Dict[str, Any]) -> int:
+        return MATCH_OUTPUT_TOKENS if self._get_summary(data) else SNIPPET_OUTPUT_TOKENS
+
+    @staticmethod
+    def compose_snippet(summary: Optional[str], match: str) -> str:
+        """
+        Combine a precomputed grant summary with the generated query match.
+
+        Args:
+            summary (Optional[str]): The precomputed summary, or None if the LLM generated the whole snippet.
+            match (str): The generated text.
+
+        Returns:
+            str: The snippet, or an empty string if generation failed.
+        """
+        match = match.strip()
+        if summary is None or not match:
+            return match
+        if not match.lower().startswith('query match'):
+            match = f'Query Match - {match}'
+        return f'Grant Summary - {summary.strip()}\n{match}'
+
+    def construct_prompt(self, query: str, data: Dict[str, Any], grant_key: Optional[str] = None) -> List[Dict[str, str]]:
         """
         Construct the full prompt for snippet generation.
 
         Args:
             query (str): The user's query.
             data (Dict[str, Any]): The grant information.
+            grant_key (Optional[str], optional): The grant id and version, used to memoize the truncated grant.
+
+        Returns:
+            List[Dict[str, str]]: The full prompt as a list of message dictionaries.
+        """
+        return self._get_template(data).build(query, data, grant_key)
+
+    def construct_batch_prompt(self, query: str, datas: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """
+        Construct the full prompt for generating the snippets of several grants in one call.
+
+        The grants are not truncated; use `plan_batches` to group grants so that the
+        prompt stays within the token limits and the grants of a batch either all have
+        a precomputed summary or none has.
+
+        Args:
+            query (str): The user's query.
+            datas (List[Dict[str, Any]]): The information of each grant.
 
         Returns:
             List[Dict[str, str]]: The full prompt as a list of message dictionaries.
         """
-        prompt = self.get_prompt_prefix()
-        fixed_prompt = self.get_prompt_prefix() + self.get_prompt_suffix()
-        fixed_tokens = sum(len(self.client.encode(turn['content'])) for turn in fixed_prompt)
-        query_tokens = len(self.client.encode(query))
+        return self._get_template(datas[0]).build_batch(query, datas)
+
+    def plan_batches(self, query: str, datas: List[Dict[str, Any]],
+                     grant_keys: Optional[List[Optional[str]]] = None) -> List[List[int]]:
+        """
+        Group grants into batches that fit the model's input and output budgets.
 
-        # truncate data to stay within token limits
-        max_data_tokens = self.client.max_input_len - fixed_tokens - query_tokens - 50
-        truncated_data = self.truncate_to_token_limit(str(data), max_data_tokens)
+        Grants with and without a precomputed summary are batched separately. Within
+        each group, grants are packed in order until the next one would exceed
+        `batch_size`, the number of snippets the completion can hold, or the input
+        token limit. A grant
+        too large to share a prompt ends up alone in its batch and is generated with
+        the single-grant prompt, which truncates it.
 
-        prompt.append({'role': "user", 'content': f'Query - <{query}>\nGrant - <{truncated_data}>'})
-        prompt.extend(self.get_prompt_suffix())
-        return prompt
+        Args:
+            query (str): The user's query.
+            datas (List[Dict[str, Any]]): The information of each grant.
+            grant_keys (Optional[List[Optional[str]]], optional): The id and version of each grant, used to memoize token counts.
+
+        Returns:
+            List[List[int]]: The positions of the grants in each batch.
+        """
+        if self.batch_size <= 1:
+            return [[i] for i in range(len(datas))]
+
+        grant_keys = grant_keys or [None] * len(datas)
+
+        # grants with a precomputed summary use another prompt, so they are batched separately
+        order = sorted(range(len(datas)), key=lambda i: self._get_summary(datas[i]) is None)
+        batches, batch, used, template = [], [], 0, None
+        for i in order:
+            data = datas[i]
+            data_template = self._get_template(data)
+            tokens = data_template.payload_tokens(data, grant_keys[i]) + BATCH_ITEM_OVERHEAD_TOKENS
+            if batch and (data_template is not template or len(batch) >= max_items or used + tokens > input_budget):
+                batches.append(batch)
+                batch, used = [], 0
+            if not batch:
+                template = data_template
+                input_budget = template.max_batch_payload_tokens(query)
+                max_items = min(self.batch_size, max(1, self.client.max_output_len // self._get_output_tokens(data)))
+            batch.append(i)
+            used += tokens
+        if batch:
+            batches.append(batch)
+        return batches
 
     def truncate_to_token_limit(self, text: str, max_tokens: int) -> str:
         """
@@ -136,6 +340,46 @@ class SnippetGenerator:
             return score / 100.0, text
         return None, text
 
+    def parse_batch_response(self, text: str, size: int) -> List[Optional[Tuple[str, Optional[float]]]]:
+        """
+        Parse the JSON reply of a batched call into per-grant snippets.
+
+        Args:
+            text (str): The reply of the LLM.
+            size (int): The number of grants in the batch.
+
+        Returns:
+            List[Optional[Tuple[str, Optional[float]]]]: The snippet and its relevance score (normalized to [0, 1])
+            of each grant, or None for grants missing from the reply or that failed to parse.
+        """
+        results = [None] * size
+        match = re.search(r'\{.*\}|\[.*\]', text, re.DOTALL)
+        try:
+            parsed = json.loads(match.group(0)) if match else None
+        except ValueError:
+            parsed = None
+        items = parsed.get('snippets') if isinstance(parsed, dict) else parsed
+        if not isinstance(items, list):
+            logger.warning('Could not parse batched snippet reply')
+            return results
+
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            try:
+                k = int(item.get('id')) - 1
+            except (TypeError, ValueError):
+                continue
+            snippet = item.get('snippet')
+            if not 0 <= k < size or not isinstance(snippet, str) or not snippet.strip():
+                continue
+            try:
+                score = float(item['score']) / 100.0
+            except (KeyError, TypeError, ValueError):
+                score = None
+            results[k] = (snippet, score)
+        return results
+
     def _generate_snippet(self, query: str, data: Dict[str, Any]) -> Tuple[str, Optional[float]]:
         """
         Generate a single snippet for the given query and grant data.
@@ -147,37 +391,583 @@ class SnippetGenerator:
         Returns:
             Tuple[str, Optional[float]]: The generated snippet and its relevance score.
         """
-        messages = self.construct_prompt(query, data)
+        return self._generate_snippet_from_prompt(self.construct_prompt(query, data), self._get_summary(data))
+
+    def _generate_snippet_from_prompt(self, messages: List[Dict[str, str]], summary: Optional[str] = None) -> Tuple[str, Optional[float]]:
+        """
+        Generate a single snippet from a constructed prompt.
+
+        Args:
+            messages (List[Dict[str, str]]): The full prompt as a list of message dictionaries.
+            summary (Optional[str], optional): The precomputed grant summary the generated text completes. Defaults to None.
+
+        Returns:
+            Tuple[str, Optional[float]]: The generated snippet and its relevance score.
+        """
         try:
             response = self.client.chat(model=self.model_name, messages=messages, temperature=TEMPERATURE)
             score, response = self.extract_and_remove_score(response)
-            return response, score
+            return self.compose_snippet(summary, response), score
+        except Exception as e:
+            logger.error(f"Error generating snippet: {str(e)}")
+            return "", None
+
+    async def _agenerate_snippet_from_prompt(self, messages: List[Dict[str, str]], summary: Optional[str] = None) -> Tuple[str, Optional[float]]:
+        """
+        Generate a single snippet from a constructed prompt without blocking the event loop.
+
+        Args:
+            messages (List[Dict[str, str]]): The full prompt as a list of message dictionaries.
+            summary (Optional[str], optional): The precomputed grant summary the generated text completes. Defaults to None.
+
+        Returns:
+            Tuple[str, Optional[float]]: The generated snippet and its relevance score.
+        """
+        try:
+            response = await self.client.achat(model=self.model_name, messages=messages, temperature=TEMPERATURE)
+            score, response = self.extract_and_remove_score(response)
+            return self.compose_snippet(summary, response), score
         except Exception as e:
             logger.error(f"Error generating snippet: {str(e)}")
             return "", None
 
-    def _generate_snippets_concurrent(self, tasks: List[Tuple[str, Dict[str, Any]]], max_workers: int = 5) -> List[Tuple[str, Optional[float]]]:
+    def _generate_batch_from_prompt(self, messages: List[Dict[str, str]], size: int,
+                                    summaries: Optional[List[Optional[str]]] = None) -> List[Optional[Tuple[str, Optional[float]]]]:
+        """
+        Generate the snippets of several grants from a constructed batch prompt.
+
+        Args:
+            messages (List[Dict[str, str]]): The full batch prompt as a list of message dictionaries.
+            size (int): The number of grants in the batch.
+            summaries (Optional[List[Optional[str]]], optional): The precomputed summary of each grant. Defaults to None.
+
+        Returns:
+            List[Optional[Tuple[str, Optional[float]]]]: The snippet and score of each grant, or None where it must be retried alone.
+        """
+        try:
+            response = self.client.chat(model=self.model_name, messages=messages, temperature=TEMPERATURE)
+            return self._compose_batch(self.parse_batch_response(response, size), summaries)
+        except Exception as e:
+            logger.error(f"Error generating snippet batch: {str(e)}")
+            return [None] * size
+
+    async def _agenerate_batch_from_prompt(self, messages: List[Dict[str, str]], size: int,
+                                           summaries: Optional[List[Optional[str]]] = None) -> List[Optional[Tuple[str, Optional[float]]]]:
+        """
+        Generate the snippets of several grants from a constructed batch prompt without blocking the event loop.
+
+        Args:
+            messages (List[Dict[str, str]]): The full batch prompt as a list of message dictionaries.
+            size (int): The number of grants in the batch.
+            summaries (Optional[List[Optional[str]]], optional): The precomputed summary of each grant. Defaults to None.
+
+        Returns:
+            List[Optional[Tuple[str, Optional[float]]]]: The snippet and score of each grant, or None where it must be retried alone.
+        """
+        try:
+            response = await self.client.achat(model=self.model_name, messages=messages, temperature=TEMPERATURE)
+            return self._compose_batch(self.parse_batch_response(response, size), summaries)
+        except Exception as e:
+            logger.error(f"Error generating snippet batch: {str(e)}")
+            return [None] * size
+
+    def _compose_batch(self, results: List[Optional[Tuple[str, Optional[float]]]],
+                       summaries: Optional[List[Optional[str]]]) -> List[Optional[Tuple[str, Optional[float]]]]:
+        if summaries is None:
+            return results
+        return [(self.compose_snippet(summary, result[0]), result[1]) if result is not None else None
+                for result, summary in zip(results, summaries)]
+
+    def _estimate_tokens(self, messages: List[Dict[str, str]], outputs: int = 1, output_tokens: int = SNIPPET_OUTPUT_TOKENS) -> int:
+        """
+        Cheaply estimate the tokens a call will consume, for rate limiting.
+
+        Args:
+            messages (List[Dict[str, str]]): The full prompt as a list of message dictionaries.
+            outputs (int, optional): The number of snippets the call generates. Defaults to 1.
+            output_tokens (int, optional): The expected completion tokens per snippet. Defaults to SNIPPET_OUTPUT_TOKENS.
+
+        Returns:
+            int: The estimated prompt and completion tokens.
+        """
+        return sum(len(message['content']) for message in messages) // 4 + outputs * output_tokens
+
+    def _get_deadline(self) -> Optional[float]:
+        """
+        Get the `time.monotonic()` deadline for the snippets of a request starting now.
+
+        Returns:
+            Optional[float]: The deadline, or None if deadlines are disabled.
+        """
+        return time.monotonic() + self.deadline if self.deadline else None
+
+    @staticmethod
+    def _future_result(future: Future) -> Any:
+        """
+        Get the result of a finished snippet future, mapping failures to an empty snippet.
+
+        Args:
+            future (Future): A finished future returned by the dispatcher.
+
+        Returns:
+            Any: The result of the call, or an empty snippet and no score if it failed or was shed.
+        """
+        if future.cancelled():
+            return "", None
+        try:
+            return future.result()
+        except DeadlineExceeded as exc:
+            logger.warning(f'Snippet generation shed: {exc}')
+        except Exception as exc:
+            logger.error(f'Task generated an exception: {exc}')
+        return "", None
+
+    def _future_results(self, future: Future, size: int) -> List[Optional[Tuple[str, Optional[float]]]]:
         """
-        Generate multiple snippets using concurrently.
+        Get the per-grant results of a finished single or batched snippet future.
 
         Args:
-            tasks (List[Tuple[str, Dict[str, Any]]]): A list of (query, data) tuples.
-            max_workers (int, optional): The maximum number of workers. Defaults to 5.
+            future (Future): A finished future returned by the dispatcher.
+            size (int): The number of grants of the call; 1 for a single-grant call.
 
         Returns:
-            List[Tuple[str, Optional[float]]]: A list of generated snippets and their scores.
+            List[Optional[Tuple[str, Optional[float]]]]: The snippet and score of each grant, or None where it must be retried alone.
+        """
+        result = self._future_result(future)
+        if size == 1:
+            return [result]
+        return result if isinstance(result, list) else [result] * size
+
+    def _submit_batches(self, query: str, datas: List[Dict[str, Any]], deadline: Optional[float] = None,
+                        grant_keys: Optional[List[Optional[str]]] = None) -> List[Tuple[Future, List[int]]]:
         """
-        results = []
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_task = {executor.submit(self._generate_snippet, query, data): (query, data) for query, data in tasks}
-            
-            for future in as_completed(future_to_task):
-                try:
-                    result = future.result()
-                    results.append(result)
-                except Exception as exc:
-                    logger.error(f'Task generated an exception: {exc}')
-        
+        Submit the snippet calls for several grants to the dispatcher, batching them where possible.
+
+        Args:
+            query (str): The user's query.
+            datas (List[Dict[str, Any]]): The information of each grant.
+            deadline (Optional[float], optional): A `time.monotonic()` deadline. Defaults to None.
+            grant_keys (Optional[List[Optional[str]]], optional): The id and version of each grant.
+
+        Returns:
+            List[Tuple[Future, List[int]]]: Each call and the positions of its grants in `datas`.
+        """
+        grant_keys = grant_keys or [None] * len(datas)
+        submitted = []
+        for batch in self.plan_batches(query, datas, grant_keys):
+            if len(batch) == 1:
+                future = self._submit_snippet(query, datas[batch[0]], grant_keys[batch[0]], deadline)
+            else:
+                batch_datas = [datas[i] for i in batch]
+                messages = self.construct_batch_prompt(query, batch_datas)
+                future = self.dispatcher.submit(self._generate_batch_from_prompt, messages, len(batch),
+                                                [self._get_summary(data) for data in batch_datas],
+                                                tokens=self._estimate_tokens(messages, len(batch), self._get_output_tokens(batch_datas[0])),
+                                                deadline=deadline)
+            submitted.append((future, batch))
+        return submitted
+
+    def _submit_snippet(self, query: str, data: Dict[str, Any], grant_key: Optional[str] = None,
+                        deadline: Optional[float] = None) -> Future:
+        """
+        Submit the single-grant snippet call of a grant to the dispatcher.
+
+        Args:
+            query (str): The user's query.
+            data (Dict[str, Any]): The grant information.
+            grant_key (Optional[str], optional): The grant id and version. Defaults to None.
+            deadline (Optional[float], optional): A `time.monotonic()` deadline. Defaults to None.
+
+        Returns:
+            Future: The future of the call.
+        """
+        messages = self.construct_prompt(query, data, grant_key)
+        return self.dispatcher.submit(self._generate_snippet_from_prompt, messages, self._get_summary(data),
+                                      tokens=self._estimate_tokens(messages, output_tokens=self._get_output_tokens(data)),
+                                      deadline=deadline)
+
+    def _iter_snippets_concurrent(self, tasks: List[Tuple[str, Dict[str, Any], Optional[str]]], deadline: Optional[float] = None,
+                                  on_late: Optional[Callable[[int, Tuple[str, Optional[float]]], None]] = None,
+                                  futures: Optional[Dict[Future, List[Optional[int]]]] = None) -> Iterator[Tuple[int, Tuple[str, Optional[float]]]]:
+        """
+        Generate multiple snippets concurrently, yielding each one as soon as it is ready.
+
+        Tasks sharing a query are batched according to `plan_batches`; grants missing
+        from a batched reply are retried with a single-grant call. Tasks still pending
+        at the deadline are yielded with an empty snippet. Calls that have not started
+        are cancelled; calls already running are left to finish and their results are
+        passed to `on_late`.
+
+        Args:
+            tasks (List[Tuple[str, Dict[str, Any], Optional[str]]]): A list of (query, data, grant key) tuples.
+            deadline (Optional[float], optional): A `time.monotonic()` deadline. Defaults to None.
+            on_late (Optional[Callable], optional): Called with (task index, result) for calls finishing after the deadline.
+            futures (Optional[Dict[Future, List[Optional[int]]]], optional): Calls already submitted for some tasks,
+                mapped to the task index at each position of the call (None for positions not needed).
+
+        Yields:
+            Tuple[int, Tuple[str, Optional[float]]]: The index of the task, and the generated snippet and its score.
+        """
+        future_to_slots = dict(futures or {})
+        covered = {i for slots in future_to_slots.values() for i in slots if i is not None}
+
+        by_query: Dict[str, List[int]] = {}
+        for i, (query, _, _) in enumerate(tasks):
+            if i not in covered:
+                by_query.setdefault(query, []).append(i)
+        for query, indices in by_query.items():
+            for future, batch in self._submit_batches(query, [tasks[i][1] for i in indices], deadline,
+                                                      [tasks[i][2] for i in indices]):
+                future_to_slots[future] = [indices[k] for k in batch]
+
+        pending = set(future_to_slots)
+        while pending:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                slots = future_to_slots[future]
+                for i, result in zip(slots, self._future_results(future, len(slots))):
+                    if i is None:
+                        continue
+                    if result is None:
+                        logger.warning('Grant missing from batched snippet reply, generating it alone')
+                        retry = self._submit_snippet(*tasks[i], deadline=deadline)
+                        future_to_slots[retry] = [i]
+                        pending.add(retry)
+                        continue
+                    yield i, result
+
+        for future in pending:
+            slots = future_to_slots[future]
+            if not future.cancel() and on_late is not None:
+                def report_late(f: Future, slots: List[Optional[int]] = slots) -> None:
+                    for i, result in zip(slots, self._future_results(f, len(slots))):
+                        if i is not None and result is not None:
+                            on_late(i, result)
+                future.add_done_callback(report_late)
+            for i in slots:
+                if i is not None:
+                    logger.warning('Snippet generation missed the deadline, returning result without snippet')
+                    yield i, ("", None)
+
+    def _generate_snippets_concurrent(self, tasks: List[Tuple[str, Dict[str, Any], Optional[str]]], deadline: Optional[float] = None) -> List[Tuple[str, Optional[float]]]:
+        """
+        Generate multiple snippets concurrently.
+
+        Args:
+            tasks (List[Tuple[str, Dict[str, Any], Optional[str]]]): A list of (query, data, grant key) tuples.
+            deadline (Optional[float], optional): A `time.monotonic()` deadline. Defaults to None.
+
+        Returns:
+            List[Tuple[str, Optional[float]]]: A list of generated snippets and their scores, in the order of the tasks.
+        """
+        results = [("", None)] * len(tasks)
+        for i, result in self._iter_snippets_concurrent(tasks, deadline=deadline):
+            results[i] = result
+        return results
+
+    @staticmethod
+    def _get_snippet_data(result: Dict) -> Dict[str, Any]:
+        """
+        Get the grant information sent to the LLM for a search result, with its precomputed summary if any.
+
+        Args:
+            result (Dict): A search result dictionary.
+
+        Returns:
+            Dict[str, Any]: The grant information.
+        """
+        return {k: v for k, v in result['_source'].items() if k in ['normalized_info', 'grant_summary']}
+
+    @classmethod
+    def _get_grant_key(cls, result: Dict) -> str:
+        """
+        Get the key identifying a version of a grant, used to memoize its prompt payload.
+
+        The payload is hashed rather than keyed on `modified_date`, since the offline stages
+        rewrite `normalized_info` and `grant_summary` without changing `modified_date`.
+
+        Args:
+            result (Dict): A search result dictionary.
+
+        Returns:
+            str: The grant id and the hash of its payload.
+        """
+        payload_hash = hashlib.sha256(str(cls._get_snippet_data(result)).encode('utf-8')).hexdigest()
+        return f"{result['_id']}\x1f{payload_hash}"
+
+    def _get_cached_snippet(self, query: str, result: Dict) -> Optional[Tuple[str, Optional[float]]]:
+        """
+        Look up the snippet of a search result in the cache.
+
+        Args:
+            query (str): The user's query.
+            result (Dict): A search result dictionary.
+
+        Returns:
+            Optional[Tuple[str, Optional[float]]]: The cached snippet and score, or None on a miss.
+        """
+        if self.cache is None:
+            return None
+        return self.cache.get(query, result['_id'], self.model_name, self.prompt_version,
+                              result['_source'].get('modified_date'))
+
+    def _prefetch_key(self, query: str, result: Dict) -> str:
+        return SnippetCache.make_key(query, result['_id'], self.model_name, self.prompt_version)
+
+    def _get_prefetching(self, query: str, search_results: List[Dict], indices: List[int]) -> Dict[Future, List[Optional[int]]]:
+        """
+        Find the prefetch calls still running for some of the search results.
+
+        Args:
+            query (str): The user's query.
+            search_results (List[Dict]): A list of search result dictionaries.
+            indices (List[int]): The positions of the search results to look for.
+
+        Returns:
+            Dict[Future, List[Optional[int]]]: The running prefetch calls, mapped to the position in `indices`
+            of the search result at each position of the call (None for positions not needed).
+        """
+        if not self._prefetching:
+            return {}
+        futures = {}
+        with self._prefetch_lock:
+            for task_index, i in enumerate(indices):
+                entry = self._prefetching.get(self._prefetch_key(query, search_results[i]))
+                if entry is not None:
+                    future, position, size = entry
+                    futures.setdefault(future, [None] * size)[position] = task_index
+        return futures
+
+    def prefetch_snippets(self, search_results: List[Dict], query: str, max_queue_depth: int = 0) -> int:
+        """
+        Generate snippets in the background to fill the cache, e.g. for the next result page.
+
+        Nothing is prefetched without a cache, or while more than `max_queue_depth` calls
+        are waiting in the dispatcher, so that speculative work never delays live requests.
+        Grants missing from a batched reply are left to be generated on demand.
+
+        Args:
+            search_results (List[Dict]): A list of search result dictionaries.
+            query (str): The user's query.
+            max_queue_depth (int, optional): The dispatcher queue depth above which nothing is prefetched. Defaults to 0.
+
+        Returns:
+            int: The number of snippets submitted.
+        """
+        if self.cache is None or self.dispatcher.queue_depth > max_queue_depth:
+            return 0
+
+        todo = []
+        for result in search_results:
+            with self._prefetch_lock:
+                if self._prefetch_key(query, result) in self._prefetching:
+                    continue
+            if self.cache.get(query, result['_id'], self.model_name, self.prompt_version,
+                              result['_source'].get('modified_date'), record=False) is None:
+                todo.append(result)
+
+        submitted = self._submit_batches(query, [self._get_snippet_data(result) for result in todo], self._get_deadline(),
+                                         [self._get_grant_key(result) for result in todo])
+        for future, batch in submitted:
+            keys = [self._prefetch_key(query, todo[i]) for i in batch]
+            with self._prefetch_lock:
+                for position, key in enumerate(keys):
+                    self._prefetching[key] = (future, position, len(batch))
+
+            def on_done(f: Future, keys: List[str] = keys, batch: List[int] = batch) -> None:
+                with self._prefetch_lock:
+                    for key in keys:
+                        self._prefetching.pop(key, None)
+                for i, result in zip(batch, self._future_results(f, len(batch))):
+                    if result is not None:
+                        self._cache_snippet(query, todo[i], *result)
+
+            future.add_done_callback(on_done)
+        return len(todo)
+
+    def _cache_snippet(self, query: str, result: Dict, snippet: str, llm_score: Optional[float]) -> None:
+        """
+        Store the snippet of a search result in the cache. Failed generations are not cached.
+
+        Args:
+            query (str): The user's query.
+            result (Dict): A search result dictionary.
+            snippet (str): The generated snippet.
+            llm_score (Optional[float]): The relevance score given by the LLM.
+        """
+        if self.cache is None or not snippet:
+            return
+        self.cache.set(query, result['_id'], self.model_name, self.prompt_version,
+                       result['_source'].get('modified_date'), snippet, llm_score)
+
+    def make_result(self, result: Dict, snippet: Optional[str] = None, llm_score: Optional[float] = None) -> Dict:
+        """
+        Build the result dictionary rendered by the templates for a search hit.
+
+        Args:
+            result (Dict): A search result dictionary.
+            snippet (Optional[str], optional): The snippet, or None if it is still being generated.
+            llm_score (Optional[float], optional): The relevance score given by the LLM.
+
+        Returns:
+            Dict: The result dictionary.
+        """
+        return {
+            'id': result['_id'],
+            'content': result['_source'],
+            'snippet': snippet.strip() if snippet is not None else None,
+            'es_score': result['_score'],
+            'llm_score': llm_score
+        }
+
+    def iter_snippets(self, search_results: List[Dict], query: str) -> Iterator[Tuple[int, Dict]]:
+        """
+        Generate snippets for a list of search results, yielding each one as soon as it is ready.
+
+        Cached snippets are yielded first, followed by newly generated snippets in
+        order of completion.
+
+        Args:
+            search_results (List[Dict]): A list of search result dictionaries.
+            query (str): The user's query.
+
+        Yields:
+            Tuple[int, Dict]: The position of the search result, and the dictionary containing its snippet and related information.
+        """
+        missing = []
+        for i, result in enumerate(search_results):
+            cached = self._get_cached_snippet(query, result)
+            if cached is None:
+                missing.append(i)
+            else:
+                yield i, self.make_result(result, *cached)
+
+        if not missing:
+            return
+        tasks = [(query, self._get_snippet_data(search_results[i]), self._get_grant_key(search_results[i])) for i in missing]
+
+        def cache_late(task_index: int, snippet: Tuple[str, Optional[float]]) -> None:
+            self._cache_snippet(query, search_results[missing[task_index]], *snippet)
+
+        prefetching = self._get_prefetching(query, search_results, missing)
+        for task_index, (snippet, llm_score) in self._iter_snippets_concurrent(tasks, deadline=self._get_deadline(), on_late=cache_late,
+                                                                               futures=prefetching):
+            i = missing[task_index]
+            self._cache_snippet(query, search_results[i], snippet, llm_score)
+            yield i, self.make_result(search_results[i], snippet, llm_score)
+
+    async def aiter_snippets(self, search_results: List[Dict], query: str) -> AsyncIterator[Tuple[int, Dict]]:
+        """
+        Asynchronously generate snippets for a list of search results, yielding each one as soon as it is ready.
+
+        Args:
+            search_results (List[Dict]): A list of search result dictionaries.
+            query (str): The user's query.
+
+        Yields:
+            Tuple[int, Dict]: The position of the search result, and the dictionary containing its snippet and related information.
+        """
+        missing = []
+        for i, result in enumerate(search_results):
+            cached = self._get_cached_snippet(query, result)
+            if cached is None:
+                missing.append(i)
+            else:
+                yield i, self.make_result(result, *cached)
+
+        deadline = self._get_deadline()
+        prefetching = self._get_prefetching(query, search_results, missing)
+        covered = {task_index for slots in prefetching.values() for task_index in slots if task_index is not None}
+        remaining = [i for task_index, i in enumerate(missing) if task_index not in covered]
+
+        async def generate(i: int) -> List[Tuple[int, Tuple[str, Optional[float]]]]:
+            data = self._get_snippet_data(search_results[i])
+            messages = self.construct_prompt(query, data, self._get_grant_key(search_results[i]))
+            try:
+                return [(i, await self.dispatcher.run_async(self._agenerate_snippet_from_prompt, messages, self._get_summary(data),
+                                                            tokens=self._estimate_tokens(messages, output_tokens=self._get_output_tokens(data)),
+                                                            deadline=deadline))]
+            except DeadlineExceeded as exc:
+                logger.warning(f'Snippet generation shed: {exc}')
+                return [(i, ("", None))]
+
+        async def complete(indices: List[Optional[int]],
+                           results: List[Optional[Tuple[str, Optional[float]]]]) -> List[Tuple[int, Tuple[str, Optional[float]]]]:
+            # grants missing from a batched reply are generated alone
+            completed = [(i, result) for i, result in zip(indices, results) if i is not None and result is not None]
+            retries = [i for i, result in zip(indices, results) if i is not None and result is None]
+            if retries:
+                logger.warning(f'{len(retries)} grants missing from batched snippet reply, generating them alone')
+                for retried in await asyncio.gather(*(generate(i) for i in retries)):
+                    completed.extend(retried)
+            return completed
+
+        async def generate_batch(indices: List[int]) -> List[Tuple[int, Tuple[str, Optional[float]]]]:
+            if len(indices) == 1:
+                return await generate(indices[0])
+            datas = [self._get_snippet_data(search_results[i]) for i in indices]
+            messages = self.construct_batch_prompt(query, datas)
+            try:
+                results = await self.dispatcher.run_async(self._agenerate_batch_from_prompt, messages, len(indices),
+                                                          [self._get_summary(data) for data in datas],
+                                                          tokens=self._estimate_tokens(messages, len(indices), self._get_output_tokens(datas[0])),
+                                                          deadline=deadline)
+            except DeadlineExceeded as exc:
+                logger.warning(f'Snippet generation shed: {exc}')
+                return [(i, ("", None)) for i in indices]
+            return await complete(indices, results)
+
+        async def wait_prefetch(future: Future, indices: List[Optional[int]]) -> List[Tuple[int, Tuple[str, Optional[float]]]]:
+            await asyncio.wait({asyncio.wrap_future(future)})
+            return await complete(indices, self._future_results(future, len(indices)))
+
+        task_to_indices = {}
+        for future, slots in prefetching.items():
+            indices = [missing[task_index] if task_index is not None else None for task_index in slots]
+            task_to_indices[asyncio.ensure_future(wait_prefetch(future, indices))] = [i for i in indices if i is not None]
+        datas = [self._get_snippet_data(search_results[i]) for i in remaining]
+        grant_keys = [self._get_grant_key(search_results[i]) for i in remaining]
+        for batch in self.plan_batches(query, datas, grant_keys):
+            indices = [remaining[k] for k in batch]
+            task_to_indices[asyncio.ensure_future(generate_batch(indices))] = indices
+
+        pending = set(task_to_indices)
+        try:
+            while pending:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for task in done:
+                    for i, (snippet, llm_score) in task.result():
+                        self._cache_snippet(query, search_results[i], snippet, llm_score)
+                        yield i, self.make_result(search_results[i], snippet, llm_score)
+        finally:
+            for task in pending:
+                task.cancel()
+
+        for task in pending:
+            for i in task_to_indices[task]:
+                logger.warning('Snippet generation missed the deadline, returning result without snippet')
+                yield i, self.make_result(search_results[i], "", None)
+
+    async def agenerate_snippets(self, search_results: List[Dict], query: str) -> List[Dict]:
+        """
+        Asynchronously generate snippets for a list of search results.
+
+        Args:
+            search_results (List[Dict]): A list of search result dictionaries.
+            query (str): The user's query.
+
+        Returns:
+            List[Dict]: A list of dictionaries containing the generated snippets and related information.
+        """
+        results = [None] * len(search_results)
+        async for i, result in self.aiter_snippets(search_results, query):
+            results[i] = result
         return results
 
     def generate_snippets(self, search_results: List[Dict], query: str) -> List[Dict]:
@@ -191,15 +981,48 @@ class SnippetGenerator:
         Returns:
             List[Dict]: A list of dictionaries containing the generated snippets and related information.
         """
-        results = []
-        tasks = [(query, {k: v for k, v in result['_source'].items() if k in ['normalized_info']}) for result in search_results]
-        snippets = self._generate_snippets_concurrent(tasks, max_workers=SNIPPET_GEN_MAX_WORKERS)
-        for (snippet, llm_score), result in zip(snippets, search_results):
-            results.append({
-                'id': result['_id'],
-                'content': result['_source'],
-                'snippet': snippet.strip(),
-                'es_score': result['_score'],
-                'llm_score': llm_score
-            })
-        return results
\ No newline at end of file
+        results = [None] * len(search_results)
+        for i, result in self.iter_snippets(search_results, query):
+            results[i] = result
+        return results
+
+    def generate_snippets_many(self, searches: List[Tuple[List[Dict], str]]) -> List[List[Dict]]:
+        """
+        Generate the snippets of several searches, e.g. the queries of a batch, under one deadline.
+
+        The calls of every search are submitted before any is waited for, so the
+        searches take about as long as the slowest one rather than the sum of them.
+
+        Args:
+            searches (List[Tuple[List[Dict], str]]): The search results and query of each search.
+
+        Returns:
+            List[List[Dict]]: The results with their snippets, for each search in order.
+        """
+        results = [[None] * len(search_results) for search_results, _ in searches]
+        tasks, positions, prefetching = [], [], {}
+        for n, (search_results, query) in enumerate(searches):
+            missing = []
+            for i, result in enumerate(search_results):
+                cached = self._get_cached_snippet(query, result)
+                if cached is None:
+                    missing.append(i)
+                else:
+                    results[n][i] = self.make_result(result, *cached)
+            offset = len(tasks)
+            for future, slots in self._get_prefetching(query, search_results, missing).items():
+                prefetching[future] = [offset + task_index if task_index is not None else None for task_index in slots]
+            tasks.extend((query, self._get_snippet_data(search_results[i]), self._get_grant_key(search_results[i])) for i in missing)
+            positions.extend((n, i) for i in missing)
+
+        def cache_late(task_index: int, snippet: Tuple[str, Optional[float]]) -> None:
+            n, i = positions[task_index]
+            self._cache_snippet(searches[n][1], searches[n][0][i], *snippet)
+
+        for task_index, (snippet, llm_score) in self._iter_snippets_concurrent(tasks, deadline=self._get_deadline(), on_late=cache_late,
+                                                                               futures=prefetching):
+            n, i = positions[task_index]
+            search_results, query = searches[n]
+            self._cache_snippet(query, search_results[i], snippet, llm_score)
+            results[n][i] = self.make_result(search_results[i], snippet, llm_score)
+        return results
@@ -0,0 +1,13 @@
+"""
+This script exposes the asynchronous (ASGI) application.
+
+It creates the Quart app instance, which awaits Elasticsearch and the LLM instead of
+holding a worker thread per search. Serve it with any ASGI server.
+
+Usage:
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+
+from app.async_app import create_async_app
+
+app = create_async_app()
@@ -0,0 +1,129 @@
+"""
+This script compares hybrid search with reciprocal rank fusion (RRF) to the linear-boost hybrid search.
+
+The queries of elasticsearch/data/queries.txt, and the titles of the known-item labels
+of elasticsearch/data/labels.csv (see knn_sweep.py), are embedded once and searched with:
+
+- hybrid: the text and kNN scores added with the boosts of the hybrid profile, in one search;
+- rrf: a kNN and a full-text search sent in one `_msearch` request and fused, for each
+  rank window and rank constant;
+- rrf sequential: the same two searches sent one after the other, to show what running
+  them concurrently saves.
+
+For each it reports nDCG@k against the labels, recall@k against the exact kNN top k, the
+overlap of the top k with the linear-boost hybrid search, and p50/p95/p99 latency.
+
+Usage:
+    python -m benchmarks.hybrid_rrf --index distill_index --field normalized_embeddings
+    python -m benchmarks.hybrid_rrf --rank-windows 20,50,100 --rank-constants 20,60
+"""
+
+import argparse
+import os
+import time
+from typing import Any, Callable, Dict, List, Tuple
+from dotenv import load_dotenv
+from config import Config
+from app.embeddings.embeddings import OpenAIEmbedder
+from app.search.search import Search, get_search_profiles
+from benchmarks.knn_sweep import exact_top_k, load_labels, load_queries, ndcg, parse_list, percentile
+
+load_dotenv()
+
+
+def search_sequential(search: Search, index_name: str, query_args: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Run the sub-searches of an RRF search one after the other, and fuse them.
+
+    Args:
+        search (Search): The search client.
+        index_name (str): The name of the index.
+        query_args (Dict[str, Any]): Query arguments from `get_query_args_rrf`.
+
+    Returns:
+        Tuple[List[Dict[str, Any]], int]: The hits and the total number of matches.
+    """
+    responses = [search.es.search(index=index_name, **retriever_args) for retriever_args in query_args['retrievers']]
+    return search._fuse_responses(responses, query_args)
+
+
+def run(run_search: Callable[[Dict[str, Any]], Tuple[List[Dict[str, Any]], int]], build: Callable[[str], Dict[str, Any]],
+        queries: List[str], warmup: int) -> Tuple[Dict[str, List[str]], List[float]]:
+    """
+    Search every query.
+
+    Args:
+        run_search (Callable): Runs the search of query arguments.
+        build (Callable): Builds the query arguments of a query.
+        queries (List[str]): The queries.
+        warmup (int): The number of untimed searches first.
+
+    Returns:
+        Tuple[Dict[str, List[str]], List[float]]: The ids found for each query, and the latencies in ms.
+    """
+    for query in queries[:warmup]:
+        run_search(build(query))
+    results, latencies = {}, []
+    for query in queries:
+        query_args = build(query)
+        start = time.perf_counter()
+        hits, _ = run_search(query_args)
+        latencies.append(1000 * (time.perf_counter() - start))
+        results[query] = [hit['_id'] for hit in hits]
+    return results, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare RRF hybrid search to the linear-boost hybrid search.')
+    parser.add_argument('--index', default=Config.INDEX_NAME, help=f'index to search (default: {Config.INDEX_NAME})')
+    parser.add_argument('--queries', default='../elasticsearch/data/queries.txt', help='one query per line')
+    parser.add_argument('--labels', default='../elasticsearch/data/labels.csv', help="relevance labels, or '' for none")
+    parser.add_argument('--field', default='normalized_embeddings', help='embeddings field (default: normalized_embeddings)')
+    parser.add_argument('--k', type=int, default=10, help='hits per query (default: 10)')
+    parser.add_argument('--rank-windows', default='20,50,100', help='RRF rank windows (default: 20,50,100)')
+    parser.add_argument('--rank-constants', default='60', help='RRF rank constants (default: 60)')
+    parser.add_argument('--warmup', type=int, default=5, help='untimed searches before each configuration (default: 5)')
+    args = parser.parse_args()
+
+    embedder = OpenAIEmbedder(os.getenv('OPENAI_KEY'), Config.EMBEDDING_MODEL, Config.EMBEDDING_DIMENSIONS)
+    search = Search(Config.ELASTICSEARCH_URL, os.getenv('ELASTICSEARCH_USER'), os.getenv('ELASTICSEARCH_PASSWORD'),
+                    embedder=embedder, knn_short_dims=Config.KNN_SHORT_DIMS, profiles=Config.SEARCH_PROFILES)
+    profiles = search.profiles
+
+    queries = load_queries(args.queries)
+    labels = load_labels(args.labels, queries)
+    queries += [query for query in labels if query not in queries]
+    vectors = dict(zip(queries, embedder.embed_many(queries)))
+    truth = {query: exact_top_k(search, args.index, args.field, vectors[query], args.k) for query in queries}
+
+    def build(mode: str) -> Callable[[str], Dict[str, Any]]:
+        return lambda query: search.get_query_args(mode, query, args.k, 0, field=args.field, query_vector=vectors[query])
+
+    configurations = [('hybrid', '-', '-', lambda query_args: search.search(args.index, **query_args), build('hybrid'))]
+    for rank_window in parse_list(args.rank_windows, int):
+        for rank_constant in parse_list(args.rank_constants, int):
+            configurations.append(('rrf', rank_window, rank_constant, lambda query_args: search.search(args.index, **query_args), build('rrf')))
+            configurations.append(('rrf sequential', rank_window, rank_constant,
+                                   lambda query_args: search_sequential(search, args.index, query_args), build('rrf')))
+
+    hybrid_results = None
+    print(f"{len(queries)} queries, {len(labels)} labelled, index {args.index}, k = {args.k}, hybrid profile {profiles['hybrid']}")
+    print(f"{'mode':<15} {'window':>6} {'const':>5} {'nDCG':>6} {'recall':>7} {'overlap':>7} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7}")
+    for mode, rank_window, rank_constant, run_search, build_args in configurations:
+        if mode != 'hybrid':
+            search.profiles = get_search_profiles({**profiles, 'rrf': {'rank_window': rank_window, 'rank_constant': rank_constant}})
+        results, latencies = run(run_search, build_args, queries, args.warmup)
+        if hybrid_results is None:
+            hybrid_results = results
+
+        scores = [ndcg(results[query], grades, args.k) for query, grades in labels.items()]
+        ndcg_text = f"{sum(scores) / len(scores):>6.3f}" if scores else f"{'-':>6}"
+        recall = sum(len(set(results[query]) & set(truth[query])) / max(1, len(truth[query])) for query in queries) / len(queries)
+        overlap = sum(len(set(results[query]) & set(hybrid_results[query])) / max(1, len(hybrid_results[query]))
+                      for query in queries) / len(queries)
+        print(f"{mode:<15} {rank_window:>6} {rank_constant:>5} {ndcg_text} {recall:>7.3f} {overlap:>7.3f} "
+              f"{percentile(latencies, 0.5):>7.1f} {percentile(latencies, 0.95):>7.1f} {percentile(latencies, 0.99):>7.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+"""
+This script measures the recall, nDCG and latency of search profiles on the live index.
+
+The queries of elasticsearch/data/queries.txt are embedded once, and searched with every
+combination of the swept parameters: the mode (semantic or hybrid), the embeddings
+field, k, num_candidates and, for hybrid search, the text and kNN boosts. For each
+combination it reports:
+
+- recall@k: the share of the exact top k of the query, found by a brute-force
+  script_score over all the vectors of the field, that is in the results;
+- nDCG@k against the relevance labels, when there are any;
+- the p50, p95 and p99 latencies of the searches, as seen by the client.
+
+Labels are read from a CSV file. Rows of `query,id[,grade]` grade the documents of a
+query of the query file. Rows of `id,title,description`, as in elasticsearch/data/labels.csv,
+are known-item labels: the title of the grant is searched and the grant is the only
+relevant document. The best values can be set with SEARCH_PROFILES in config.py.
+
+Usage:
+    python -m benchmarks.knn_sweep --index distill_index --field normalized_embeddings
+    python -m benchmarks.knn_sweep --modes semantic --num-candidates 10,30,100,300 --k 10,50
+    python -m benchmarks.knn_sweep --modes hybrid --text-boosts 0.1,0.2,0.5 --knn-boosts 0.9,1.0
+"""
+
+import argparse
+import csv
+import itertools
+import math
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from config import Config
+from app.embeddings.embeddings import OpenAIEmbedder
+from app.search.search import Search, get_search_profiles
+
+load_dotenv()
+
+
+def load_queries(path: str) -> List[str]:
+    with open(path) as f:
+        return [line.strip().strip('"') for line in f if line.strip()]
+
+
+def load_labels(path: str, queries: List[str]) -> Dict[str, Dict[str, float]]:
+    """
+    Load relevance labels.
+
+    Args:
+        path (str): A CSV file of `query,id[,grade]` or `id,title,description` rows, or '' for none.
+        queries (List[str]): The queries of the query file.
+
+    Returns:
+        Dict[str, Dict[str, float]]: The grade of the relevant documents of each labelled query.
+    """
+    labels: Dict[str, Dict[str, float]] = {}
+    if not path:
+        return labels
+    known = set(queries)
+    with open(path, newline='') as f:
+        for row in csv.reader(f):
+            if len(row) < 2:
+                continue
+            if row[0].strip().strip('"') in known:
+                grade = float(row[2]) if len(row) > 2 and row[2].strip() else 1.0
+                labels.setdefault(row[0].strip().strip('"'), {})[row[1].strip()] = grade
+            elif row[0].strip().isdigit():
+                # a known-item label: the title finds the grant
+                labels.setdefault(row[1].strip(), {})[row[0].strip()] = 1.0
+    return labels
+
+
+def ndcg(ids: List[str], grades: Dict[str, float], k: int) -> float:
+    """
+    Compute the nDCG@k of a ranking.
+
+    Args:
+        ids (List[str]): The ranked document ids.
+        grades (Dict[str, float]): The grade of the relevant documents.
+        k (int): The rank cutoff.
+
+    Returns:
+        float: The nDCG@k, 0 if no document is relevant.
+    """
+    dcg = sum((2 ** grades.get(id, 0.0) - 1) / math.log2(rank + 2) for rank, id in enumerate(ids[:k]))
+    ideal = sum((2 ** grade - 1) / math.log2(rank + 2)
+                for rank, grade in enumerate(sorted(grades.values(), reverse=True)[:k]))
+    return dcg / ideal if ideal else 0.0
+
+
+def percentile(values: List[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def exact_top_k(search: Search, index_name: str, field: str, query_vector: List[float], k: int) -> List[str]:
+    """
+    Find the ids of the k nearest documents by brute force.
+
+    Args:
+        search (Search): The search client.
+        index_name (str): The name of the index.
+        field (str): The embeddings field.
+        query_vector (List[float]): The query vector.
+        k (int): The number of documents.
+
+    Returns:
+        List[str]: The ids, nearest first.
+    """
+    query = {"script_score": {"query": {"match_all": {}},
+                              "script": {"source": f"cosineSimilarity(params.query_vector, '{field}') + 1.0",
+                                         "params": {"query_vector": query_vector}}}}
+    res = search.es.search(index=index_name, query=query, size=k, source=False)
+    return [hit['_id'] for hit in res['hits']['hits']]
+
+
+def run(search: Search, index_name: str, mode: str, field: str, k: int, queries: List[str],
+        vectors: Dict[str, List[float]]) -> Tuple[Dict[str, List[str]], List[float]]:
+    """
+    Search every query with the current profiles.
+
+    Args:
+        search (Search): The search client.
+        index_name (str): The name of the index.
+        mode (str): 'semantic' or 'hybrid'.
+        field (str): The embeddings field.
+        k (int): The number of hits per query.
+        queries (List[str]): The queries.
+        vectors (Dict[str, List[float]]): The vector of each query.
+
+    Returns:
+        Tuple[Dict[str, List[str]], List[float]]: The ids found for each query, and the latencies in ms.
+    """
+    build = search.get_query_args_semantic if mode == 'semantic' else search.get_query_args_hybrid
+    results, latencies = {}, []
+    for query in queries:
+        query_args = build(query, k, 0, field=field, query_vector=vectors[query])
+        start = time.perf_counter()
+        hits, _ = search.search(index_name, **query_args)
+        latencies.append(1000 * (time.perf_counter() - start))
+        results[query] = [hit['_id'] for hit in hits]
+    return results, latencies
+
+
+def parse_list(value: str, cast) -> List[Any]:
+    return [cast(x) for x in value.split(',') if x]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the recall, nDCG and latency of search profiles.')
+    parser.add_argument('--index', default=Config.INDEX_NAME, help=f'index to search (default: {Config.INDEX_NAME})')
+    parser.add_argument('--queries', default='../elasticsearch/data/queries.txt', help='one query per line')
+    parser.add_argument('--labels', default='../elasticsearch/data/labels.csv', help="relevance labels, or '' for none")
+    parser.add_argument('--modes', default='semantic,hybrid', help='search modes (default: semantic,hybrid)')
+    parser.add_argument('--fields', default='normalized_embeddings', help='embeddings fields (default: normalized_embeddings)')
+    parser.add_argument('--k', default='10', help='hits per query (default: 10)')
+    parser.add_argument('--num-candidates', default='10,30,50,100,200', help='kNN candidates (default: 10,30,50,100,200)')
+    parser.add_argument('--text-boosts', default='0.2', help='text boosts of hybrid search (default: 0.2)')
+    parser.add_argument('--knn-boosts', default='0.9', help='kNN boosts of hybrid search (default: 0.9)')
+    parser.add_argument('--warmup', type=int, default=5, help='untimed searches before each combination (default: 5)')
+    args = parser.parse_args()
+
+    embedder = OpenAIEmbedder(os.getenv('OPENAI_KEY'), Config.EMBEDDING_MODEL, Config.EMBEDDING_DIMENSIONS)
+    search = Search(Config.ELASTICSEARCH_URL, os.getenv('ELASTICSEARCH_USER'), os.getenv('ELASTICSEARCH_PASSWORD'),
+                    embedder=embedder, knn_short_dims=Config.KNN_SHORT_DIMS)
+
+    queries = load_queries(args.queries)
+    labels = load_labels(args.labels, queries)
+    # labelled queries missing from the query file, e.g. the titles of known-item labels, are searched too
+    queries += [query for query in labels if query not in queries]
+    vectors = dict(zip(queries, embedder.embed_many(queries)))
+    ks = parse_list(args.k, int)
+    fields = parse_list(args.fields, str)
+    truth = {(field, query): exact_top_k(search, args.index, field, vectors[query], max(ks))
+             for field in fields for query in queries}
+
+    print(f"{len(queries)} queries, {len(labels)} labelled, index {args.index}")
+    print(f"{'mode':<9} {'field':<22} {'k':>4} {'cands':>6} {'text':>5} {'knn':>5} {'recall':>7} {'nDCG':>6} "
+          f"{'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7}")
+    for mode in parse_list(args.modes, str):
+        boosts: List[Tuple[Optional[float], Optional[float]]] = [(None, None)]
+        if mode == 'hybrid':
+            boosts = list(itertools.product(parse_list(args.text_boosts, float), parse_list(args.knn_boosts, float)))
+        for field, k, num_candidates, (text_boost, knn_boost) in itertools.product(
+                fields, ks, parse_list(args.num_candidates, int), boosts):
+            profile: Dict[str, Any] = {'num_candidates': num_candidates}
+            if mode == 'hybrid':
+                profile.update(text_boost=text_boost, knn_boost=knn_boost)
+            search.profiles = get_search_profiles({mode: profile})
+            run(search, args.index, mode, field, k, queries[:args.warmup], vectors)
+            results, latencies = run(search, args.index, mode, field, k, queries, vectors)
+
+            recall = sum(len(set(results[query]) & set(truth[field, query][:k])) / max(1, len(truth[field, query][:k]))
+                         for query in queries) / len(queries)
+            scores = [ndcg(results[query], grades, k) for query, grades in labels.items()]
+            ndcg_text = f"{sum(scores) / len(scores):>6.3f}" if scores else f"{'-':>6}"
+            print(f"{mode:<9} {field:<22} {k:>4} {num_candidates:>6} {text_boost if text_boost is not None else '-':>5} "
+                  f"{knn_boost if knn_boost is not None else '-':>5} {recall:>7.3f} {ndcg_text} "
+                  f"{percentile(latencies, 0.5):>7.1f} {percentile(latencies, 0.95):>7.1f} {percentile(latencies, 0.99):>7.1f}")
+
+
+if __name__ == '__main__':
+    main()
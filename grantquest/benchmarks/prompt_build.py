@@ -0,0 +1,119 @@
+"""
+This script benchmarks the time spent building the snippet prompts of a result page.
+
+It compares the previous prompt construction, which re-tokenized the fixed prompt and
+every grant on each call, with the PromptTemplate used by SnippetGenerator. The template
+is measured cold (first time a page is seen) and warm (the same grants for another query,
+as for pagination or repeated searches).
+
+Usage:
+    python -m benchmarks.prompt_build --client openai --pages 50
+    python -m benchmarks.prompt_build --client ollama --model Meta-Llama-3.1-8B --grants grants.json
+"""
+
+import argparse
+import json
+import statistics
+import time
+from typing import Any, Dict, List
+from app.clients.clients import create_client
+from app.snippet_generator.snippet_generator import SnippetGenerator
+
+
+def build_prompts_uncached(generator: SnippetGenerator, query: str, datas: List[Dict[str, Any]]) -> List[List[Dict[str, str]]]:
+    """
+    Build the prompts of a page the way construct_prompt did before PromptTemplate.
+
+    Args:
+        generator (SnippetGenerator): The snippet generator.
+        query (str): The user's query.
+        datas (List[Dict[str, Any]]): The information of each grant of the page.
+
+    Returns:
+        List[List[Dict[str, str]]]: The prompts.
+    """
+    prompts = []
+    for data in datas:
+        prompt = generator.get_prompt_prefix()
+        fixed_prompt = generator.get_prompt_prefix() + generator.get_prompt_suffix()
+        fixed_tokens = sum(len(generator.client.encode(turn['content'])) for turn in fixed_prompt)
+        query_tokens = len(generator.client.encode(query))
+        max_data_tokens = generator.client.max_input_len - fixed_tokens - query_tokens - 50
+        truncated_data = generator.truncate_to_token_limit(str(data), max_data_tokens)
+        prompt.append({'role': "user", 'content': f'Query - <{query}>\nGrant - <{truncated_data}>'})
+        prompt.extend(generator.get_prompt_suffix())
+        prompts.append(prompt)
+    return prompts
+
+
+def load_grants(path: str, count: int, words: int) -> List[Dict[str, Any]]:
+    """
+    Load grant payloads from a JSON file, or generate synthetic ones.
+
+    Args:
+        path (str): A JSON file holding a list of grant `_source` dictionaries, or '' for synthetic grants.
+        count (int): The number of grants needed.
+        words (int): The length of synthetic grants in words.
+
+    Returns:
+        List[Dict[str, Any]]: The grant payloads.
+    """
+    if path:
+        with open(path) as f:
+            grants = json.load(f)
+        grants = [{'normalized_info': grant.get('normalized_info', '')} for grant in grants]
+        return (grants * (count // len(grants) + 1))[:count]
+    vocabulary = ['research', 'funding', 'opportunity', 'applicants', 'eligible', 'program', 'health',
+                  'science', 'education', 'community', 'development', 'award', 'innovation', 'data']
+    return [{'normalized_info': f'Grant {i}: ' + ' '.join(vocabulary[(i + j) % len(vocabulary)] for j in range(words))}
+            for i in range(count)]
+
+
+def time_pages(build, pages: List[List[Dict[str, Any]]]) -> List[float]:
+    timings = []
+    for page in pages:
+        start = time.perf_counter()
+        build(page)
+        timings.append(1000 * (time.perf_counter() - start))
+    return timings
+
+
+def report(name: str, timings: List[float]) -> None:
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f'{name:<24} mean {statistics.mean(timings):8.2f} ms   p50 {timings[len(timings) // 2]:8.2f} ms   p95 {p95:8.2f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark snippet prompt construction per result page.')
+    parser.add_argument('--client', default='openai', help="client type from clients.py (default: openai)")
+    parser.add_argument('--api-base', default='', help='API base URL (ollama, hf_llama, litellm)')
+    parser.add_argument('--model', default='', help='model name (ollama, hf_llama, litellm)')
+    parser.add_argument('--grants', default='', help='JSON file with a list of grant _source dictionaries')
+    parser.add_argument('--pages', type=int, default=50, help='number of result pages (default: 50)')
+    parser.add_argument('--page-size', type=int, default=10, help='grants per page (default: 10)')
+    parser.add_argument('--grant-words', type=int, default=800, help='length of synthetic grants in words (default: 800)')
+    args = parser.parse_args()
+
+    client = create_client(args.client, 'unused', args.api_base, args.model)
+    generator = SnippetGenerator(client, args.model or 'benchmark')
+    datas = load_grants(args.grants, args.pages * args.page_size, args.grant_words)
+    pages = [datas[i:i + args.page_size] for i in range(0, len(datas), args.page_size)]
+    keys = {id(data): f'{i}\x1fbenchmark' for i, data in enumerate(datas)}
+
+    def build_with_template(page: List[Dict[str, Any]], query: str) -> None:
+        for data in page:
+            generator.construct_prompt(query, data, keys[id(data)])
+
+    before = time_pages(lambda page: build_prompts_uncached(generator, 'community health research', page), pages)
+    cold = time_pages(lambda page: build_with_template(page, 'community health research'), pages)
+    warm = time_pages(lambda page: build_with_template(page, 'data science education programs'), pages)
+
+    print(f'{args.pages} pages of {args.page_size} grants, client {args.client}')
+    report('before (re-tokenizing)', before)
+    report('template, cold', cold)
+    report('template, warm', warm)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,74 @@
 class Config:
     ELASTICSEARCH_URL = 'http://localhost:9200'
     INDEX_NAME = 'distill_index'
+
+    # search backend: 'elasticsearch', 'local' to search in process a snapshot of INDEX_NAME exported with
+    # elasticsearch/export_snapshot.py into LOCAL_SEARCH_PATH (needs EMBEDDER_TYPE = 'openai'), or 'fallback'
+    # to search Elasticsearch and the snapshot when Elasticsearch fails or takes over SEARCH_FALLBACK_TIMEOUT
+    SEARCH_BACKEND = 'elasticsearch'
+    LOCAL_SEARCH_PATH = 'instance/snapshots'
+    LOCAL_SEARCH_IVF_LISTS = 0  # IVF partitions for approximate search (e.g. 4 * sqrt(documents)); 0 for exact search
+    LOCAL_SEARCH_IVF_PROBES = 8  # partitions searched per query
+    SEARCH_FALLBACK_TIMEOUT = 2.0  # seconds
+    SEARCH_FALLBACK_COOLDOWN = 30.0  # seconds during which Elasticsearch is skipped after a failure
+
     CLIENT_TYPE = 'openai'
     MODEL = 'gpt-4o-mini'
-    
+
+    # snippet cache: 'lru' (in-process), 'sqlite' (on-disk, survives restarts) or 'none'
+    SNIPPET_CACHE_TYPE = 'lru'
+    SNIPPET_CACHE_SIZE = 10000
+    SNIPPET_CACHE_TTL = 7 * 24 * 3600  # seconds
+    SNIPPET_CACHE_PATH = 'instance/snippet_cache.sqlite3'
+
+    # stream search results: render hits first, then push snippets as they finish
+    STREAM_SNIPPETS = True
+
+    # JSON batch search (POST /api/search): queries and hits per query accepted, queries accepted when the
+    # snippets are returned, and the dispatcher queue depth above which the snippets of a batch are not
+    # generated in the background
+    BATCH_MAX_QUERIES = 500
+    BATCH_MAX_SIZE = 100
+    BATCH_MAX_GENERATE_QUERIES = 20
+    BATCH_MAX_QUEUE_DEPTH = 1000
+
+    # shared LLM dispatcher: global in-flight cap, provider rate limits and per-request deadline
+    LLM_MAX_IN_FLIGHT = 32
+    LLM_REQUESTS_PER_MINUTE = 500
+    LLM_TOKENS_PER_MINUTE = 200000
+    SNIPPET_DEADLINE = 15  # seconds; snippets not ready by then are returned empty
+    SNIPPET_BATCH_SIZE = 5  # grants packed into one LLM call (shrunk to fit the token limits); 1 disables batching
+
+    # query embeddings: 'openai' (computed and cached in the app) or 'none' (Elasticsearch inference endpoint)
+    EMBEDDER_TYPE = 'openai'
+    EMBEDDING_MODEL = 'text-embedding-3-small'  # must match the model of the inference endpoint used at indexing
+    EMBEDDING_DIMENSIONS = None
+    QUERY_EMBEDDING_CACHE_SIZE = 10000
+    QUERY_EMBEDDING_CACHE_TTL = 24 * 3600  # seconds
+    QUERY_EMBEDDING_STORE_PATH = ''  # optional SQLite store shared across restarts; empty to disable
+
+    # pagination: the first search keeps the top SEARCH_WINDOW candidates for later pages
+    SEARCH_SESSION_CACHE = True
+    SEARCH_WINDOW = 50
+    SEARCH_SESSION_CACHE_SIZE = 1000
+    SEARCH_SESSION_TTL = 600  # seconds
+    PREFETCH_SNIPPETS = True  # generate next-page snippets in the background
+    PREFETCH_MAX_QUEUE_DEPTH = 0  # only prefetch while no more LLM calls than this are queued
+
+    # semantic search on quantized vectors (int8_hnsw, int4_hnsw, bbq_hnsw): retrieve KNN_OVERSAMPLE times more
+    # candidates and rescore them with the float vectors: 'none', 'native' (Elasticsearch 8.18+) or 'script'
+    KNN_OVERSAMPLE = 1.0
+    KNN_RESCORE = 'none'
+    # two-stage kNN on an index with shortened vectors in '{field}_short' (sync.py --dimensions N --two-stage):
+    # N, the candidates (KNN_OVERSAMPLE times the hits) are rescored with the full vectors; None for single-stage
+    # (an index with shortened vectors only needs EMBEDDING_DIMENSIONS = N)
+    KNN_SHORT_DIMS = None
+
+    # kNN candidates and boosts of each search mode, overriding DEFAULT_SEARCH_PROFILES of app/search/search.py;
+    # measure the recall, nDCG and latency of other values on the index with benchmarks/knn_sweep.py.
+    # 'rrf' fuses the top rank_window hits of a kNN and a full-text search (see benchmarks/hybrid_rrf.py)
+    SEARCH_PROFILES = {
+        'semantic': {'num_candidates': 30},
+        'hybrid': {'num_candidates': 50, 'text_boost': 0.2, 'knn_boost': 0.9},
+        'rrf': {'rank_window': 50, 'rank_constant': 60},
+    }